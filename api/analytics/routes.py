@@ -0,0 +1,110 @@
+from datetime import date, datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from bot.database.engine import get_async_session
+from bot.database.querybudget import budget
+from bot.database.repository import (
+    get_sales_by_day, get_sales_by_status, get_sales_by_product, check_sales_rollup,
+)
+from bot.database.projections import SalesRow
+from bot.database.catalog import catalog
+from .schemas import SalesReport, SalesCheck
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Аналитика 📈"],
+)
+
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 3660
+
+_COUNTERS = ("orders", "paid_orders", "bottles", "revenue_cents", "paid_revenue_cents")
+
+
+def _totals(row: SalesRow) -> dict:
+    d = {f: getattr(row, f) for f in _COUNTERS}
+    d["unpaid_orders"] = row.unpaid_orders
+    return d
+
+
+def _date_range(date_from: Optional[date], date_to: Optional[date]) -> tuple[date, date]:
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from позже date_to")
+    if (date_to - date_from).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период больше {MAX_RANGE_DAYS} дней")
+    return date_from, date_to
+
+
+# @budget(n) — максимум SQL-запросов на вызов роута (с каталогом)
+
+@router.get("/sales", response_model=SalesReport)
+@budget(4)
+async def sales_report(
+    db: AsyncSession = Depends(get_async_session),
+    date_from: Optional[date] = Query(None, description="Первый день периода (UTC), по умолчанию — 30 дней назад"),
+    date_to: Optional[date] = Query(None, description="Последний день периода включительно (UTC), по умолчанию — сегодня"),
+):
+    """
+    Продажи за период: итоги, по дням, по статусам и по товарам.
+    Читает дневную сводку sales_daily (она ведётся вместе с заказами), а не
+    агрегирует заказы — время не зависит от их числа.
+    """
+    date_from, date_to = _date_range(date_from, date_to)
+    by_day = await get_sales_by_day(db, date_from, date_to)
+    by_status = await get_sales_by_status(db, date_from, date_to)
+    by_product = await get_sales_by_product(db, date_from, date_to)
+    snap = await catalog.get(db)
+
+    totals = SalesRow(None, *(sum(getattr(r, f) for r in by_status) for f in _COUNTERS))
+    return ORJSONResponse({
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": _totals(totals),
+        "by_day": [{"day": r.key, **_totals(r)} for r in by_day],
+        "by_status": [{"status": r.key, **_totals(r)} for r in by_status],
+        "by_product": [
+            {"product_id": r.key, "name": p.name if (p := snap.by_id.get(r.key)) else None, **_totals(r)}
+            for r in by_product
+        ],
+    })
+
+
+def _sales_check_body(mismatches: list, fixed: bool) -> ORJSONResponse:
+    return ORJSONResponse({
+        "ok": not mismatches,
+        "fixed": fixed,
+        "mismatches": [
+            {"day": day, "product_id": product_id, "status": status, "is_paid": is_paid,
+             "stored": list(stored), "actual": list(actual)}
+            for (day, product_id, status, is_paid), stored, actual in mismatches
+        ],
+    })
+
+
+@router.get("/sales/check", response_model=SalesCheck)
+@budget(1)
+async def sales_check(db: AsyncSession = Depends(get_async_session)):
+    """
+    Сверка сводки sales_daily с агрегатом по orders / order_items, только чтение.
+    Полный проход по заказам — для обслуживания, не для отчётов.
+    Исправить расхождения — POST /analytics/sales/check.
+    """
+    mismatches = await check_sales_rollup(db)
+    return _sales_check_body(mismatches, fixed=False)
+
+
+@router.post("/sales/check", response_model=SalesCheck)
+@budget(2)
+async def sales_fix(db: AsyncSession = Depends(get_async_session)):
+    """
+    Сверка, как у GET, и исправление расхождений: строки sales_daily сдвигаются
+    к фактическим значениям по заказам.
+    """
+    mismatches = await check_sales_rollup(db, fix=True)
+    return _sales_check_body(mismatches, fixed=bool(mismatches))
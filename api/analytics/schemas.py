@@ -0,0 +1,44 @@
+from datetime import date
+from pydantic import BaseModel
+from typing import List, Optional
+
+from ..orders.schemas import OrderStatus
+
+class SalesTotals(BaseModel):
+    orders: int
+    paid_orders: int
+    unpaid_orders: int
+    bottles: int
+    revenue_cents: int            # все заказы периода
+    paid_revenue_cents: int       # только оплаченные
+
+class SalesDay(SalesTotals):
+    day: date                     # UTC
+
+class SalesByStatus(SalesTotals):
+    status: OrderStatus
+
+class SalesByProduct(SalesTotals):
+    product_id: int
+    name: Optional[str] = None    # None — товар удалён из каталога
+
+class SalesReport(BaseModel):
+    date_from: date
+    date_to: date
+    totals: SalesTotals
+    by_day: List[SalesDay]
+    by_status: List[SalesByStatus]
+    by_product: List[SalesByProduct]
+
+class SalesMismatch(BaseModel):
+    day: date
+    product_id: int               # 0 — заказ целиком
+    status: OrderStatus
+    is_paid: bool
+    stored: List[int]             # [orders, bottles, revenue_cents] в сводке
+    actual: List[int]             # ... по заказам
+
+class SalesCheck(BaseModel):
+    ok: bool
+    fixed: bool
+    mismatches: List[SalesMismatch]
@@ -1,11 +1,59 @@
 # backend/app.py
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from bot.database.engine import engine, listen_engine, pool_stats
+from bot import metrics
+from bot.database import querybudget
+from bot.database.notify import listener, CATALOG_CHANNEL
+from bot.database.catalog import catalog
+from bot.database.pricing import pricing, PRICING_CHANNEL
+from bot.database.usercache import user_cache, USER_CHANNEL
+from bot.database.ordercache import order_cache, ORDERS_CHANNEL
 from .users.routes import router as users_router
 from .orders.routes import router as orders_router
 from .products.routes import router as products_router
-app = FastAPI()
+from .analytics.routes import router as analytics_router
+from .utils import telegram
+from .compression import CompressionMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # каталог и ценовые уровни меняет и бот — узнаём об этом через NOTIFY
+    listener.subscribe(CATALOG_CHANNEL, catalog.invalidate)
+    listener.subscribe(PRICING_CHANNEL, pricing.invalidate)
+    listener.subscribe(USER_CHANNEL, user_cache.invalidate)
+    # история заказов клиента: заказы пишут и другие воркеры, и бот; в ответе — и профиль клиента
+    listener.subscribe(ORDERS_CHANNEL, order_cache.invalidate)
+    listener.subscribe(USER_CHANNEL, order_cache.invalidate)
+    await listener.start(listen_engine)
+    await telegram.start()
+    try:
+        yield
+    finally:
+        await telegram.close()
+        await listener.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# сжатие — внутри метрик: время сжатия входит в латентность маршрута
+app.add_middleware(CompressionMiddleware)
+
+# латентность по маршрутам и SQL на запрос; CORS добавляется позже и оборачивает снаружи
+metrics.instrument_engine(engine, source="api")
+metrics.instrument_cache("catalog", catalog.stats)
+metrics.instrument_cache("pricing", pricing.stats)
+metrics.instrument_cache("users", user_cache.stats)
+metrics.instrument_cache("order_history", order_cache.stats)
+app.add_middleware(metrics.MetricsMiddleware)
+if querybudget.enabled():
+    # QUERY_BUDGET=warn|raise: журнал SQL на запрос, N+1 — в лог
+    app.add_middleware(querybudget.QueryBudgetMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,9 +64,28 @@ app.add_middleware(
 )
 
 
+@app.get("/internal/telegram/stats", tags=["internal"])
+async def telegram_stats():
+    """Отправки в Telegram: счётчики, задержки, пропускная способность."""
+    return telegram.stats()
+
+
+@app.get("/internal/db/pool", tags=["internal"])
+async def db_pool_stats():
+    """Пул соединений с БД: профиль, занятые/свободные, overflow, ожидание соединения."""
+    return pool_stats()
+
+
+@app.get("/metrics", tags=["internal"], include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 app.include_router(users_router)
 app.include_router(orders_router)
 app.include_router(products_router)
+app.include_router(analytics_router)
 
 if __name__ == "__main__":
     import uvicorn
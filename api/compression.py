@@ -0,0 +1,131 @@
+# api/compression.py
+"""
+Сжатие ответов API: br, если установлен пакет brotli и клиент его принимает,
+иначе gzip. Сжимаются только JSON / NDJSON / текст и только тела от
+minimum_size байт: маленький ответ сжатие не уменьшит, а время потратит.
+
+Потоковые ответы (StreamingResponse, NDJSON-выгрузка) сжимаются по кускам:
+каждый кусок сразу уходит клиенту (flush), память не растёт.
+
+brotli — необязательная зависимость (pip install brotli): без неё — только gzip.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:     # нет пакета — только gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("API_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("API_GZIP_LEVEL", "6"))
+# 4–5: почти как gzip -6 по скорости, заметно плотнее
+BROTLI_QUALITY = int(os.getenv("API_BROTLI_QUALITY", "4"))
+
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br / gzip / None по Accept-Encoding (q=0 — запрет)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)     # 31 — gzip-обёртка
+
+    def chunk(self, data: bytes) -> bytes:
+        """Кусок потока — со сбросом, чтобы клиент получил его сразу."""
+        if self._br is not None:
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._br is not None:
+            return self._br.process(data) + self._br.finish()
+        return self._gz.compress(data) + self._gz.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # заголовки решаются по первому куску тела
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                small = not more and len(body) < self.minimum_size
+                if ("content-encoding" in headers or small
+                        or not content_type.startswith(_COMPRESSIBLE)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            data = compressor.chunk(body) if more else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,47 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Optional
-
-from sqlalchemy.orm import selectinload
+from datetime import datetime, timezone
 
-from bot.database.engine import get_async_session
-from bot.database.repository import get_user_by_telegram_id, get_total_bottles_by_user
-from bot.database.models import Order, OrderItem, Product, User
-from .schemas import OrderCreate, OrderRead, OrderCount,  OrderStatus, OrderUpdateAdmin
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from bot.database.engine import get_async_session, AsyncSessionLocal
+from bot.database.querybudget import budget
+from bot.database.repository import (
+    get_total_bottles_by_user, update_order,
+    get_orders_keyset, get_users_with_paid_bottles, bulk_insert_orders,
+    apply_paid_bottles_deltas, get_user_by_telegram_id, get_paid_bottles, insert_order_returning,
+    load_orders, get_order_row, OrderLoad, stream_orders,
+    search_orders, contains_pattern, SEARCH_MIN_LENGTH,
+)
+from ..utils import set_page_headers, new_order_text, notify_admins_new_order
+from ..serialize import (
+    orders_payload, orders_body, order_payload, ndjson_lines,
+    compact_payload, select_fields, parse_fields,
+)
+from bot.database.models import Order
+from bot.database.catalog import catalog
+from bot.database.pricing import pricing
+from bot.database.ordercache import order_cache
+from .schemas import (
+    OrderCreate, OrderRead, OrderCount,  OrderStatus, OrderUpdateAdmin,
+    OrderBatchCreate, OrderBatchResult, OrderBatchItemResult, OrderSearchHit,
+    OrderQuoteRequest, OrderQuote, PricingRead, OrderListFormat, OrdersCompact,
+)
 
 router = APIRouter(
     prefix="/orders",
     tags=["Заказы 🚚"],
 )
 
-# --- Ценовые уровни (накопительный эффект) ---
-PRICING_TIERS = [
-    (1, 19, 250),      # 👈 базовый уровень
-    (20, 99, 250),
-    (100, 499, 240),
-    (500, 999, 220),
-    (1000, 1999, 200),
-    (2000, float('inf'), 180),
-]
-
-def get_price_by_total(total_bottles: int) -> int:
-    for min_val, max_val, price in PRICING_TIERS:
-        if min_val <= total_bottles <= max_val:
-            return price
-    return PRICING_TIERS[-1][2]
+# Ценовые уровни (накопительный эффект) — в таблице price_tiers,
+# снимок в памяти: bot/database/pricing.py
+
+class ListShape(NamedTuple):
+    compact: bool
+    fields: Optional[Tuple[str, ...]]       # None — все поля
+
+
+def list_shape(
+    fmt: OrderListFormat = Query(
+        OrderListFormat.full, alias="format",
+        description="compact — заказы со ссылками user_id / product_id и таблицы users / products",
+    ),
+    fields: Optional[str] = Query(
+        None, description="Только эти поля заказа, через запятую (id — всегда): status,date,total_price_cents",
+    ),
+) -> ListShape:
+    """Форма списка заказов: ?format=compact и/или ?fields=... (по умолчанию — полный OrderRead)."""
+    compact = fmt == OrderListFormat.compact
+    try:
+        return ListShape(compact, parse_fields(fields, compact))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _json(body: bytes) -> Response:
+    return Response(body, media_type="application/json")
+
 
 # --- Роуты ---
+# @budget(n) — максимум SQL-запросов на вызов роута (с каталогом; тело StreamingResponse не входит)
 
 @router.get("/users/bottles/{telegram_id}", response_model=OrderCount)
+@budget(1)
 async def get_user_bottle_count(telegram_id: int, db: AsyncSession = Depends(get_async_session)):
     if telegram_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid user ID")
     total_bottles = await get_total_bottles_by_user(db, telegram_id)
-    # вариант с алиасом
-    return OrderCount(user_id=telegram_id, total_bottles=total_bottles).model_dump(by_alias=True)
+    # форма OrderCount с алиасом (telegram_id), без повторной валидации
+    return ORJSONResponse({"telegram_id": telegram_id, "total_bottles": total_bottles})
 
-@router.get("/users/{telegram_id}", response_model=List[OrderRead])
+@router.get("/users/{telegram_id}", response_model=Union[List[OrderRead], OrdersCompact])
+@budget(4)
 async def get_user_orders(
     telegram_id: int,
     db: AsyncSession = Depends(get_async_session),
@@ -54,63 +89,67 @@ async def get_user_orders(
     limit: Optional[int] = Query(
         None, ge=1, le=1000, description="Максимум заказов (1–1000)"
     ),
-
+    shape: ListShape = Depends(list_shape),
 ):
-    """Получить заказы пользователя с фильтрами по адресу/номеру и статусу"""
+    """
+    Получить заказы пользователя с фильтрами по адресу/номеру и статусу.
+    Mini App опрашивает роут постоянно: готовое тело ответа кэшируется по
+    (telegram_id, фильтры) до первой записи заказов клиента (ordercache.py).
+    """
     if telegram_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
-    stmt = (
-        select(Order)
-        .where(Order.telegram_id == telegram_id)
-        .options(
-            selectinload(Order.user),
-            selectinload(Order.items).selectinload(OrderItem.product),
-        )
-    )
-    # title: число -> поиск по Order.id; иначе ILIKE по адресу
+    key = (telegram_id, title.strip() if title else None, status, limit, shape)
+    snap = await catalog.get(db)
+    body = order_cache.get(db, key, snap.etag)
+    if body is not None:
+        return _json(body)
+    # версия — до чтения: заказ, записанный во время него, не даст закэшировать старое
+    version = order_cache.version(telegram_id)
+
+    criteria = [Order.telegram_id == telegram_id]
+    # title: число -> поиск по Order.id; иначе ILIKE по адресу (триграммный индекс)
     if title:
         t = title.strip()
         if t.isdigit():
-            stmt = stmt.where(Order.id == int(t))
+            criteria.append(Order.id == int(t))
         else:
-            stmt = stmt.where(Order.address.ilike(f"%{t}%"))
+            criteria.append(Order.address.ilike(contains_pattern(t)))
 
     if status is not None:
-        stmt = stmt.where(Order.status == status)
-
-    stmt = stmt.order_by(Order.date.desc())
+        criteria.append(Order.status == status)
 
-
-    if limit:
-        stmt = stmt.limit(limit)
-
-    result = await db.execute(stmt)
-    return result.scalars().all()
+    # заказы, позиции и пользователь — три запроса; товары — из снимка каталога
+    orders, users = await load_orders(db, *criteria, limit=limit, load=OrderLoad.full)
+    body = orders_body(orders, users, snap, shape.compact, shape.fields)
+    order_cache.put(key, version, body, snap.etag)
+    return _json(body)
 
 
 @router.post("/", response_model=OrderRead)
-async def create_order(payload: OrderCreate, db: AsyncSession = Depends(get_async_session)):
-    """Создать заказ"""
+@budget(5)
+async def create_order(
+    payload: OrderCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Создать заказ.
+    Запросы: пользователь — из кэша (usercache.py), счётчик бутылок — SELECT по PK,
+    товары и цены — из снимков каталога и ценовых уровней, заказ + позиции одним
+    INSERT (цепочка CTE), COMMIT. Без refresh и повторных select.
+    Сумму для total_price_cents клиент берёт из POST /orders/quote.
+    """
     user = await get_user_by_telegram_id(db, payload.telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    # прошлые бутылки (только оплаченные) — из накопительного счётчика
+    past_total = await get_paid_bottles(db, user.id)
 
-    # прошлые бутылки (только оплаченные)
-    result = await db.execute(
-        select(func.sum(OrderItem.quantity))
-        .join(Order)
-        .where((Order.user_id == user.id) & (Order.is_paid == True))
-    )
-    past_total = result.scalar() or 0
-
-    # новые бутылки
-    current_total = sum(item.quantity for item in payload.items)
-    new_total = past_total + current_total
-
-    # цена за 1 по накопительной системе
-    price_per_bottle = get_price_by_total(new_total)
-    calculated_total = price_per_bottle * current_total
+    # цена за 1 по накопительной системе (с новыми бутылками)
+    quote = (await pricing.get(db)).quote(past_total, ((it.product_id, it.quantity) for it in payload.items))
+    price_per_bottle = quote.unit_price_cents
+    calculated_total = quote.total_price_cents
 
     if payload.total_price_cents != calculated_total:
         raise HTTPException(
@@ -118,62 +157,285 @@ async def create_order(payload: OrderCreate, db: AsyncSession = Depends(get_asyn
             detail=f"Сумма не совпадает! Ожидалось {calculated_total}, получено {payload.total_price_cents}"
         )
 
-    # Проверка продуктов
+    # Проверка продуктов — по снимку каталога, без запроса в БД
     product_ids = {i.product_id for i in payload.items}
-    result = await db.execute(select(Product).where(Product.id.in_(product_ids)))
-    products = result.scalars().all()
-    map_products = {p.id: p for p in products}
+    snap = await catalog.get(db)
 
-    missing = product_ids - set(map_products.keys())
+    missing = product_ids - snap.by_id.keys()
     if missing:
         raise HTTPException(status_code=404, detail=f"Products not found: {sorted(missing)}")
 
-    # Создание заказа
-    order = Order(
+    # Создание заказа + позиций (+ счётчик бутылок, если оплачен)
+    order = await insert_order_returning(
+        db,
         user_id=user.id,
         telegram_id=payload.telegram_id,
         address=payload.address,
         phone=payload.phone,
+        items=[(it.product_id, it.quantity) for it in payload.items],
+        unit_price_cents=price_per_bottle,
         is_paid=payload.is_paid,
-        total_price_cents=calculated_total,
         status=OrderStatus.processing,   # 👈 новый статус по умолчанию
     )
+    await db.commit()
+
+    out = order_payload(order, user, snap)
+    # уведомление админам — после ответа клиенту
+    background_tasks.add_task(notify_admins_new_order, order.id, new_order_text(out))
+    return ORJSONResponse(out)
 
-    # Позиции заказа
-    order.items = [
-        OrderItem(
-            product_id=it.product_id,
-            quantity=it.quantity,
-            unit_price_cents=price_per_bottle,
-            line_total_cents=price_per_bottle * it.quantity,
-        )
-        for it in payload.items
-    ]
 
-    db.add(order)
+@router.post("/batch", response_model=OrderBatchResult)
+@budget(7)
+async def create_orders_batch(payload: OrderBatchCreate, db: AsyncSession = Depends(get_async_session)):
+    """
+    Пакетное создание заказов (оптовики, импорт).
+    Пользователи — одним IN-запросом, товары — из снимка каталога, цены считаются
+    в памяти, заказы и позиции вставляются многострочными INSERT в одной транзакции.
+    Невалидные заказы не вставляются и возвращаются с ошибкой, остальные создаются.
+    """
+    users = await get_users_with_paid_bottles(db, (o.telegram_id for o in payload.orders))
+    snap = await catalog.get(db)
+    prices = await pricing.get(db)
+
+    # накопленные оплаченные бутылки; оплаченные заказы пакета учитываются
+    # для следующих заказов того же пользователя — как при поштучном создании
+    running_paid = {tg: paid for tg, (_, paid) in users.items()}
+    paid_deltas: dict[int, int] = {}
+    results: List[OrderBatchItemResult] = []
+    order_rows, item_rows, accepted = [], [], []
+
+    for index, o in enumerate(payload.orders):
+        user = users.get(o.telegram_id)
+        if user is None:
+            results.append(OrderBatchItemResult(index=index, ok=False, error="User not found"))
+            continue
+        user_id = user[0]
+
+        quote = prices.quote(running_paid[o.telegram_id], ((it.product_id, it.quantity) for it in o.items))
+        price_per_bottle = quote.unit_price_cents
+        calculated_total = quote.total_price_cents
+        if o.total_price_cents != calculated_total:
+            results.append(OrderBatchItemResult(
+                index=index, ok=False,
+                error=f"Сумма не совпадает! Ожидалось {calculated_total}, получено {o.total_price_cents}",
+            ))
+            continue
+
+        missing = {it.product_id for it in o.items} - snap.by_id.keys()
+        if missing:
+            results.append(OrderBatchItemResult(
+                index=index, ok=False, error=f"Products not found: {sorted(missing)}",
+            ))
+            continue
+
+        if o.is_paid:
+            running_paid[o.telegram_id] += quote.bottles
+            paid_deltas[user_id] = paid_deltas.get(user_id, 0) + quote.bottles
+
+        order_rows.append({
+            "user_id": user_id,
+            "telegram_id": o.telegram_id,
+            "address": o.address,
+            "phone": o.phone,
+            "is_paid": o.is_paid,
+            "total_price_cents": calculated_total,
+            "status": OrderStatus.processing,
+        })
+        item_rows.append([
+            {
+                "product_id": it.product_id,
+                "quantity": it.quantity,
+                "unit_price_cents": price_per_bottle,
+                "line_total_cents": price_per_bottle * it.quantity,
+            }
+            for it in o.items
+        ])
+        accepted.append((index, calculated_total))
+
+    created = await bulk_insert_orders(db, order_rows, item_rows)
+    await apply_paid_bottles_deltas(db, paid_deltas)
     await db.commit()
-    await db.refresh(order)
-    return order
+
+    for (index, total), (order_id, _) in zip(accepted, created):
+        results.append(OrderBatchItemResult(
+            index=index, ok=True, order_id=order_id, total_price_cents=total,
+        ))
+    results.sort(key=lambda r: r.index)
+    return ORJSONResponse(OrderBatchResult(
+        created=len(created), failed=len(results) - len(created), results=results,
+    ).model_dump())
 
 
-@router.get("/", response_model=List[OrderRead])
-async def list_orders(db: AsyncSession = Depends(get_async_session)):
-    """Список всех заказов (для админа)"""
-    result = await db.execute(select(Order).order_by(Order.date.desc()))
-    return result.scalars().all()
+def _tier_out(tier) -> dict:
+    return {"min_bottles": tier.min_bottles, "price_cents": tier.price_cents}
+
+
+@router.get("/pricing", response_model=PricingRead)
+@budget(1)
+async def get_pricing(db: AsyncSession = Depends(get_async_session)):
+    """Ценовые уровни накопительной системы — для экранов Mini App (цены считает POST /orders/quote)."""
+    prices = await pricing.get(db)
+    return ORJSONResponse({"version": prices.version, "tiers": [_tier_out(t) for t in prices.tiers]})
+
+
+@router.post("/quote", response_model=OrderQuote)
+@budget(4)
+async def quote_order(payload: OrderQuoteRequest, db: AsyncSession = Depends(get_async_session)):
+    """
+    Расчёт заказа без записи: цена за бутылку по накопительной системе, суммы позиций и итог.
+    total_price_cents из ответа POST /orders/ примет как есть (пока уровни и оплаты не менялись).
+    Запросы: пользователь — из кэша, счётчик бутылок — SELECT по PK, каталог и уровни — из снимков.
+    """
+    user = await get_user_by_telegram_id(db, payload.telegram_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    snap = await catalog.get(db)
+    missing = {i.product_id for i in payload.items} - snap.by_id.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found: {sorted(missing)}")
+
+    prices = await pricing.get(db)
+    quote = prices.quote(
+        await get_paid_bottles(db, user.id), ((it.product_id, it.quantity) for it in payload.items)
+    )
+    return ORJSONResponse({
+        "telegram_id": payload.telegram_id,
+        "past_bottles": quote.past_bottles,
+        "bottles": quote.bottles,
+        "total_bottles": quote.total_bottles,
+        "unit_price_cents": quote.unit_price_cents,
+        "lines": [
+            {**line._asdict(), "name": snap.name_of(line.product_id)} for line in quote.lines
+        ],
+        "total_price_cents": quote.total_price_cents,
+        "next_tier": _tier_out(quote.next_tier) if quote.next_tier else None,
+        "pricing_version": prices.version,
+    })
+
+
+STREAM_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    # orders.date — naive UTC (datetime.utcnow)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+async def _ndjson_orders(criteria: list, fields: Optional[Tuple[str, ...]] = None):
+    """
+    NDJSON-поток заказов. Своя сессия: зависимость get_async_session закрывается
+    до того, как начнёт отдаваться тело StreamingResponse.
+    """
+    async with AsyncSessionLocal() as db:
+        snap = await catalog.get(db)
+        async for orders, users in stream_orders(db, *criteria, batch_size=STREAM_BATCH_SIZE):
+            yield ndjson_lines(select_fields(orders_payload(orders, users, snap), fields))
+
+
+@router.get("/", response_model=Union[List[OrderRead], OrdersCompact])
+@budget(6)
+async def list_orders(
+    db: AsyncSession = Depends(get_async_session),
+    limit: Optional[int] = Query(
+        None, ge=1, le=500, description=f"Размер страницы (1–500, по умолчанию {DEFAULT_PAGE_SIZE})"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из заголовка X-Next-Cursor / X-Prev-Cursor"
+    ),
+    status: Optional[OrderStatus] = Query(
+        None, description="Статус: processing | in_transit | declined | completed"
+    ),
+    is_paid: Optional[bool] = Query(None, description="Только оплаченные / неоплаченные"),
+    telegram_id: Optional[int] = Query(None, description="Заказы одного клиента"),
+    date_from: Optional[datetime] = Query(None, description="Дата заказа не раньше"),
+    date_to: Optional[datetime] = Query(None, description="Дата заказа раньше"),
+    stream: bool = Query(
+        False, description="Все подходящие заказы NDJSON-потоком (application/x-ndjson), без limit/cursor"
+    ),
+    shape: ListShape = Depends(list_shape),
+):
+    """
+    Список заказов (для админа) с фильтрами.
+    Всегда keyset-страница по (date, id), без limit — DEFAULT_PAGE_SIZE заказов;
+    курсоры и total в заголовках. Все заказы разом — только stream=true:
+    выгрузка NDJSON (по заказу на строку) через серверный курсор:
+    память постоянна при любом размере таблицы.
+    format=compact — пользователи и товары один раз, в таблицах рядом со списком.
+    """
+    criteria = []
+    if status is not None:
+        criteria.append(Order.status == status)
+    if is_paid is not None:
+        criteria.append(Order.is_paid == is_paid)
+    if telegram_id is not None:
+        criteria.append(Order.telegram_id == telegram_id)
+    if date_from is not None:
+        criteria.append(Order.date >= _naive_utc(date_from))
+    if date_to is not None:
+        criteria.append(Order.date < _naive_utc(date_to))
+
+    if stream:
+        if limit is not None or cursor is not None:
+            raise HTTPException(status_code=400, detail="stream does not support limit/cursor")
+        if shape.compact:
+            raise HTTPException(status_code=400, detail="stream does not support format=compact")
+        return StreamingResponse(_ndjson_orders(criteria, shape.fields), media_type="application/x-ndjson")
+
+    try:
+        page, users = await get_orders_keyset(
+            db, limit=limit or DEFAULT_PAGE_SIZE, cursor=cursor, load=OrderLoad.full, criteria=criteria,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    out = _json(orders_body(page.items, users, await catalog.get(db), shape.compact, shape.fields))
+    set_page_headers(out, page)
+    return out
+
+
+@router.get("/search", response_model=Union[List[OrderSearchHit], OrdersCompact])
+@budget(4)
+async def search_orders_admin(
+    q: str = Query(..., min_length=1, max_length=200, description="Номер заказа, часть адреса или телефона"),
+    telegram_id: Optional[int] = Query(None, description="Только заказы этого клиента"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_session),
+    shape: ListShape = Depends(list_shape),
+):
+    """
+    Поиск заказов (для админа) по номеру, адресу и телефону — по убыванию релевантности.
+    Адрес и телефон ищутся по триграммному индексу: подстрока и опечатки в адресе.
+    rank есть у каждого заказа и в компактном формате.
+    """
+    q = q.strip()
+    if not q.isdigit() and len(q) < SEARCH_MIN_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Запрос короче {SEARCH_MIN_LENGTH} символов")
+    hits, users = await search_orders(db, q, limit=limit, telegram_id=telegram_id)
+    orders, snap = [o for o, _ in hits], await catalog.get(db)
+    if shape.compact:
+        payload = compact_payload(orders, users, snap, shape.fields)
+        listed = payload["orders"]
+    else:
+        payload = listed = orders_payload(orders, users, snap)
+    for d, (_, rank) in zip(listed, hits):
+        d["rank"] = rank
+    return ORJSONResponse(payload if shape.compact else select_fields(payload, shape.fields))
 
 
 @router.get("/{order_id}", response_model=OrderRead)
+@budget(4)
 async def get_order(order_id: int, db: AsyncSession = Depends(get_async_session)):
     """Получить один заказ"""
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
+    order, user = await get_order_row(db, order_id, load=OrderLoad.full)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return ORJSONResponse(order_payload(order, user, await catalog.get(db)))
 
 
 @router.patch("/{order_id}", response_model=OrderRead)
+@budget(6)
 async def admin_update_order(
     order_id: int,
     payload: OrderUpdateAdmin,
@@ -182,16 +444,13 @@ async def admin_update_order(
     """
     Админский апдейт заказа: можно менять статус и ключ is_paid
     """
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
+    order, user = await update_order(
+        db, order_id,
+        status=payload.status.value if payload.status is not None else None,
+        is_paid=payload.is_paid,
+        load=OrderLoad.full,
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-
-    if payload.status is not None:
-        order.status = payload.status
-    if payload.is_paid is not None:
-        order.is_paid = payload.is_paid
-
     await db.commit()
-    await db.refresh(order)
-    return order
\ No newline at end of file
+    return ORJSONResponse(order_payload(order, user, await catalog.get(db)))
\ No newline at end of file
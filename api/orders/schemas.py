@@ -28,9 +28,54 @@ class OrderCreate(BaseModel):
     address: str
     phone: str
     is_paid: bool = False
-    items: List[OrderItemCreate]
+    items: List[OrderItemCreate] = Field(..., min_length=1)
     total_price_cents: int
 
+class OrderQuoteRequest(BaseModel):
+    telegram_id: int
+    items: List[OrderItemCreate] = Field(..., min_length=1)
+
+class PriceTierRead(BaseModel):
+    min_bottles: int           # уровень действует от стольких накопленных бутылок
+    price_cents: int
+
+class PricingRead(BaseModel):
+    version: str               # меняется при каждой правке уровней
+    tiers: List[PriceTierRead]
+
+class OrderQuoteLine(BaseModel):
+    product_id: int
+    name: str
+    quantity: int
+    unit_price_cents: int
+    line_total_cents: int
+
+class OrderQuote(BaseModel):
+    telegram_id: int
+    past_bottles: int          # оплачено раньше
+    bottles: int               # в этом заказе
+    total_bottles: int
+    unit_price_cents: int
+    lines: List[OrderQuoteLine]
+    total_price_cents: int     # отправить в POST /orders/ как есть
+    next_tier: Optional[PriceTierRead] = None
+    pricing_version: str
+
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=1000)
+
+class OrderBatchItemResult(BaseModel):
+    index: int                 # позиция заказа во входном списке
+    ok: bool
+    order_id: Optional[int] = None
+    total_price_cents: Optional[int] = None
+    error: Optional[str] = None
+
+class OrderBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBatchItemResult]
+
 class ProductRead(BaseModel):
     id: int
     name: str
@@ -71,4 +116,35 @@ class OrderRead(BaseModel):
     date: datetime             # ← тоже datetime
     user: UserRead
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+class OrderSearchHit(OrderRead):
+    rank: float                # релевантность: 1+ — совпал номер заказа
+
+class OrderListFormat(str, Enum):
+    full = "full"              # OrderRead: пользователь и товары внутри каждого заказа
+    compact = "compact"        # OrdersCompact: ссылки user_id / product_id + таблицы
+
+class OrderItemCompact(BaseModel):
+    id: int
+    product_id: int            # → OrdersCompact.products
+    quantity: int
+    unit_price_cents: int
+    line_total_cents: int
+
+class OrderCompact(BaseModel):
+    id: int
+    telegram_id: int
+    user_id: int               # → OrdersCompact.users
+    address: str
+    phone: str
+    is_paid: bool
+    total_price_cents: int
+    items: List[OrderItemCompact]
+    status: OrderStatus
+    date: datetime
+
+class OrdersCompact(BaseModel):
+    # с fields= у заказов только запрошенные поля (и id)
+    orders: List[OrderCompact]
+    users: List[UserRead]      # только упомянутые в orders
+    products: List[ProductRead]
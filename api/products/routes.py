@@ -1,9 +1,9 @@
 # routes/products.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
-from bot.database.models import Product
+from bot.database.catalog import catalog
+from ..serialize import product_dicts
 from bot.database.engine import get_async_session  # твоя зависимость для БД
 
 router = APIRouter(
@@ -12,31 +12,50 @@ router = APIRouter(
 )
 
 
+def _product_out(p) -> dict:
+    return {
+        "id": p.id,
+        "name": p.name,
+        "price_cents": p.price_cents,
+        "price": round(p.price_cents / 100, 2)  # можно отдать и в рублях
+    }
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" == "x"; допускается список и "*"
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+@router.get("/cache/stats", summary="Статистика кэша каталога")
+async def get_catalog_stats():
+    return catalog.stats()
+
+
 @router.get("/", summary="Получить список товаров")
-async def get_products(session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(Product))
-    products = result.scalars().all()
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "price_cents": p.price_cents,
-            "price": round(p.price_cents / 100, 2)  # можно отдать и в рублях
-        }
-        for p in products
-    ]
+async def get_products(
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+):
+    snap = await catalog.get(session)
+    # клиент уже держит эту версию каталога
+    if _etag_matches(request.headers.get("if-none-match"), snap.etag):
+        return Response(status_code=304, headers={"ETag": snap.etag})
+    # тело собрано один раз на версию каталога
+    return Response(
+        content=product_dicts.body(snap),
+        media_type="application/json",
+        headers={"ETag": snap.etag, "Cache-Control": "no-cache"},
+    )
 
 
 @router.get("/{product_id}", summary="Получить товар по ID")
 async def get_product(product_id: int, session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(Product).where(Product.id == product_id))
-    product = result.scalar_one_or_none()
+    snap = await catalog.get(session)
+    product = snap.by_id.get(product_id)
     if not product:
         return {"error": "Product not found"}
 
-    return {
-        "id": product.id,
-        "name": product.name,
-        "price_cents": product.price_cents,
-        "price": round(product.price_cents / 100, 2)
-    }
+    return _product_out(product)
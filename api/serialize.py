@@ -0,0 +1,167 @@
+# api/serialize.py
+"""
+Быстрый путь ответов: dict'ы прямо из строк-проекций (OrderRow/UserRow/ProductRecord)
+и orjson, без повторной прогонки через Pydantic.
+
+Роуты возвращают JSONResponse-объект — FastAPI тогда не валидирует результат
+по response_model (он остаётся для OpenAPI). Поэтому формы здесь обязаны
+совпадать с OrderRead / OrderItemRead / ProductRead / UserRead поле в поле:
+у проекций ровно те же поля, что у схем.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import orjson
+
+from bot.database.catalog import CatalogSnapshot
+from bot.database.projections import OrderRow, OrderItemRow, UserRow
+
+# поля, из которых собираются dict'ы (items у OrderRow — отдельно)
+_ORDER_FIELDS = tuple(f for f in OrderRow._fields if f != "items")
+_ITEM_FIELDS = OrderItemRow._fields
+_USER_FIELDS = UserRow._fields
+
+
+class _ProductDicts:
+    """dict'ы товаров строятся один раз на снимок каталога, а не на каждую позицию."""
+
+    def __init__(self):
+        self._etag = None
+        self._by_id: Dict[int, dict] = {}
+        self._body = b"[]"
+
+    def _sync(self, snap: CatalogSnapshot) -> None:
+        if snap.etag != self._etag:
+            # в позициях заказа — форма ProductRead
+            self._by_id = {p.id: p._asdict() for p in snap.products}
+            # GET /products/ отдаёт ещё и цену в рублях
+            self._body = orjson.dumps([
+                {**d, "price": round(d["price_cents"] / 100, 2)} for d in self._by_id.values()
+            ])
+            self._etag = snap.etag
+
+    def by_id(self, snap: CatalogSnapshot) -> Dict[int, dict]:
+        self._sync(snap)
+        return self._by_id
+
+    def body(self, snap: CatalogSnapshot) -> bytes:
+        """Готовое тело GET /products/ для этого снимка."""
+        self._sync(snap)
+        return self._body
+
+
+product_dicts = _ProductDicts()
+
+
+def user_dict(user: UserRow) -> dict:
+    return dict(zip(_USER_FIELDS, user))
+
+
+def order_dict(order: OrderRow, user: dict, products: Mapping[int, dict]) -> dict:
+    d = dict(zip(_ORDER_FIELDS, order))
+    d["items"] = [
+        {**dict(zip(_ITEM_FIELDS, it)), "product": products[it.product_id]}
+        for it in order.items
+    ]
+    d["user"] = user
+    return d
+
+
+def orders_payload(
+    orders: Iterable[OrderRow], users: Mapping[int, UserRow], snap: CatalogSnapshot
+) -> List[dict]:
+    """Список OrderRead-совместимых dict'ов; dict пользователя — один на пользователя."""
+    products = product_dicts.by_id(snap)
+    user_dicts: Dict[int, dict] = {}
+    out = []
+    for o in orders:
+        u = user_dicts.get(o.user_id)
+        if u is None:
+            u = user_dicts[o.user_id] = user_dict(users[o.user_id])
+        out.append(order_dict(o, u, products))
+    return out
+
+
+def orders_body(
+    orders: Iterable[OrderRow],
+    users: Mapping[int, UserRow],
+    snap: CatalogSnapshot,
+    compact: bool = False,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> bytes:
+    """Список заказов в нужном формате уже в JSON — тело, которое можно положить в кэш ответов."""
+    if compact:
+        return orjson.dumps(compact_payload(orders, users, snap, fields))
+    return orjson.dumps(select_fields(orders_payload(orders, users, snap), fields))
+
+
+def order_payload(order: OrderRow, user: UserRow, snap: CatalogSnapshot) -> dict:
+    return order_dict(order, user_dict(user), product_dicts.by_id(snap))
+
+
+# ---- компактный формат и sparse fieldsets (?format=compact&fields=...) ----
+# Полный OrderRead повторяет UserRead в каждом заказе и ProductRead в каждой
+# позиции. Компактный: {"orders": [...], "users": [...], "products": [...]} —
+# у заказа user_id, у позиции product_id, каждый пользователь и товар — один раз.
+
+FULL_FIELDS = _ORDER_FIELDS + ("items", "user")
+COMPACT_FIELDS = _ORDER_FIELDS + ("items",)
+# order_id у позиции внутри заказа — повтор id заказа
+_COMPACT_ITEM_FIELDS = tuple(f for f in _ITEM_FIELDS if f != "order_id")
+
+
+def parse_fields(raw: Optional[str], compact: bool) -> Optional[Tuple[str, ...]]:
+    """
+    "status,date,items" -> поля заказа в порядке схемы; id — всегда (на него ссылаются).
+    None — все поля. Неизвестное поле — ValueError.
+    """
+    if raw is None:
+        return None
+    allowed = COMPACT_FIELDS if compact else FULL_FIELDS
+    wanted = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}; allowed: {', '.join(allowed)}")
+    return tuple(f for f in allowed if f == "id" or f in wanted)
+
+
+def select_fields(payload: List[dict], fields: Optional[Tuple[str, ...]]) -> List[dict]:
+    """Sparse fieldset поверх полных dict'ов (ключи вне fields — например, rank — остаются)."""
+    if fields is None:
+        return payload
+    drop = set(FULL_FIELDS) - set(fields)
+    return [{k: v for k, v in d.items() if k not in drop} for d in payload]
+
+
+def compact_payload(
+    orders: Iterable[OrderRow],
+    users: Mapping[int, UserRow],
+    snap: CatalogSnapshot,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> dict:
+    """Заказы со ссылками user_id / product_id и по таблице пользователей и товаров — только упомянутых."""
+    scalar = _ORDER_FIELDS if fields is None else tuple(f for f in fields if f != "items")
+    with_items = fields is None or "items" in fields
+    with_users = "user_id" in scalar
+    out, user_ids, product_ids = [], {}, {}
+    for o in orders:
+        d = {f: getattr(o, f) for f in scalar}
+        if with_items:
+            d["items"] = [{f: getattr(it, f) for f in _COMPACT_ITEM_FIELDS} for it in o.items]
+            for it in o.items:
+                product_ids[it.product_id] = None
+        if with_users:
+            user_ids[o.user_id] = None
+        out.append(d)
+    products = product_dicts.by_id(snap)
+    return {
+        "orders": out,
+        "users": [user_dict(users[uid]) for uid in user_ids if uid in users],
+        "products": [products[pid] for pid in product_ids],
+    }
+
+
+def ndjson_lines(payload: Iterable[Any]) -> bytes:
+    """Кусок NDJSON: по объекту на строку."""
+    return b"".join(orjson.dumps(d, option=orjson.OPT_APPEND_NEWLINE) for d in payload)
@@ -1,5 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from bot.database.engine import get_async_session
+from bot.database.repository import get_users_keyset
+from ..utils import set_page_headers
 from . import schemas
 
 router = APIRouter(
@@ -9,8 +14,18 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[schemas.UserOut])
-async def list_users():
-    return {'users': 'четко'}  # Placeholder for user list
-
-
-
+async def list_users(
+    response: Response,
+    db: AsyncSession = Depends(get_async_session),
+    limit: int = Query(50, ge=1, le=500, description="Размер страницы (1–500)"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из заголовка X-Next-Cursor / X-Prev-Cursor"
+    ),
+):
+    """Пользователи, новые сначала (keyset по created_at, id); курсоры и total в заголовках."""
+    try:
+        page = await get_users_keyset(db, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    set_page_headers(response, page)
+    return page.items
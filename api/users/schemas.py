@@ -1,14 +1,13 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional
 
 class UserOut(BaseModel):
     id: int
     telegram_id: int
-    email: EmailStr
-    name: str
-    phone: str
+    name: Optional[str] = None
+    phone: Optional[str] = None
     created_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
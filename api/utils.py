@@ -1,27 +1,43 @@
 # backend/utils/notify.py
-import httpx
-from bot.config import BOT_TOKEN, ADMINS
+from fastapi import Response
+from bot.config import BOT_TOKEN, ADMINS, TELEGRAM_API_BASE
+from bot.telegram_client import TelegramClient
 
-API = f"https://api.telegram.org/bot{BOT_TOKEN}"
+# один клиент на процесс: keep-alive пул + лимиты Telegram (старт/стоп в lifespan)
+telegram = TelegramClient(BOT_TOKEN, TELEGRAM_API_BASE)
 
-async def notify_admins_new_order(order):
-    text = (
-        f"🆕 <b>Новый заказ #{order.id}</b>\n"
-        f"{order.flavor} ×{order.bottle_count}\n"
-        f"Сумма: {order.price/100:.2f} ₽\n"
-        f"Клиент: <a href='tg://user?id={order.telegram_id}'>профиль</a>\n"
-        f"Адрес: {order.address}\nТелефон: {order.phone}"
+
+def set_page_headers(response: Response, page) -> None:
+    """Курсоры и total keyset-страницы — в заголовки, тело остаётся списком."""
+    response.headers["X-Total-Count"] = str(page.total)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.prev_cursor:
+        response.headers["X-Prev-Cursor"] = page.prev_cursor
+
+
+def new_order_text(order) -> str:
+    """Текст уведомления из OrderRead-совместимого dict; собирается в запросе."""
+    items = ", ".join(f"{it['product']['name']} ×{it['quantity']}" for it in order["items"]) or "—"
+    return (
+        f"🆕 <b>Новый заказ #{order['id']}</b>\n"
+        f"{items}\n"
+        f"Сумма: {order['total_price_cents']/100:.2f} ₽\n"
+        f"Клиент: <a href='tg://user?id={order['telegram_id']}'>профиль</a>\n"
+        f"Адрес: {order['address']}\nТелефон: {order['phone']}"
+    )
+
+
+async def notify_admins_new_order(order_id: int, text: str):
+    """Разослать уведомление всем админам параллельно. Запускать в фоне, не в пути запроса."""
+    await telegram.send_to_many(
+        ADMINS,
+        text,
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+        reply_markup={
+            "inline_keyboard": [[
+                {"text": "Открыть в админке", "callback_data": f"admin:order:{order_id}"}
+            ]]
+        },
     )
-    async with httpx.AsyncClient(timeout=10) as client:
-        for admin_id in ADMINS:
-            await client.post(f"{API}/sendMessage", json={
-                "chat_id": admin_id,
-                "text": text,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": True,
-                "reply_markup": {
-                    "inline_keyboard": [[
-                        {"text": "Открыть в админке", "callback_data": f"admin:order:{order.id}"}
-                    ]]
-                }
-            })
@@ -0,0 +1,205 @@
+# bench/bench_bot_updates.py
+"""
+Пропускная способность бота: long polling против webhook (1 и N процессов).
+Всё против локального FakeTelegram с задержкой ответа: getUpdates отдаёт заранее
+положенные апдейты, хендлер отвечает sendMessage — как настоящий.
+FakeTelegram и воркеры webhook — отдельные процессы, CPU с замеряемым не делят.
+
+    python -m bench.bench_bot_updates --updates 5000 --latency-ms 20 --processes 1 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from aiohttp import ClientSession
+
+from .fake_telegram import FakeTelegram
+
+# модули бота импортируются так же, как в run.py — из каталога bot/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+TOKEN = "42:bench"
+SECRET = "bench-secret"
+
+
+def make_update(update_id: int) -> dict:
+    chat = {"id": 1_000 + update_id % 500, "type": "private"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "chat": chat, "text": "ping",
+            "from": {"id": chat["id"], "is_bot": False, "first_name": "bench"},
+        },
+    }
+
+
+def make_bot_and_dp(api_base: str, on_done):
+    from aiogram import Bot, Dispatcher, Router
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    router = Router()
+
+    @router.message()
+    async def pong(message):
+        await message.answer("pong")
+        on_done()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_base)))
+    return bot, dp
+
+
+# ---- FakeTelegram в отдельном процессе ----
+
+def _fake_process(latency: float, updates: int, port_q) -> None:
+    async def main():
+        fake = FakeTelegram(latency=latency)
+        fake.push_updates(make_update(i) for i in range(1, updates + 1))
+        port_q.put(await fake.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def start_fake(latency: float, updates: int = 0) -> tuple[multiprocessing.Process, str]:
+    port_q = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_fake_process, args=(latency, updates, port_q), daemon=True)
+    proc.start()
+    return proc, await asyncio.to_thread(port_q.get)
+
+
+def stop_process(proc: multiprocessing.Process) -> None:
+    proc.terminate()
+    proc.join()
+
+
+# ---- polling ----
+
+async def bench_polling(n: int, args) -> tuple[float, dict]:
+    fake, api_base = await start_fake(args.latency_ms / 1000, updates=n)
+    done = asyncio.Event()
+    handled = 0
+
+    def on_done():
+        nonlocal handled
+        handled += 1
+        if handled == n:
+            done.set()
+
+    bot, dp = make_bot_and_dp(api_base, on_done)
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    try:
+        await done.wait()
+        elapsed = time.perf_counter() - started
+    finally:
+        await dp.stop_polling()
+        await polling
+        stop_process(fake)
+    return elapsed, {"handled": handled}
+
+
+# ---- webhook ----
+
+def _webhook_process(api_base: str, port: int, counter, ready, args) -> None:
+    async def main():
+        from webhook import WebhookServer
+
+        def on_done():
+            with counter.get_lock():
+                counter.value += 1
+
+        bot, dp = make_bot_and_dp(api_base, on_done)
+        server = WebhookServer(dp, bot, secret=SECRET, queue_size=args.queue_size,
+                               concurrency=args.handler_concurrency)
+        await server.start("127.0.0.1", port, reuse_port=True)
+        ready.release()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def post_updates(url: str, n: int, concurrency: int, duplicates: float) -> dict:
+    """Шлёт n апдейтов (и долю повторов) как Telegram: до concurrency запросов сразу."""
+    statuses: dict[int, int] = {}
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for update_id in [*range(1, n + 1), *range(1, int(n * duplicates) + 1)]:
+        queue.put_nowait(update_id)
+
+    async with ClientSession() as client:
+        async def sender():
+            while not queue.empty():
+                update_id = queue.get_nowait()
+                async with client.post(url, json=make_update(update_id),
+                                       headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                if resp.status == 503:      # очередь полна — Telegram повторил бы позже
+                    await asyncio.sleep(0.01)
+                    queue.put_nowait(update_id)
+
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return statuses
+
+
+async def bench_webhook(n: int, processes: int, args) -> tuple[float, dict]:
+    fake, api_base = await start_fake(args.latency_ms / 1000)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    counter = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Semaphore(0)
+    workers = [
+        multiprocessing.Process(target=_webhook_process, args=(api_base, port, counter, ready, args), daemon=True)
+        for _ in range(processes)
+    ]
+    for p in workers:
+        p.start()
+    for _ in workers:
+        await asyncio.to_thread(ready.acquire)
+
+    try:
+        started = time.perf_counter()
+        statuses = await post_updates(f"http://127.0.0.1:{port}/webhook", n, args.concurrency, args.duplicates)
+        while counter.value < n:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.2)    # повторы, попавшие на другой процесс, успевают досчитаться
+    finally:
+        for p in workers:
+            stop_process(p)
+        stop_process(fake)
+    return elapsed, {"handled": counter.value, **{f"http_{k}": v for k, v in sorted(statuses.items())}}
+
+
+async def run(args) -> None:
+    print(f"updates: {args.updates}, Bot API latency: {args.latency_ms} ms, "
+          f"webhook: {args.concurrency} connections, {args.duplicates:.0%} redelivered")
+    runs = [("polling", lambda: bench_polling(args.updates, args))]
+    runs += [(f"webhook x{p}", lambda p=p: bench_webhook(args.updates, p, args)) for p in args.processes]
+    for name, bench in runs:
+        elapsed, info = await bench()
+        print(f"  {name:<12} {elapsed:7.2f} s  {args.updates / elapsed:8.0f} updates/s  {info}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременных POST от «Telegram»")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4], help="процессов webhook")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--handler-concurrency", type=int, default=50)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="доля повторно доставленных апдейтов")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
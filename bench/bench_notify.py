@@ -0,0 +1,67 @@
+# bench/bench_notify.py
+"""
+Уведомления админам: старый путь (новый httpx-клиент на заказ, админы по очереди)
+против общего TelegramClient. Всё против локального FakeTelegram.
+
+    python -m bench.bench_notify --orders 200 --admins 2 --latency-ms 40
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bot.telegram_client import TelegramClient
+from .fake_telegram import FakeTelegram
+
+
+async def old_path(base_url: str, orders: int, admins: list[int]) -> float:
+    started = time.perf_counter()
+    for n in range(orders):
+        async with httpx.AsyncClient(timeout=10) as client:
+            for admin_id in admins:
+                await client.post(f"{base_url}/botTOKEN/sendMessage",
+                                  json={"chat_id": admin_id, "text": f"order {n}"})
+    return time.perf_counter() - started
+
+
+async def new_path(base_url: str, orders: int, admins: list[int]) -> tuple[float, dict]:
+    # лимиты подняты: меряем сам транспорт, а не ожидание в bucket'ах
+    client = TelegramClient("TOKEN", base_url, global_rate=10_000, per_chat_rate=10_000)
+    await client.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(client.send_to_many(admins, f"order {n}") for n in range(orders)))
+    elapsed = time.perf_counter() - started
+    await client.close()
+    return elapsed, client.stats()
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency_ms / 1000, flood_every=args.flood_every)
+    base_url = await fake.start()
+    admins = list(range(1, args.admins + 1))
+    try:
+        old = await old_path(base_url, args.orders, admins)
+        new, stats = await new_path(base_url, args.orders, admins)
+    finally:
+        await fake.stop()
+    total = args.orders * len(admins)
+    print(f"messages: {total}")
+    print(f"old (client per order, sequential): {old:.3f}s  {total / old:.1f} msg/s")
+    print(f"new (pooled, concurrent):           {new:.3f}s  {total / new:.1f} msg/s")
+    print(f"client stats: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--flood-every", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
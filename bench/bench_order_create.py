@@ -0,0 +1,132 @@
+# bench/bench_order_create.py
+"""
+Создание одного заказа: прежний ORM-путь (add → commit → refresh + selectin-каскад)
+против текущего пути create_order (SELECT пользователя + один INSERT с CTE + COMMIT),
+оба без HTTP-слоя. Считает round trip'ы к БД (statements + BEGIN/COMMIT)
+и задержку на заказ.
+Запускать против отдельной (локальной) базы.
+
+    python -m bench.bench_order_create --orders 300 --create-schema
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, select, func
+
+from .bench_orders_batch import seed
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.count = 0
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._hit)
+        event.listen(sync_engine, "begin", self._hit)
+        event.listen(sync_engine, "commit", self._hit)
+
+    def _hit(self, *args):
+        self.count += 1
+
+    def take(self) -> int:
+        n, self.count = self.count, 0
+        return n
+
+
+async def legacy_create(db, payload: dict) -> None:
+    """Копия прежнего create_order: только для сравнения."""
+    from bot.database.models import Order, OrderItem, Product, User
+    from bot.database.pricing import pricing
+
+    user = (await db.execute(select(User).where(User.telegram_id == payload["telegram_id"]))).scalar_one()
+    past_total = (await db.execute(
+        select(func.sum(OrderItem.quantity)).join(Order)
+        .where((Order.user_id == user.id) & (Order.is_paid == True))
+    )).scalar() or 0
+    current_total = sum(i["quantity"] for i in payload["items"])
+    price = (await pricing.get(db)).price_for(past_total + current_total)
+    ids = {i["product_id"] for i in payload["items"]}
+    (await db.execute(select(Product).where(Product.id.in_(ids)))).scalars().all()
+    order = Order(user_id=user.id, telegram_id=payload["telegram_id"], address=payload["address"],
+                  phone=payload["phone"], is_paid=payload["is_paid"], total_price_cents=price * current_total)
+    order.items = [OrderItem(product_id=i["product_id"], quantity=i["quantity"], unit_price_cents=price,
+                             line_total_cents=price * i["quantity"]) for i in payload["items"]]
+    db.add(order)
+    await db.commit()
+    await db.refresh(order)
+
+
+async def current_create(db, payload: dict) -> None:
+    """Тот же путь, что в api.orders.routes.create_order, без HTTP."""
+    from bot.database.catalog import catalog
+    from bot.database.pricing import pricing
+    from bot.database.repository import get_user_for_order, insert_order_returning
+    from api.serialize import order_payload
+
+    user, past_total = await get_user_for_order(db, payload["telegram_id"])
+    current_total = sum(i["quantity"] for i in payload["items"])
+    price = (await pricing.get(db)).price_for(past_total + current_total)
+    snap = await catalog.get(db)
+    assert {i["product_id"] for i in payload["items"]} <= snap.by_id.keys()
+    order = await insert_order_returning(
+        db, user_id=user.id, telegram_id=payload["telegram_id"], address=payload["address"],
+        phone=payload["phone"], items=[(i["product_id"], i["quantity"]) for i in payload["items"]],
+        unit_price_cents=price, is_paid=payload["is_paid"],
+    )
+    await db.commit()
+    order_payload(order, user, snap)
+
+
+def summary(name: str, latencies: list[float], round_trips: int, n: int) -> str:
+    lat = sorted(latencies)
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000
+    return (f"{name:<8} round trips/order: {round_trips / n:5.1f}   "
+            f"p50 {p(.5):6.2f} ms  p99 {p(.99):6.2f} ms  mean {statistics.mean(lat) * 1000:6.2f} ms")
+
+
+async def timed(create, payloads: list[dict], counter) -> tuple[list[float], int]:
+    from bot.database.engine import AsyncSessionLocal
+    latencies = []
+    counter.take()
+    for p in payloads:
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await create(db, p)
+        latencies.append(time.perf_counter() - started)
+    return latencies, counter.take()
+
+
+async def run(args) -> None:
+    from bot.database.engine import engine, AsyncSessionLocal
+    from bot.database.pricing import pricing
+    from .bench_orders_batch import make_payloads
+
+    engine.echo = False
+    product_id = await seed(args.users, args.create_schema)
+    async with AsyncSessionLocal() as db:
+        prices = await pricing.get(db)
+    payloads = make_payloads(args.orders, args.users, product_id, prices)
+    counter = RoundTripCounter(engine)
+
+    legacy_lat, legacy_rt = await timed(legacy_create, payloads, counter)
+    await timed(current_create, payloads[:1], counter)  # прогреть снимок каталога
+    new_lat, new_rt = await timed(current_create, payloads, counter)
+
+    print(f"orders: {args.orders}, users: {args.users} (история заказов растёт по ходу прогона)")
+    print(summary("before", legacy_lat, legacy_rt, args.orders))
+    print(summary("after", new_lat, new_rt, args.orders))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--create-schema", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
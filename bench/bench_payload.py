@@ -0,0 +1,74 @@
+# bench/bench_payload.py
+"""
+Размер и время сборки списка заказов по форматам (без БД и HTTP):
+full (OrderRead), compact (?format=compact), compact с ?fields=, — и то же
+после gzip и brotli (если установлен пакет brotli), как их сжимает
+api/compression.py.
+
+Два сценария: история одного клиента (все заказы — один пользователь,
+Mini App) и админский список (заказы разных клиентов).
+
+    python -m bench.bench_payload --orders 200 --users 1 50
+"""
+from __future__ import annotations
+
+import argparse
+import zlib
+
+from .bench_serialize import bench, make_rows
+
+
+def shapes():
+    from api.serialize import orders_body, parse_fields
+
+    summary = parse_fields("status,date,total_price_cents", compact=True)
+    return [
+        ("full", lambda o, u, s: orders_body(o, u, s)),
+        ("compact", lambda o, u, s: orders_body(o, u, s, compact=True)),
+        ("compact+fields", lambda o, u, s: orders_body(o, u, s, compact=True, fields=summary)),
+    ]
+
+
+def encoders():
+    from api import compression
+
+    gzip_level = compression.GZIP_LEVEL
+    out = [("gzip", lambda b: zlib.compress(b, gzip_level, wbits=31))]
+    if compression.brotli is not None:
+        quality = compression.BROTLI_QUALITY
+        out.append(("br", lambda b: compression.brotli.compress(b, quality=quality)))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 50], help="клиентов в списке")
+    parser.add_argument("--items", type=int, default=3, help="позиций в заказе")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = encoders()
+    header = f"  {'format':<15} {'raw KB':>8} {'build ms':>9}"
+    for name, _ in codecs:
+        header += f" {name + ' KB':>9} {name + ' ms':>8}"
+    if len(codecs) == 1:
+        print("(brotli not installed: gzip only)")
+    for n in args.orders:
+        for n_users in args.users:
+            orders, users, snap = make_rows(n, n_users=n_users, items_per_order=args.items)
+            print(f"\n{n} orders, {n_users} users, {args.items} items per order")
+            print(header)
+            base = None
+            for name, build in shapes():
+                body = build(orders, users, snap)
+                base = base or len(body)
+                line = f"  {name:<15} {len(body) / 1024:8.1f} {bench(lambda: build(orders, users, snap), args.repeat) * 1000:9.2f}"
+                for _, encode in codecs:
+                    packed = encode(body)
+                    line += f" {len(packed) / 1024:9.1f} {bench(lambda: encode(body), args.repeat) * 1000:8.2f}"
+                print(f"{line}  ({len(body) / base:.0%} of full)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/bench_serialize.py
+"""
+Микробенчмарк сериализации списка заказов (без БД и HTTP).
+
+before — как раньше отдавал FastAPI: валидация dict'ов по response_model
+         (OrderRead -> OrderItemRead -> ProductRead, UserRead), dump в JSON-режиме
+         и stdlib json.dumps;
+after  — api.serialize: dict'ы прямо из строк-проекций + orjson.
+
+    python -m bench.bench_serialize --orders 100 1000 10000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+
+def make_rows(n_orders: int, n_users: int = 50, items_per_order: int = 3):
+    from bot.database.catalog import _build_snapshot, ProductRecord
+    from bot.database.models import OrderStatus
+    from bot.database.projections import OrderRow, OrderItemRow, UserRow
+
+    snap = _build_snapshot([ProductRecord(i, f"Cold brew {i}", 25000) for i in range(1, 6)])
+    now = datetime(2026, 1, 1, 12, 0, 0, 123456)
+    users = {
+        i: UserRow(i, 1_000_000 + i, f"user {i}", "+79160000000", now) for i in range(1, n_users + 1)
+    }
+    orders, item_id = [], 0
+    for n in range(1, n_orders + 1):
+        items = []
+        for k in range(items_per_order):
+            item_id += 1
+            items.append(OrderItemRow(item_id, n, 1 + k % 5, 2, 250, 500))
+        uid = 1 + n % n_users
+        orders.append(OrderRow(
+            n, users[uid].telegram_id, uid, now - timedelta(minutes=n), f"street {n}",
+            "+79160000000", bool(n % 2), 500 * items_per_order, OrderStatus.processing, tuple(items),
+        ))
+    return orders, users, snap
+
+
+def legacy_body(adapter, orders, users, snap) -> bytes:
+    # прежняя сборка dict'ов в роуте + то, что делает FastAPI с response_model
+    raw = [
+        {
+            **o._asdict(),
+            "items": [{**it._asdict(), "product": snap.by_id[it.product_id]._asdict()} for it in o.items],
+            "user": users[o.user_id]._asdict(),
+        }
+        for o in orders
+    ]
+    content = adapter.dump_python(adapter.validate_python(raw), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_body(orders, users, snap) -> bytes:
+    import orjson
+    from api.serialize import orders_payload
+    return orjson.dumps(orders_payload(orders, users, snap))
+
+
+def bench(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main() -> None:
+    from pydantic import TypeAdapter
+    from api.orders.schemas import OrderRead
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(list[OrderRead])
+    for n in args.orders:
+        orders, users, snap = make_rows(n)
+        # тела должны совпадать по содержимому
+        assert json.loads(legacy_body(adapter, orders, users, snap)) == json.loads(fast_body(orders, users, snap))
+        before = bench(lambda: legacy_body(adapter, orders, users, snap), args.repeat)
+        after = bench(lambda: fast_body(orders, users, snap), args.repeat)
+        print(f"{n:>6} orders  before {before * 1000:8.2f} ms  after {after * 1000:7.2f} ms  x{before / after:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
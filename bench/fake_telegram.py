@@ -0,0 +1,137 @@
+# bench/fake_telegram.py
+"""
+Локальный фейковый Bot API: для проверки отправок и бенчмарков без сети и
+настоящего токена. Поддерживает задержку ответа, периодические 429,
+"заблокировавших" пользователей (403) и getUpdates из заранее положенных апдейтов.
+
+    python -m bench.fake_telegram --port 8081 --latency-ms 30 --flood-every 50
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 uvicorn api.app:app
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        flood_every: int = 0,
+        retry_after: int = 1,
+        blocked: Iterable[int] = (),
+    ):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.blocked = set(blocked)
+        self.calls = 0
+        self.messages: list[tuple[int, str]] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._next_message_id = 1
+        self._updates: list[dict] = []
+        self._has_updates = asyncio.Event()
+
+    def push_updates(self, updates: Iterable[dict]) -> None:
+        """Апдейты для getUpdates (по возрастанию update_id)."""
+        self._updates.extend(updates)
+        if self._updates:
+            self._has_updates.set()
+
+    async def _get_updates(self, payload: dict) -> list[dict]:
+        offset = int(payload.get("offset") or 0)
+        limit = int(payload.get("limit") or 100)
+        # offset подтверждает всё, что раньше него
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), float(payload.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                return []
+        return self._updates[:limit]
+
+    def _ok(self, result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _error(self, code: int, description: str, **params) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if params:
+            body["parameters"] = params
+        return web.json_response(body, status=code)
+
+    @staticmethod
+    async def _payload(request: web.Request) -> dict:
+        if not request.can_read_body:
+            return {}
+        if request.content_type == "application/json":
+            return await request.json()
+        # aiogram шлёт form-data: скаляры строками
+        return dict(await request.post())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        payload = await self._payload(request)
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and self.calls % self.flood_every == 0:
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               retry_after=self.retry_after)
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(payload))
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"})
+        if method in ("sendMessage", "editMessageText", "sendInvoice"):
+            chat_id = int(payload.get("chat_id", 0))
+            if chat_id in self.blocked:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            self.messages.append((chat_id, payload.get("text", "")))
+            message_id = payload.get("message_id") or self._next_message_id
+            self._next_message_id += 1
+            return self._ok({
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": payload.get("text", ""),
+            })
+        return self._ok(True)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить в текущем loop; возвращает base_url для TELEGRAM_API_BASE."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sock = site._server.sockets[0]
+        return f"http://{host}:{sock.getsockname()[1]}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--flood-every", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakeTelegram(latency=args.latency_ms / 1000, flood_every=args.flood_every)
+    web.run_app(fake.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# bench/stats.py
+"""
+Общее для нагрузочных бенчей (load_api.py, bench_repository.py):
+перцентили и пропускная способность, сохранённый baseline и проверка регрессий,
+защита от запуска не на локальной базе.
+
+Baseline — JSON {название: сводка}. Регрессия — p95 или p99 выросли больше чем
+на tolerance или пропускная способность упала больше чем на tolerance (и в обоих
+случаях больше чем на slack мс на операцию — на быстрых операциях шум больше
+самих миллисекунд), или появились ошибки. Сравнивать имеет смысл только прогоны
+на той же машине и тех же данных (bench.datagen с тем же --seed).
+"""
+from __future__ import annotations
+
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+
+
+def require_local_db(url: Optional[str] = None) -> None:
+    """Выйти, если DATABASE_URL смотрит не на локальный Postgres (сокет или localhost).
+
+    Дополнительные имена хостов (например, db из docker-compose) — в BENCH_LOCAL_HOSTS через запятую.
+    """
+    from sqlalchemy.engine import make_url
+
+    if url is None:
+        from bot.database.engine import DATABASE_URL as url
+    parsed = make_url(url)
+    host = parsed.host or parsed.query.get("host") or ""
+    allowed = LOCAL_HOSTS | {h.strip() for h in os.getenv("BENCH_LOCAL_HOSTS", "").split(",") if h.strip()}
+    if host not in allowed and not str(host).startswith("/"):
+        sys.exit(f"refusing to run against {parsed.render_as_string(hide_password=True)}: "
+                 f"benchmarks run against a local Postgres only (see BENCH_LOCAL_HOSTS)")
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Перцентиль q (0..1) по уже отсортированным значениям, с интерполяцией."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> dict:
+    """latencies и elapsed — в секундах; в сводке — мс и операций в секунду."""
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "count": len(lat),
+        "errors": errors,
+        "throughput": round(len(lat) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": ms(sum(lat) / len(lat)) if lat else 0.0,
+        "p50_ms": ms(percentile(lat, 0.50)),
+        "p95_ms": ms(percentile(lat, 0.95)),
+        "p99_ms": ms(percentile(lat, 0.99)),
+        "max_ms": ms(lat[-1]) if lat else 0.0,
+    }
+
+
+def print_table(results: Dict[str, dict], unit: str = "ops/s") -> None:
+    width = max([len(n) for n in results] + [10])
+    print(f"  {'name':<{width}} {'count':>7} {'err':>5} {unit:>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in results.items():
+        print(f"  {name:<{width}} {s['count']:7d} {s['errors']:5d} {s['throughput']:9.1f} "
+              f"{s['p50_ms']:9.2f} {s['p95_ms']:9.2f} {s['p99_ms']:9.2f}")
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, slack_ms: float) -> List[str]:
+    """Регрессии относительно baseline — по строке на нарушение; новые названия не сравниваются."""
+    problems = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            limit = max(base[key] * (1 + tolerance), base[key] + slack_ms)
+            if cur[key] > limit:
+                problems.append(f"{name}: {key} {cur[key]:.2f} > {limit:.2f} (baseline {base[key]:.2f})")
+        # пропускная способность — тоже со slack: время на операцию выросло больше чем на slack_ms
+        per_op_ms = lambda tp: 1000 / tp if tp > 0 else float("inf")
+        if (cur["throughput"] < base["throughput"] * (1 - tolerance)
+                and per_op_ms(cur["throughput"]) - per_op_ms(base["throughput"]) > slack_ms):
+            problems.append(f"{name}: throughput {cur['throughput']:.1f} < "
+                            f"{base['throughput'] * (1 - tolerance):.1f} (baseline {base['throughput']:.1f})")
+        if cur["errors"] > base["errors"]:
+            problems.append(f"{name}: errors {cur['errors']} (baseline {base['errors']})")
+    return problems
+
+
+def add_baseline_args(parser, default_path: str) -> None:
+    parser.add_argument("--baseline", default=default_path,
+                        help="JSON с прошлым прогоном: регрессия — код выхода 1 (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать этот прогон как baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение, доля (default: 0.25)")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="допустимый рост перцентилей и времени на операцию, мс")
+
+
+def check_baseline(args, results: Dict[str, dict], meta: dict) -> int:
+    """Сохранить baseline или сравнить с ним; возвращает код выхода."""
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "meta": {**meta, "host": platform.node(), "python": platform.python_version(),
+                         "saved_at": datetime.now().isoformat(timespec="seconds")},
+                "results": results,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline} (--save-baseline to create one)")
+        return 0
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    if stored.get("meta", {}).get("params") != meta.get("params"):
+        print(f"warning: baseline was recorded with {stored.get('meta', {}).get('params')}, now {meta.get('params')}")
+    problems = compare(results, stored["results"], args.tolerance, args.slack_ms)
+    for p in problems:
+        print(f"REGRESSION {p}")
+    if not problems:
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 1 if problems else 0
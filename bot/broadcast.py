@@ -0,0 +1,251 @@
+# bot/broadcast.py
+"""
+Рассылка сообщения всем пользователям бота.
+
+Получатели читаются пачками по users.id (keyset: без OFFSET и без всей таблицы
+в памяти) и отправляются параллельно через TelegramClient — глобальный token
+bucket (BROADCAST_RATE, ниже лимита Telegram: остаётся запас ответам бота) и
+bucket на чат; на 429 все отправки ждут retry_after.
+
+После каждой пачки в broadcasts сохраняются курсор и счётчики, получатели с 403
+(«бот заблокирован») отмечаются в users.blocked_at и дальше пропускаются.
+Рассылку ведёт один процесс (аренда в broadcasts.locked_until). Процесс упал —
+по истечении аренды её с курсора продолжит любой процесс бота; повторно сообщение
+могут получить только получатели незавершённой пачки. При остановке процесса
+новые отправки не начинаются, начатые дописываются, прогресс сохраняется,
+аренда отпускается.
+
+Прогресс — правкой одного сообщения в чате админа, не чаще BROADCAST_PROGRESS_SECONDS.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from itertools import takewhile
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import (
+    BOT_TOKEN, TELEGRAM_API_BASE, BROADCAST_RATE, BROADCAST_BATCH, BROADCAST_CONCURRENCY,
+    BROADCAST_LEASE_SECONDS, BROADCAST_PROGRESS_SECONDS,
+)
+from database.engine import AsyncSessionLocal
+from database.models import BroadcastStatus
+from database.projections import BroadcastRow
+from database.repository import (
+    claim_broadcast, get_resumable_broadcasts, get_broadcast_recipients,
+    mark_users_blocked, save_broadcast_progress,
+)
+from metrics import registry
+from telegram_client import TelegramClient
+
+log = logging.getLogger(__name__)
+
+BROADCAST_MESSAGES = registry.counter(
+    "bot_broadcast_messages_total", "Сообщения рассылок по результату", ("result",))
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+_TITLES = {
+    BroadcastStatus.running: "идёт…",
+    BroadcastStatus.done: "завершена ✅",
+    BroadcastStatus.cancelled: "остановлена ⏹",
+}
+
+
+def _outcome(resp: dict) -> str:
+    if resp.get("ok"):
+        return SENT
+    if resp.get("error_code") == 403:       # заблокировал бота / удалил аккаунт
+        return BLOCKED
+    return FAILED
+
+
+def progress_text(b: BroadcastRow) -> str:
+    processed = b.sent + b.failed + b.blocked
+    pct = min(100, processed * 100 // b.total) if b.total else 100
+    return (
+        f"<b>📣 Рассылка #{b.id}</b> — {_TITLES[BroadcastStatus(b.status)]}\n"
+        f"{'▓' * (pct // 10)}{'░' * (10 - pct // 10)} {pct}%\n"
+        f"Обработано: {processed} из {b.total}\n"
+        f"Доставлено: {b.sent}\n"
+        f"Заблокировали бота: {b.blocked}\n"
+        f"Ошибок: {b.failed}"
+    )
+
+
+def stop_callback(broadcast_id: int) -> str:
+    return f"admin:bcstop:{broadcast_id}"
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        client: TelegramClient,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        *,
+        batch_size: int = BROADCAST_BATCH,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        lease: float = BROADCAST_LEASE_SECONDS,
+        progress_interval: float = BROADCAST_PROGRESS_SECONDS,
+    ):
+        self.client = client
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.lease = lease
+        self.progress_interval = progress_interval
+        self._running: Dict[int, Tuple[asyncio.Task, asyncio.Event]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._edits: Set[asyncio.Task] = set()
+        self._closing = False
+
+    # ---- управление ----
+
+    def launch(self, broadcast_id: int) -> None:
+        """
+        Вести рассылку в этом процессе. Аренда берётся в фоновой задаче своей
+        сессией — можно вызывать из хендлера до commit его транзакции.
+        """
+        if self._closing or broadcast_id in self._running:
+            return
+        stop = asyncio.Event()
+        task = asyncio.get_running_loop().create_task(self._run(broadcast_id, stop))
+        self._running[broadcast_id] = (task, stop)
+        task.add_done_callback(lambda _t: self._running.pop(broadcast_id, None))
+
+    def cancel(self, broadcast_id: int) -> None:
+        """Не начинать новых отправок (статус cancelled ставит cancel_broadcast)."""
+        running = self._running.get(broadcast_id)
+        if running is not None:
+            running[1].set()
+
+    def start(self) -> None:
+        """Фоновый поиск брошенных рассылок (упавший или остановленный процесс)."""
+        self._closing = False
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Дописать начатые отправки, сохранить прогресс и отпустить аренду."""
+        self._closing = True
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        tasks = [task for task, stop in self._running.values()]
+        for _task, stop in self._running.values():
+            stop.set()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        await self.client.close()
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    for broadcast_id in await get_resumable_broadcasts(db):
+                        self.launch(broadcast_id)
+            except Exception:
+                log.exception("broadcast poll failed")
+            await asyncio.sleep(self.lease / 2)
+
+    # ---- рассылка ----
+
+    async def _run(self, broadcast_id: int, stop: asyncio.Event) -> None:
+        try:
+            async with self.session_factory() as db:
+                b = await claim_broadcast(db, broadcast_id, self.lease)
+            if b is not None:           # None — ведёт другой процесс или уже закончена
+                await self._send_all(b, stop)
+        except Exception:
+            log.exception("broadcast %s failed", broadcast_id)
+
+    async def _send_all(self, b: BroadcastRow, stop: asyncio.Event) -> None:
+        cursor = b.cursor_user_id
+        shown = 0.0
+        live: Counter = Counter()       # результаты текущей пачки — для прогресса до её сохранения
+
+        def on_result(outcome: str) -> None:
+            nonlocal shown
+            live[outcome] += 1
+            if time.monotonic() - shown >= self.progress_interval:
+                shown = time.monotonic()
+                row = b._replace(sent=b.sent + live[SENT], failed=b.failed + live[FAILED],
+                                 blocked=b.blocked + live[BLOCKED])
+                edit = asyncio.get_running_loop().create_task(self._show(row))
+                self._edits.add(edit)
+                edit.add_done_callback(self._edits.discard)
+
+        while True:
+            async with self.session_factory() as db:
+                recipients = await get_broadcast_recipients(db, cursor, self.batch_size)
+            live.clear()
+            outcomes = await self._send_batch(b.text, recipients, stop, on_result)
+            # курсор — по непрерывному началу пачки: неотправленный хвост достанется продолжению
+            done = list(takewhile(lambda o: o is not None, outcomes))
+            if done:
+                cursor = recipients[len(done) - 1][0]
+            leaving = stop.is_set() or self._closing
+            finished = len(done) == len(recipients) < self.batch_size
+
+            async with self.session_factory() as db:
+                await mark_users_blocked(db, (tg for (_, tg), o in zip(recipients, done) if o == BLOCKED))
+                b = await save_broadcast_progress(
+                    db, b.id,
+                    cursor_user_id=cursor,
+                    sent=done.count(SENT), failed=done.count(FAILED), blocked=done.count(BLOCKED),
+                    lease_seconds=0 if leaving else self.lease,
+                    done=finished,
+                )
+            if b is None:
+                return
+            if b.status != BroadcastStatus.running or leaving:
+                await self._show(b)
+                return
+
+    async def _send_batch(
+        self,
+        text: str,
+        recipients: List[Tuple[int, int]],
+        stop: asyncio.Event,
+        on_result: Callable[[str], None],
+    ) -> List[Optional[str]]:
+        """Результат на каждого получателя; None — не отправляли (остановка)."""
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def one(telegram_id: int) -> Optional[str]:
+            async with slots:
+                if stop.is_set() or self._closing:
+                    return None
+                resp = await self.client.send_message(
+                    telegram_id, text, parse_mode="HTML", disable_web_page_preview=True,
+                )
+            outcome = _outcome(resp)
+            BROADCAST_MESSAGES.inc(result=outcome)
+            on_result(outcome)
+            return outcome
+
+        return list(await asyncio.gather(*(one(tg) for _, tg in recipients)))
+
+    async def _show(self, b: BroadcastRow) -> None:
+        if b.progress_message_id is None:
+            return
+        payload = {
+            "chat_id": b.progress_chat_id,
+            "message_id": b.progress_message_id,
+            "text": progress_text(b),
+            "parse_mode": "HTML",
+        }
+        if b.status == BroadcastStatus.running:
+            payload["reply_markup"] = {
+                "inline_keyboard": [[{"text": "⏹ Остановить", "callback_data": stop_callback(b.id)}]]
+            }
+        # ответ не важен: «message is not modified» и т.п. прогресс не ломают
+        await self.client.call("editMessageText", payload, chat_id=b.progress_chat_id)
+
+
+broadcaster = Broadcaster(TelegramClient(BOT_TOKEN, TELEGRAM_API_BASE, global_rate=BROADCAST_RATE))
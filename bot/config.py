@@ -5,5 +5,27 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 PAYMENTS_PROVIDER_TOKEN = os.getenv('PAYMENTS_PROVIDER_TOKEN')
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-ADMINS = [5455171373, 967720988]
\ No newline at end of file
+# Для тестов/бенчмарков можно направить на локальный фейковый Bot API
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')
+TELEGRAM_API_URL = f"{TELEGRAM_API_BASE}/bot{BOT_TOKEN}/sendMessage"
+# /metrics бота (Prometheus); не задан — сервер метрик не поднимается
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# polling | webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')            # публичный https-адрес, который зовёт Telegram
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')      # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '1'))          # процессов на одном порту
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))  # апдейтов в очереди процесса
+WEBHOOK_CONCURRENCY = int(os.getenv('WEBHOOK_CONCURRENCY', '50'))  # одновременных апдейтов в процессе
+ADMINS = [5455171373, 967720988]
+
+# рассылка (broadcast.py)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))                 # сообщений/с; до лимита 30/с — запас ответам бота
+BROADCAST_BATCH = int(os.getenv('BROADCAST_BATCH', '200'))                # получателей на пачку (= шаг сохранения прогресса)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))     # одновременных отправок
+BROADCAST_LEASE_SECONDS = float(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+BROADCAST_PROGRESS_SECONDS = float(os.getenv('BROADCAST_PROGRESS_SECONDS', '3'))
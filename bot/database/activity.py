@@ -0,0 +1,125 @@
+# bot/database/activity.py
+"""
+users.last_seen_at без записи в БД на каждый апдейт (write-behind).
+
+Апдейт только отмечает отправителя в памяти процесса (dict: последняя отметка
+побеждает). Фоновая задача раз в ACTIVITY_FLUSH_SECONDS пишет накопленное
+пачками — UPDATE ... FROM (VALUES ...) на batch_size пользователей. Буфер
+дорос до max_pending — сброс сразу, не дожидаясь интервала.
+
+last_seen_at отстаёт до интервала сброса; при остановке буфер дописывается,
+при падении процесса теряются отметки последнего интервала.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .engine import AsyncSessionLocal
+from .repository import touch_last_seen
+
+log = logging.getLogger(__name__)
+
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "30"))
+
+
+class LastSeenBuffer:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        *,
+        interval: float = ACTIVITY_FLUSH_SECONDS,
+        max_pending: int = 5000,
+        batch_size: int = 1000,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending: Dict[int, datetime] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._overflow: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.flushes = 0
+        self.written = 0
+
+    def touch(self, telegram_id: int, at: Optional[datetime] = None) -> None:
+        self._pending[int(telegram_id)] = at or datetime.utcnow()
+        self.touches += 1
+        if len(self._pending) >= self.max_pending and (self._overflow is None or self._overflow.done()):
+            self._overflow = asyncio.get_running_loop().create_task(self._flush_logged())
+
+    async def flush(self) -> int:
+        """Записать накопленное; возвращает число отметок. При ошибке отметки возвращаются в буфер."""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            items = sorted(pending.items())      # порядок ключей — меньше шансов на deadlock
+            try:
+                async with self.session_factory() as db:
+                    for i in range(0, len(items), self.batch_size):
+                        await touch_last_seen(db, dict(items[i:i + self.batch_size]))
+                    await db.commit()
+            except BaseException:
+                # не затирая отметки, пришедшие за время записи
+                for telegram_id, at in pending.items():
+                    if telegram_id not in self._pending or self._pending[telegram_id] < at:
+                        self._pending[telegram_id] = at
+                raise
+            self.flushes += 1
+            self.written += len(items)
+            return len(items)
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("last_seen flush failed (%d pending)", len(self._pending))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_logged()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и дописать буфер."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush_logged()
+
+    def stats(self) -> dict:
+        return {
+            "touches": self.touches,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+        }
+
+
+class ActivityMiddleware:
+    """Outer-middleware aiogram на dp.update: отметить отправителя — только в памяти."""
+
+    def __init__(self, buffer: LastSeenBuffer):
+        self.buffer = buffer
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            self.buffer.touch(user.id)
+        return await handler(event, data)
+
+
+last_seen = LastSeenBuffer()
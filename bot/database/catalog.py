@@ -0,0 +1,99 @@
+# bot/database/catalog.py
+"""
+Снимок каталога товаров в памяти процесса.
+
+Товары меняются пару раз в неделю, а читаются на каждое открытие Mini App
+и в каждом заказе. Снимок неизменяемый и перестраивается только после
+сброса: create/update/delete_product в repository сбрасывают его у себя
+и шлют NOTIFY остальным процессам (см. notify.py).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Product
+
+
+class ProductRecord(NamedTuple):
+    id: int
+    name: str
+    price_cents: int
+
+
+class CatalogSnapshot(NamedTuple):
+    products: Tuple[ProductRecord, ...]     # по возрастанию id
+    by_id: Mapping[int, ProductRecord]
+    etag: str                               # строгий ETag, уже в кавычках
+
+    def name_of(self, product_id: int) -> str:
+        """Название товара для экранов; удалённый товар — по номеру."""
+        p = self.by_id.get(product_id)
+        return p.name if p else f"товар #{product_id}"
+
+
+def _build_snapshot(rows) -> CatalogSnapshot:
+    products = tuple(ProductRecord(int(r.id), r.name, int(r.price_cents)) for r in rows)
+    digest = hashlib.sha256(repr(products).encode()).hexdigest()[:32]
+    return CatalogSnapshot(
+        products=products,
+        by_id=MappingProxyType({p.id: p for p in products}),
+        etag=f'"{digest}"',
+    )
+
+
+class ProductCatalog:
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+
+    def invalidate(self, _payload: Optional[str] = None) -> None:
+        """Сбросить снимок. Подходит и как callback для NotifyListener."""
+        self._generation += 1
+        self._snapshot = None
+        self.invalidations += 1
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        snap = self._snapshot
+        if snap is not None:
+            self.hits += 1
+            return snap
+        self.misses += 1
+        async with self._lock:
+            # пока ждали лок, снимок мог собрать другой запрос
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            result = await db.execute(
+                select(Product.id, Product.name, Product.price_cents).order_by(Product.id)
+            )
+            snap = _build_snapshot(result.all())
+            self.rebuilds += 1
+            # сброс во время чтения — снимок мог устареть, отдаём, но не кэшируем
+            if generation == self._generation:
+                self._snapshot = snap
+            return snap
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "invalidations": self.invalidations,
+            "products": len(snap.products) if snap else None,
+            "etag": snap.etag if snap else None,
+        }
+
+
+catalog = ProductCatalog()
@@ -1,12 +1,185 @@
 # database/engine.py
+"""
+Общий engine для API и бота.
 
+Настройки пула — профилем (DB_PROFILE=dev|prod|bench), отдельные значения
+можно переопределить переменными DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT /
+DB_POOL_RECYCLE / DB_STATEMENT_CACHE_SIZE — у API и бота разная нагрузка.
+
+DB_PGBOUNCER=1 — работа через PgBouncer в режиме transaction pooling:
+без кэша prepared statements (соединение сервера меняется между транзакциями)
+и с уникальными именами statement'ов. LISTEN через такой пул не работает —
+слушатель NOTIFY ходит напрямую по DATABASE_DIRECT_URL (если задан).
+"""
 import os
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+from uuid import uuid4
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .querybudget import instrument as instrument_query_budget
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/daim")
+DATABASE_DIRECT_URL = os.getenv("DATABASE_DIRECT_URL")
+
+
+class EngineProfile(NamedTuple):
+    echo: bool
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float         # сек. ожидания свободного соединения
+    pool_pre_ping: bool
+    pool_recycle: int           # сек.; -1 — не пересоздавать
+    statement_cache_size: int   # prepared statements asyncpg на соединение
+
+
+PROFILES = {
+    # локально: видно SQL, маленький пул
+    "dev": EngineProfile(echo=True, pool_size=5, max_overflow=5, pool_timeout=30,
+                         pool_pre_ping=True, pool_recycle=1800, statement_cache_size=100),
+    # прод: без echo, ожидание соединения короткое — лучше быстрая ошибка, чем очередь
+    "prod": EngineProfile(echo=False, pool_size=10, max_overflow=10, pool_timeout=5,
+                          pool_pre_ping=True, pool_recycle=1800, statement_cache_size=500),
+    # бенчмарки: фиксированный пул без overflow и без лишних ping'ов
+    "bench": EngineProfile(echo=False, pool_size=20, max_overflow=0, pool_timeout=30,
+                           pool_pre_ping=False, pool_recycle=-1, statement_cache_size=500),
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "prod")
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def load_profile(name: str = DB_PROFILE, pgbouncer: bool = DB_PGBOUNCER) -> EngineProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}, expected one of {sorted(PROFILES)}")
+    base = PROFILES[name]
+    profile = base._replace(
+        pool_size=_env_int("DB_POOL_SIZE", base.pool_size),
+        max_overflow=_env_int("DB_MAX_OVERFLOW", base.max_overflow),
+        pool_timeout=_env_float("DB_POOL_TIMEOUT", base.pool_timeout),
+        pool_recycle=_env_int("DB_POOL_RECYCLE", base.pool_recycle),
+        statement_cache_size=_env_int("DB_STATEMENT_CACHE_SIZE", base.statement_cache_size),
+    )
+    if pgbouncer:
+        profile = profile._replace(statement_cache_size=0)
+    return profile
+
+
+# ---- метрики пула ----
+
+class PoolStats:
+    """Ожидание соединения из пула: сколько раз ждали, сколько, сколько раз не дождались."""
+
+    def __init__(self, maxlen: int = 2048):
+        self.checkouts = 0
+        self.timeouts = 0
+        self._waits: deque[float] = deque(maxlen=maxlen)
+
+    def record(self, waited: float) -> None:
+        self.checkouts += 1
+        self._waits.append(waited)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2)
+
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p95": pct(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 2) if waits else None,
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который меряет ожидание соединения (включая открытие нового)."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def make_engine(url: str = DATABASE_URL, profile: Optional[EngineProfile] = None, pgbouncer: bool = DB_PGBOUNCER):
+    profile = profile or load_profile(pgbouncer=pgbouncer)
+    connect_args = {
+        # кэш prepared statements SQLAlchemy-обёртки (DBAPI-аргумент) и самого asyncpg
+        "prepared_statement_cache_size": profile.statement_cache_size,
+        "statement_cache_size": profile.statement_cache_size,
+    }
+    if pgbouncer:
+        # имена prepared statements не должны пересекаться между клиентами одного серверного соединения
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    new_engine = create_async_engine(
+        url,
+        echo=profile.echo,
+        poolclass=TimedQueuePool,
+        pool_size=profile.pool_size,
+        max_overflow=profile.max_overflow,
+        pool_timeout=profile.pool_timeout,
+        pool_pre_ping=profile.pool_pre_ping,
+        pool_recycle=profile.pool_recycle,
+        connect_args=connect_args,
+    )
+    new_engine.pool.stats = PoolStats()
+    instrument_query_budget(new_engine)     # no-op при QUERY_BUDGET=off
+    return new_engine
+
+
+profile = load_profile()
+engine = make_engine(profile=profile)
+
+# LISTEN/NOTIFY требует постоянного серверного соединения — мимо PgBouncer
+listen_engine = (
+    make_engine(DATABASE_DIRECT_URL, profile._replace(pool_size=1, max_overflow=0), pgbouncer=False)
+    if DB_PGBOUNCER and DATABASE_DIRECT_URL else engine
+)
+
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        "profile": DB_PROFILE,
+        "pgbouncer": DB_PGBOUNCER,
+        "pool_size": pool.size(),
+        "max_overflow": profile.max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),    # у QueuePool отрицателен, пока пул не заполнен
+        **pool.stats.snapshot(),
+    }
 
-engine = create_async_engine(DATABASE_URL, echo=True)
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -16,4 +189,4 @@ AsyncSessionLocal = async_sessionmaker(
 
 async def get_async_session():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -0,0 +1,168 @@
+# database/fsm.py
+"""
+FSM-хранилище aiogram в Postgres (таблица fsm_states).
+
+Состояние диалога переживает перезапуск и видно всем процессам бота — апдейты
+одного админа могут попадать в разные воркеры webhook.
+
+Чтение — из кэша процесса (LRU, в том числе "состояния нет": большинство
+апдейтов приходит от пользователей вне диалога), промах — один SELECT.
+Запись — сразу в БД (write-through) и NOTIFY в той же транзакции: остальные
+процессы сбрасывают ключ у себя. Состояние, не менявшееся дольше ttl,
+считается пустым; такие строки время от времени удаляются при записи.
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+from uuid import uuid4
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .engine import AsyncSessionLocal
+from .models import FsmState
+from .notify import notify
+
+FSM_CHANNEL = "daim_fsm"
+FSM_TTL = timedelta(hours=int(os.getenv("FSM_TTL_HOURS", "24")))
+
+
+class _Entry(NamedTuple):
+    state: Optional[str]
+    data: Dict[str, Any]
+    expires_at: float       # monotonic: дальше — перечитать из БД
+
+
+class PostgresStorage(BaseStorage):
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        *,
+        ttl: timedelta = FSM_TTL,
+        cache_size: int = 10_000,
+        cache_ttl: float = 300.0,
+        purge_interval: float = 600.0,
+    ):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.cache_size = cache_size
+        # страховка на случай потерянного NOTIFY; обычно ключ сбрасывается сигналом
+        self.cache_ttl = cache_ttl
+        self.purge_interval = purge_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._generation = 0
+        self._last_purge = 0.0
+        # свои же NOTIFY пропускаем: кэш уже обновлён при записи
+        self._origin = uuid4().hex[:12]
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # ---- кэш ----
+
+    def _remember(self, key: str, state: Optional[str], data: Dict[str, Any], updated_at: Optional[datetime]) -> None:
+        now = time.monotonic()
+        expires_at = now + self.cache_ttl
+        if updated_at is not None:
+            # не держать в кэше дольше, чем живёт само состояние
+            left = (updated_at + self.ttl - datetime.utcnow()).total_seconds()
+            expires_at = min(expires_at, now + max(0.0, left))
+        self._cache[key] = _Entry(state, data, expires_at)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, payload: Optional[str] = None) -> None:
+        """Callback для NotifyListener: payload "<origin>|<key>"; None — сбросить всё."""
+        self._generation += 1
+        if payload is None:
+            self._cache.clear()
+            return
+        origin, _, key = payload.partition("|")
+        if origin != self._origin:
+            self._cache.pop(key, None)
+
+    async def _load(self, key: str) -> _Entry:
+        entry = self._cache.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry
+        self.misses += 1
+        generation = self._generation
+        async with self.session_factory() as db:
+            row = (await db.execute(
+                select(FsmState.state, FsmState.data, FsmState.updated_at).where(
+                    FsmState.key == key,
+                    FsmState.updated_at > datetime.utcnow() - self.ttl,
+                )
+            )).first()
+        state, data, updated_at = row if row is not None else (None, {}, None)
+        # сброс во время чтения — результат мог устареть, не кэшируем
+        if generation == self._generation:
+            self._remember(key, state, data, updated_at)
+        return _Entry(state, data, 0.0)
+
+    # ---- запись ----
+
+    async def _write(self, key: str, state: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            if state is None and not data:
+                await db.execute(delete(FsmState).where(FsmState.key == key))
+            else:
+                stmt = pg_insert(FsmState).values(key=key, state=state, data=data, updated_at=now)
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[FsmState.key],
+                    set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": now},
+                ))
+            await self._maybe_purge(db)
+            await notify(db, FSM_CHANNEL, f"{self._origin}|{key}")
+            await db.commit()
+        self.writes += 1
+        self._remember(key, state, data, now)
+        return data
+
+    async def _maybe_purge(self, db: AsyncSession) -> None:
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        await db.execute(delete(FsmState).where(FsmState.updated_at <= datetime.utcnow() - self.ttl))
+
+    # ---- BaseStorage ----
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        entry = await self._load(k)
+        await self._write(k, state.state if isinstance(state, State) else state, entry.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        entry = await self._load(k)
+        await self._write(k, entry.state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(self.key_builder.build(key))).data)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        k = self.key_builder.build(key)
+        entry = await self._load(k)
+        return dict(await self._write(k, entry.state, {**entry.data, **data}))
+
+    async def close(self) -> None:
+        # engine общий — закрывает его владелец
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "cached": len(self._cache)}
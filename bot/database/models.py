@@ -4,9 +4,10 @@ from datetime import datetime
 from enum import Enum
 
 from sqlalchemy import (
-    Column, Integer, String, DateTime, Boolean, ForeignKey, BigInteger,
-    Enum as SAEnum
+    Column, Integer, String, DateTime, Date, Boolean, ForeignKey, BigInteger,
+    Enum as SAEnum, Index, DDL, event,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -20,20 +21,39 @@ class OrderStatus(str, Enum):
     completed = "completed"       # доставлен / завершён
 
 
+# -------- Статусы рассылки --------
+class BroadcastStatus(str, Enum):
+    running = "running"           # идёт (или ждёт, пока её подхватит процесс бота)
+    done = "done"                 # разослана всем
+    cancelled = "cancelled"       # остановлена админом
+
+
 class User(Base):
     __tablename__ = 'users'
+    # список пользователей в админке и API — keyset по (created_at, id), новые сначала
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, index=True, nullable=False)
     phone = Column(String)
     name = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-
+    # пишется пачками из буфера (activity.py) — отстаёт до интервала сброса
+    last_seen_at = Column(DateTime, nullable=True)
+    # бот заблокирован пользователем (403 при рассылке); сбрасывается при его активности
+    blocked_at = Column(DateTime, nullable=True)
+
+    # Связи "вверх" и вся история заказов не грузятся неявно: раньше загрузка
+    # одного заказа тянула пользователя, все его заказы и их позиции.
+    # raise_on_sql — попадание в identity map разрешено, скрытый SELECT — ошибка.
+    # Нужное подгружается явно (selectinload) или берётся проекциями (projections.py).
     orders = relationship(
         'Order',
         back_populates='user',
         cascade="save-update",
-        lazy="selectin",   # масштабируется лучше, чем joined, когда у юзера много заказов
+        lazy="raise_on_sql",
     )
 
 
@@ -48,10 +68,22 @@ class Product(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # списки заказов отсортированы по (date, id) от новых (keyset, stream): индекс
+        # отдаёт строки уже в этом порядке — с фильтром по клиенту, статусу или без него
+        Index("ix_orders_telegram_id_date", "telegram_id", "date", "id"),
+        Index("ix_orders_status_date", "status", "date", "id"),
+        Index("ix_orders_date_id", "date", "id"),
+        # поиск по адресу/телефону: ILIKE '%q%' и word similarity через триграммы
+        Index("ix_orders_address_trgm", "address",
+              postgresql_using="gin", postgresql_ops={"address": "gin_trgm_ops"}),
+        Index("ix_orders_phone_trgm", "phone",
+              postgresql_using="gin", postgresql_ops={"phone": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(BigInteger, nullable=False, index=True)
-    date = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    date = Column(DateTime, default=datetime.utcnow, nullable=False)
     address = Column(String, nullable=False)
     phone = Column(String, nullable=False)
 
@@ -59,8 +91,9 @@ class Order(Base):
     is_paid = Column(Boolean, default=False, nullable=False)
 
     # 🔧 Исправлено: тип FK теперь Integer, как и users.id
-    user_id = Column(Integer, ForeignKey('users.id', ondelete="SET NULL"), nullable=True)
-    user = relationship('User', back_populates='orders', lazy="selectin")
+    # индекс — для заказов пользователя и ON DELETE SET NULL при удалении пользователя
+    user_id = Column(Integer, ForeignKey('users.id', ondelete="SET NULL"), nullable=True, index=True)
+    user = relationship('User', back_populates='orders', lazy="raise_on_sql")
 
     # 🔥 Новый статус (ENUM на уровне БД)
     status = Column(
@@ -77,6 +110,10 @@ class Order(Base):
     )
 
 
+# для create_all (bench, локальные базы); в миграциях расширение ставится явно
+event.listen(Order.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -88,5 +125,93 @@ class OrderItem(Base):
     unit_price_cents = Column(Integer, nullable=False)  # цена за 1 на момент заказа
     line_total_cents = Column(Integer, nullable=False)  # quantity * unit_price_cents
 
-    order = relationship("Order", back_populates="items", lazy="selectin")
+    order = relationship("Order", back_populates="items", lazy="raise_on_sql")
     product = relationship("Product", lazy="selectin")
+
+
+class UserBottleTotal(Base):
+    """Накопительный счётчик оплаченных бутылок (для ценовых уровней).
+
+    Поддерживается в той же транзакции, что и смена is_paid у заказа,
+    поэтому выбор уровня цены — чтение одной строки вместо SUM по истории.
+    """
+    __tablename__ = "user_bottle_totals"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    paid_bottles = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class PriceTier(Base):
+    """Ценовой уровень накопительной системы: от min_bottles бутылок — price_cents за бутылку.
+
+    Уровень действует до min_bottles следующего; последний — без верхней границы.
+    Читается снимком в памяти (pricing.py), меняется replace_price_tiers.
+    """
+    __tablename__ = "price_tiers"
+
+    min_bottles = Column(Integer, primary_key=True)
+    price_cents = Column(Integer, nullable=False)
+
+
+class SalesDaily(Base):
+    """Дневная сводка продаж: день (UTC) × товар × статус × оплата.
+
+    product_id = 0 — заказ целиком: orders — число заказов, revenue_cents — по
+    total_price_cents. У строк товара orders — заказы с этим товаром, bottles и
+    revenue_cents — по его позициям. Поддерживается в той же транзакции, что и
+    создание / оплата / смена статуса / удаление заказа (repository.apply_sales_deltas),
+    поэтому отчёт за период — чтение дней × товаров строк, а не агрегат по заказам.
+    """
+    __tablename__ = "sales_daily"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)      # без FK: 0 — заказ целиком
+    status = Column(SAEnum(OrderStatus, name="order_status", create_constraint=True), primary_key=True)
+    is_paid = Column(Boolean, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    bottles = Column(Integer, nullable=False, default=0)
+    revenue_cents = Column(BigInteger, nullable=False, default=0)
+
+
+class Broadcast(Base):
+    """
+    Рассылка всем пользователям бота (broadcast.py).
+
+    Получатели идут по users.id (keyset); после каждой пачки сохраняются курсор
+    и счётчики — после падения процесса рассылка продолжается с курсора.
+    Ведёт её один процесс: locked_until — аренда, продлевается при сохранении
+    прогресса; истекла — рассылку подхватит любой процесс бота.
+    """
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True)
+    text = Column(String, nullable=False)                   # HTML
+    status = Column(SAEnum(BroadcastStatus, name="broadcast_status"), nullable=False,
+                    default=BroadcastStatus.running)
+    created_by = Column(BigInteger, nullable=False)         # telegram_id админа
+    # сообщение с прогрессом в чате админа
+    progress_chat_id = Column(BigInteger, nullable=False)
+    progress_message_id = Column(Integer, nullable=True)
+    cursor_user_id = Column(Integer, nullable=False, default=0)   # users.id последнего обработанного
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class FsmState(Base):
+    """Состояние FSM aiogram (диалоги админки и т.п.) — общее для всех процессов бота.
+
+    key — ключ StorageKey (бот, чат, пользователь, ...), см. database/fsm.py.
+    Строки старше TTL считаются пустыми и периодически удаляются.
+    """
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, default=dict)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
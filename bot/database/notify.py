@@ -0,0 +1,109 @@
+# bot/database/notify.py
+"""
+Межпроцессные сигналы через Postgres LISTEN/NOTIFY.
+
+API и бот — разные процессы, а кэши (каталог и т.п.) живут в памяти каждого.
+Мутации шлют NOTIFY в своей транзакции (доставляется только после COMMIT),
+слушатель в каждом процессе сбрасывает свой кэш.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, AsyncConnection
+
+log = logging.getLogger(__name__)
+
+CATALOG_CHANNEL = "daim_catalog"
+
+# callback(payload). payload=None — соединение переподключилось и сигналы
+# могли потеряться: подписчик должен сбросить всё целиком.
+Callback = Callable[[Optional[str]], None]
+
+
+async def notify(db: AsyncSession, channel: str, payload: str = "") -> None:
+    """NOTIFY в текущей транзакции сессии. Без commit."""
+    await db.execute(select(func.pg_notify(channel, payload)))
+
+
+class NotifyListener:
+    """Держит одно соединение с LISTEN на все подписанные каналы и переподключается при обрыве."""
+
+    def __init__(self, check_interval: float = 5.0):
+        self._subs: Dict[str, List[Callback]] = {}
+        self._check_interval = check_interval
+        self._engine: Optional[AsyncEngine] = None
+        self._conn: Optional[AsyncConnection] = None
+        self._driver = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, callback: Callback) -> None:
+        callbacks = self._subs.setdefault(channel, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def _dispatch(self, _conn, _pid, channel: str, payload: str) -> None:
+        for cb in self._subs.get(channel, ()):
+            try:
+                cb(payload)
+            except Exception:
+                log.exception("notify callback failed on %s", channel)
+
+    def _resync(self) -> None:
+        for channel, callbacks in self._subs.items():
+            for cb in callbacks:
+                try:
+                    cb(None)
+                except Exception:
+                    log.exception("notify resync failed on %s", channel)
+
+    async def _connect(self) -> None:
+        self._conn = await self._engine.connect()
+        raw = await self._conn.get_raw_connection()
+        self._driver = raw.driver_connection  # asyncpg.Connection
+        for channel in self._subs:
+            await self._driver.add_listener(channel, self._dispatch)
+
+    def _is_alive(self) -> bool:
+        return self._driver is not None and not self._driver.is_closed()
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._check_interval)
+            if self._is_alive():
+                continue
+            try:
+                await self._close_conn()
+                await self._connect()
+                self._resync()
+                log.warning("notify listener reconnected")
+            except Exception:
+                log.exception("notify listener reconnect failed")
+
+    async def start(self, engine: AsyncEngine) -> None:
+        if self._task is not None or not self._subs:
+            return
+        self._engine = engine
+        await self._connect()
+        self._task = asyncio.create_task(self._watch())
+
+    async def _close_conn(self) -> None:
+        self._driver = None
+        if self._conn is not None:
+            try:
+                await self._conn.invalidate()
+            except Exception:
+                pass
+            self._conn = None
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._close_conn()
+
+
+listener = NotifyListener()
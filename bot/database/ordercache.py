@@ -0,0 +1,170 @@
+# bot/database/ordercache.py
+"""
+Кэш ответов «история заказов клиента» (GET /orders/users/{telegram_id}) в памяти процесса.
+
+Mini App опрашивает этот роут постоянно, а заказы клиента меняются редко.
+Ключ — (telegram_id, фильтры...), значение — готовое тело ответа (bytes) и
+etag снимка каталога, по которому оно собрано (товар переименовали — запись
+не годится). У каждого клиента своя версия: запись заказа клиента
+(insert_order_returning, bulk_insert_orders, update_order, delete_order)
+или его профиля поднимает версию после COMMIT и выбрасывает все его записи,
+сколько бы комбинаций фильтров ни было закэшировано. Чтение, начатое до
+подъёма версии, свой результат в кэш не кладёт.
+
+Другие процессы (воркеры uvicorn, бот) узнают о записи через NOTIFY на
+ORDERS_CHANNEL: сигнал — pg_notify в RETURNING / CTE того же statement'а,
+без отдельного запроса (см. signal). Имя пользователя, обновлённое при /start
+(upsert_user без NOTIFY), другие процессы увидят по истечении ttl.
+
+Память ограничена числом записей и суммарным размером тел (LRU).
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import String, cast, event, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+ORDERS_CHANNEL = "daim_orders"
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "5000"))
+ORDER_CACHE_BYTES = int(os.getenv("ORDER_CACHE_BYTES", str(64 * 2**20)))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "120"))
+
+# session.info: (кэш, telegram_id), чьи заказы изменены в транзакции сессии
+_WRITTEN = "order_cache_written"
+
+# ключ: (telegram_id, фильтры...)
+Key = Tuple[Hashable, ...]
+Version = Tuple[int, int]
+
+
+class _Entry(NamedTuple):
+    body: bytes
+    catalog_etag: str
+    expires_at: float           # monotonic
+
+
+def signal(telegram_id):
+    """pg_notify(ORDERS_CHANNEL, telegram_id) — выражение для RETURNING / CTE пишущего statement'а."""
+    return func.pg_notify(ORDERS_CHANNEL, cast(telegram_id, String))
+
+
+class OrderHistoryCache:
+    def __init__(self, maxsize: int = ORDER_CACHE_SIZE, max_bytes: int = ORDER_CACHE_BYTES,
+                 ttl: float = ORDER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        # одна длинная история не должна вытеснять сотню обычных
+        self.max_entry_bytes = max_bytes // 16
+        self.ttl = ttl
+        self._entries: OrderedDict[Key, _Entry] = OrderedDict()
+        self._keys: Dict[int, Set[Key]] = {}
+        self._bytes = 0
+        # версии — у клиентов, чьи заказы менялись; разрослись — сброс всех
+        # версий со сменой эпохи (незавершённые чтения тогда не кэшируются)
+        self._versions: Dict[int, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.stale_fills = 0
+
+    # ---- сброс ----
+
+    def invalidate(self, payload: Optional[str] = None) -> None:
+        """Callback для NotifyListener: payload — telegram_id; None — сбросить всё."""
+        self.invalidations += 1
+        if payload is None:
+            self._epoch += 1
+            self._versions.clear()
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+        elif payload:
+            self._bump(int(payload))
+
+    def changed(self, db: AsyncSession, telegram_id: int) -> None:
+        """Заказы клиента изменены в транзакции db: версия поднимется после COMMIT, до него сессия читает мимо кэша."""
+        db.info.setdefault(_WRITTEN, set()).add((self, int(telegram_id)))
+
+    def _bump(self, telegram_id: int) -> None:
+        self._versions[telegram_id] = self._versions.get(telegram_id, 0) + 1
+        for key in self._keys.pop(telegram_id, ()):
+            self._bytes -= len(self._entries.pop(key).body)
+        if len(self._versions) > 4 * self.maxsize:
+            self._epoch += 1
+            self._versions.clear()
+
+    # ---- чтение ----
+
+    def version(self, telegram_id: int) -> Version:
+        """Взять до чтения из БД и передать в put: запись в это время — результат не кэшируется."""
+        return self._epoch, self._versions.get(int(telegram_id), 0)
+
+    def get(self, db: AsyncSession, key: Key, catalog_etag: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if (entry is None or entry.catalog_etag != catalog_etag or entry.expires_at <= time.monotonic()
+                or (self, key[0]) in db.info.get(_WRITTEN, ())):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry.body
+
+    def put(self, key: Key, version: Version, body: bytes, catalog_etag: str) -> None:
+        telegram_id = key[0]
+        if self.maxsize <= 0 or len(body) > self.max_entry_bytes:
+            return
+        if version != self.version(telegram_id):
+            self.stale_fills += 1
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+        self._entries[key] = _Entry(body, catalog_etag, time.monotonic() + self.ttl)
+        self._keys.setdefault(telegram_id, set()).add(key)
+        self._bytes += len(body)
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        key, entry = self._entries.popitem(last=False)
+        self._bytes -= len(entry.body)
+        keys = self._keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys[key[0]]
+        self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "stale_fills": self.stale_fills,
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "users": len(self._keys),
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    for cache, telegram_id in session.info.pop(_WRITTEN, ()):
+        cache._bump(telegram_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session: Session, _previous_transaction) -> None:
+    session.info.pop(_WRITTEN, None)
+
+
+order_cache = OrderHistoryCache()
@@ -0,0 +1,161 @@
+# bot/database/pricing.py
+"""
+Снимок ценовых уровней (накопительная система) в памяти процесса.
+
+Цена за бутылку зависит от числа оплаченных бутылок пользователя вместе с
+новым заказом. Уровни лежат в price_tiers и меняются редко, а цена нужна
+в каждом заказе и в каждом расчёте (POST /orders/quote). Снимок неизменяемый,
+уровень ищется bisect по нижним границам. Перестраивается только после сброса:
+replace_price_tiers в repository сбрасывает его у себя и шлёт NOTIFY остальным
+процессам (см. notify.py).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from bisect import bisect_right
+from typing import Iterable, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import PriceTier
+
+PRICING_CHANNEL = "daim_pricing"
+
+# пустая price_tiers (база из create_all) — уровни, что были в api/orders/routes.py
+DEFAULT_TIERS = ((1, 250), (20, 250), (100, 240), (500, 220), (1000, 200), (2000, 180))
+
+
+class PriceTierRecord(NamedTuple):
+    min_bottles: int
+    price_cents: int
+
+
+class QuoteLine(NamedTuple):
+    product_id: int
+    quantity: int
+    unit_price_cents: int
+    line_total_cents: int
+
+
+class Quote(NamedTuple):
+    past_bottles: int                   # оплаченные раньше
+    bottles: int                        # в этом заказе
+    unit_price_cents: int
+    lines: Tuple[QuoteLine, ...]
+    total_price_cents: int
+    next_tier: Optional[PriceTierRecord]
+
+    @property
+    def total_bottles(self) -> int:
+        return self.past_bottles + self.bottles
+
+
+class PricingSnapshot(NamedTuple):
+    tiers: Tuple[PriceTierRecord, ...]  # по возрастанию min_bottles
+    bounds: Tuple[int, ...]             # min_bottles уровней — для bisect
+    version: str
+
+    def price_for(self, total_bottles: int) -> int:
+        """Цена за бутылку при total_bottles накопленных (с новым заказом); ниже первого уровня — первый."""
+        i = bisect_right(self.bounds, total_bottles) - 1
+        return self.tiers[max(i, 0)].price_cents
+
+    def next_tier(self, total_bottles: int) -> Optional[PriceTierRecord]:
+        """Ближайший уровень дешевле текущего — «ещё N бутылок, и цена ниже»; None — дешевле некуда."""
+        price = self.price_for(total_bottles)
+        for tier in self.tiers[bisect_right(self.bounds, total_bottles):]:
+            if tier.price_cents < price:
+                return tier
+        return None
+
+    def quote(self, past_bottles: int, items: Iterable[Tuple[int, int]]) -> Quote:
+        """Расчёт заказа: items — (product_id, quantity); цена одна на все позиции."""
+        items = tuple(items)
+        bottles = sum(q for _, q in items)
+        total = past_bottles + bottles
+        price = self.price_for(total)
+        return Quote(
+            past_bottles=past_bottles,
+            bottles=bottles,
+            unit_price_cents=price,
+            lines=tuple(QuoteLine(pid, q, price, price * q) for pid, q in items),
+            total_price_cents=price * bottles,
+            next_tier=self.next_tier(total),
+        )
+
+
+def normalize_tiers(tiers: Iterable[Tuple[int, int]]) -> Tuple[PriceTierRecord, ...]:
+    """Проверить и отсортировать уровни (min_bottles, price_cents). На мусор — ValueError."""
+    records = tuple(sorted(PriceTierRecord(int(m), int(p)) for m, p in tiers))
+    if not records:
+        raise ValueError("Нужен хотя бы один ценовой уровень")
+    if records[0].min_bottles < 0 or any(r.price_cents <= 0 for r in records):
+        raise ValueError("Границы — не меньше 0, цены — больше 0")
+    bounds = [r.min_bottles for r in records]
+    if len(set(bounds)) != len(bounds):
+        raise ValueError("Границы уровней повторяются")
+    return records
+
+
+def _build_snapshot(tiers: Sequence[Tuple[int, int]]) -> PricingSnapshot:
+    records = normalize_tiers(tiers or DEFAULT_TIERS)
+    digest = hashlib.sha256(repr(records).encode()).hexdigest()[:16]
+    return PricingSnapshot(
+        tiers=records,
+        bounds=tuple(r.min_bottles for r in records),
+        version=digest,
+    )
+
+
+class PricingEngine:
+    def __init__(self):
+        self._snapshot: Optional[PricingSnapshot] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+
+    def invalidate(self, _payload: Optional[str] = None) -> None:
+        """Сбросить снимок. Подходит и как callback для NotifyListener."""
+        self._generation += 1
+        self._snapshot = None
+        self.invalidations += 1
+
+    async def get(self, db: AsyncSession) -> PricingSnapshot:
+        snap = self._snapshot
+        if snap is not None:
+            self.hits += 1
+            return snap
+        self.misses += 1
+        async with self._lock:
+            # пока ждали лок, снимок мог собрать другой запрос
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            result = await db.execute(
+                select(PriceTier.min_bottles, PriceTier.price_cents).order_by(PriceTier.min_bottles)
+            )
+            snap = _build_snapshot([tuple(r) for r in result.all()])
+            self.rebuilds += 1
+            # сброс во время чтения — снимок мог устареть, отдаём, но не кэшируем
+            if generation == self._generation:
+                self._snapshot = snap
+            return snap
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "invalidations": self.invalidations,
+            "tiers": len(snap.tiers) if snap else None,
+            "version": snap.version if snap else None,
+        }
+
+
+pricing = PricingEngine()
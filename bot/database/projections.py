@@ -0,0 +1,71 @@
+# bot/database/projections.py
+"""
+Лёгкие строки-результаты (NamedTuple) вместо ORM-объектов.
+
+Собираются из column-only SELECT / RETURNING: не попадают в identity map,
+не тянут selectin-связи и занимают в разы меньше памяти, чем User/Order.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Tuple
+
+
+class UserRow(NamedTuple):
+    id: int
+    telegram_id: int
+    name: Optional[str]
+    phone: Optional[str]
+    created_at: datetime
+
+
+class OrderItemRow(NamedTuple):
+    id: int
+    order_id: int
+    product_id: int
+    quantity: int
+    unit_price_cents: int
+    line_total_cents: int
+
+
+class OrderRow(NamedTuple):
+    id: int
+    telegram_id: int
+    user_id: Optional[int]
+    date: datetime
+    address: str
+    phone: str
+    is_paid: bool
+    total_price_cents: int
+    status: str                 # OrderStatus (str-enum)
+    items: Tuple[OrderItemRow, ...] = ()
+
+
+class SalesRow(NamedTuple):
+    """Строка отчёта по sales_daily: key — день / товар / статус, по чему группировали."""
+    key: Any
+    orders: int
+    paid_orders: int
+    bottles: int
+    revenue_cents: int
+    paid_revenue_cents: int
+
+    @property
+    def unpaid_orders(self) -> int:
+        return self.orders - self.paid_orders
+
+
+class BroadcastRow(NamedTuple):
+    id: int
+    text: str
+    status: str                 # BroadcastStatus (str-enum)
+    created_by: int
+    progress_chat_id: int
+    progress_message_id: Optional[int]
+    cursor_user_id: int
+    total: int
+    sent: int
+    failed: int
+    blocked: int
+    created_at: datetime
+    finished_at: Optional[datetime]
@@ -0,0 +1,223 @@
+# database/querybudget.py
+"""
+Бюджет SQL-запросов и детектор N+1 — для тестов и отладки.
+
+QUERY_BUDGET=off|warn|raise (по умолчанию off — ничего не подключается,
+декораторы только помечают функцию). Переменная читается при импорте,
+поэтому в тестах её нужно выставить до импорта приложения.
+
+  * @budget(n) — не больше n запросов за вызов функции репозитория или роута
+    (для async-генераторов — за каждую выдаваемую пачку);
+  * count_queries() — контекст, в котором записываются все statement'ы
+    (вложенные контексты видят и свои, и запросы внутренних вызовов);
+  * QueryBudgetMiddleware / HandlerQueryMiddleware — журнал на HTTP-запрос
+    и на хендлер бота, повторяющиеся statement'ы одной формы (N+1) — в лог.
+
+Запрос = одно выполнение statement'а: пачки insertmanyvalues одного
+executemany считаются одним запросом.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("querybudget")
+
+QUERY_BUDGET = os.getenv("QUERY_BUDGET", "off")
+if QUERY_BUDGET not in ("off", "warn", "raise"):
+    raise ValueError(f"QUERY_BUDGET must be off|warn|raise, got {QUERY_BUDGET!r}")
+
+# столько одинаковых по форме statement'ов в одном журнале — уже N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+
+def enabled() -> bool:
+    return QUERY_BUDGET != "off"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Функция/роут выполнили больше запросов, чем объявлено в @budget."""
+
+
+# ---- форма statement'а ----
+
+_PARAM = re.compile(r"\$\d+(?:::[A-Z]+(?: WITH(?:OUT)? TIME ZONE)?(?:\[\])?)?|%\(\w+\)s|\?")
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_ROW_LIST = re.compile(r"\(\?(?:\.\.\.)?\)(?:\s*,\s*\(\?(?:\.\.\.)?\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(sql: str) -> str:
+    """SQL без значений: параметры -> ?, IN-списки и VALUES любой длины -> одна форма."""
+    shape = _SPACE.sub(" ", sql).strip()
+    shape = _PARAM.sub("?", shape)
+    shape = _PARAM_LIST.sub("?...", shape)
+    return _ROW_LIST.sub("(?...)...", shape)
+
+
+# ---- журнал запросов ----
+
+class QueryLog:
+    def __init__(self, name: str = "", parent: Optional["QueryLog"] = None):
+        self.name = name
+        self.parent = parent
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Формы, выполненные threshold раз и больше, — кандидаты в N+1."""
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+    def report(self) -> str:
+        """Все statement'ы журнала по порядку, одинаковые формы — свёрнуты."""
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        lines = [f"{self.name or 'queries'}: {self.count}"]
+        lines += [f"  {n}x {shape[:160]}" for shape, n in shapes.items()]
+        return "\n".join(lines)
+
+
+_current: contextvars.ContextVar[Optional[QueryLog]] = contextvars.ContextVar("query_log", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _current.get()
+    if log is None:
+        return
+    # insertmanyvalues режет один executemany на пачки с тем же контекстом
+    if context is not None:
+        if getattr(context, "_budget_counted", False):
+            return
+        context._budget_counted = True
+    while log is not None:
+        log.statements.append(statement)
+        log = log.parent
+
+
+def instrument(engine) -> None:
+    """Подписать журнал на события engine. При QUERY_BUDGET=off — ничего."""
+    if not enabled():
+        return
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+def _fail(message: str, mode: str) -> None:
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def _warn_n_plus_one(log: QueryLog) -> None:
+    for shape, n in log.repeated():
+        logger.warning("possible N+1 in %s: %d x %s", log.name or "block", n, shape[:200])
+
+
+@contextmanager
+def count_queries(name: str = "", budget: Optional[int] = None, mode: Optional[str] = None) -> Iterator[QueryLog]:
+    """
+    Записывает statement'ы внутри блока:
+
+        with count_queries("orders list", budget=3) as log:
+            ...
+        assert log.count <= 3
+
+    budget — проверить на выходе (mode: warn/raise, по умолчанию QUERY_BUDGET;
+    при off считает, но не проверяет). Работает только на engine после instrument().
+    """
+    log = QueryLog(name, _current.get())
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+    mode = mode or QUERY_BUDGET
+    if budget is not None and log.count > budget and mode != "off":
+        _fail(f"budget {budget} exceeded\n{log.report()}", mode)
+
+
+def budget(n: int):
+    """
+    Объявить бюджет запросов функции (async или async-генератора).
+    Бюджет виден всегда (func.__query_budget__), проверка — только при QUERY_BUDGET != off.
+    """
+    def decorate(func):
+        func.__query_budget__ = n
+        if not enabled():
+            return func
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                agen = func(*args, **kwargs)
+                try:
+                    while True:
+                        with count_queries(name, budget=n):
+                            try:
+                                item = await agen.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield item
+                finally:
+                    await agen.aclose()
+            return gen_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with count_queries(name, budget=n):
+                return await func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+# ---- журнал на HTTP-запрос / хендлер бота ----
+
+class QueryBudgetMiddleware:
+    """ASGI: журнал на весь запрос (включая тело StreamingResponse), N+1 — в лог."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with count_queries(f"{scope['method']} {scope['path']}") as log:
+            await self.app(scope, receive, send)
+        _warn_n_plus_one(log)
+
+
+class HandlerQueryMiddleware:
+    """Inner-middleware aiogram: журнал на хендлер, N+1 — в лог; бюджет — из @budget хендлера."""
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get("handler"), "callback", None)
+        name = getattr(callback, "__qualname__", "handler")
+        with count_queries(name, budget=getattr(callback, "__query_budget__", None)) as log:
+            result = await handler(event, data)
+        _warn_n_plus_one(log)
+        return result
+
+
+def instrument_dispatcher(dp) -> None:
+    """Повесить HandlerQueryMiddleware на все типы событий диспетчера. При QUERY_BUDGET=off — ничего."""
+    if not enabled():
+        return
+    for event_name, observer in dp.observers.items():
+        if event_name in ("update", "error"):
+            continue
+        observer.middleware(HandlerQueryMiddleware())
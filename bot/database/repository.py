@@ -1,16 +1,40 @@
 # bot/database/repository.py
 from __future__ import annotations
 
-from typing import List, Optional, Iterable, Tuple
+import base64
+import time
+from enum import Enum
+from typing import (
+    List, Optional, Iterable, Tuple, NamedTuple, Any, Dict, Mapping, Sequence, AsyncIterator,
+)
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import (
+    select, func, update, insert, delete, text, and_, tuple_, values, column, literal, literal_column, true,
+    Integer, BigInteger, DateTime, or_, case,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
-from .models import User, Order, OrderItem, Product
+from .models import (
+    User, Order, OrderItem, Product, UserBottleTotal, PriceTier, SalesDaily, Broadcast, OrderStatus,
+    BroadcastStatus,
+)
+from .projections import UserRow, OrderRow, OrderItemRow, SalesRow, BroadcastRow
+from .catalog import catalog
+from .pricing import pricing, normalize_tiers, PriceTierRecord, PRICING_CHANNEL
+from .usercache import user_cache, USER_CHANNEL
+from .ordercache import order_cache, signal as orders_signal
+from .notify import notify, CATALOG_CHANNEL
+from .querybudget import budget
+from .session import commit
 
 
+# @budget(n) у функций — сколько SQL-запросов они выполняют (см. querybudget.py)
+# Мутаторы фиксируют изменения через commit(db): в сессии апдейта бота это flush,
+# транзакцию коммитит middleware (см. session.py)
+
 # =========================
 #          HELPERS
 # =========================
@@ -22,65 +46,280 @@ def _page_bounds(page: int, page_size: int) -> tuple[int, int]:
     return offset, page_size
 
 
+# ---- keyset-пагинация ----
+# Курсор непрозрачен для клиента: base64url от "<направление>|<значения ключа>".
+# Направление "a" — страница после ключа (вперёд), "b" — перед ключом (назад).
+# Короткий, чтобы влезать в callback_data (64 байта) вместе с префиксом.
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class KeysetPage(NamedTuple):
+    items: list
+    total: int
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def _encode_cursor(direction: str, key: Tuple[Any, ...]) -> str:
+    parts = []
+    for v in key:
+        if isinstance(v, datetime):
+            parts.append(f"t{(v - _EPOCH) // timedelta(microseconds=1)}")
+        else:
+            parts.append(str(int(v)))
+    raw = f"{direction}|{'.'.join(parts)}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, Tuple[Any, ...]]:
+    """Разбирает курсор. На мусор — ValueError."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, body = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        key = tuple(
+            _EPOCH + timedelta(microseconds=int(p[1:])) if p.startswith("t") else int(p)
+            for p in body.split(".")
+        )
+    except Exception as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+    if direction not in ("a", "b"):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return direction, key
+
+
+async def _keyset_fetch(
+    db: AsyncSession,
+    stmt,
+    key_cols: tuple,
+    *,
+    limit: int,
+    cursor: Optional[str],
+    descending: bool = True,
+    scalars: bool = True,
+) -> Tuple[list, Optional[str], Optional[str]]:
+    """
+    Одна страница по ключу (key_cols) без OFFSET: WHERE (k1, k2) < (:v1, :v2) + LIMIT.
+    scalars=False — для column-only select'ов (строки Row вместо ORM-объектов).
+    Возвращает (items, next_cursor, prev_cursor).
+    """
+    limit = max(1, int(limit))
+    direction, key = _decode_cursor(cursor) if cursor else ("a", None)
+    # идём "вперёд" по порядку списка или "назад" (обратный порядок + разворот)
+    forward = direction == "a"
+    go_desc = descending if forward else not descending
+
+    if key is not None:
+        row, bound = tuple_(*key_cols), tuple_(*key)
+        stmt = stmt.where(row < bound if go_desc else row > bound)
+    stmt = stmt.order_by(*[c.desc() if go_desc else c.asc() for c in key_cols]).limit(limit + 1)
+
+    result = await db.execute(stmt)
+    items = list(result.scalars().all() if scalars else result.all())
+    has_more = len(items) > limit
+    items = items[:limit]
+    if not forward:
+        items.reverse()
+    if not items:
+        return items, None, None
+
+    def key_of(obj) -> tuple:
+        return tuple(getattr(obj, c.key) for c in key_cols)
+
+    has_next = has_more if forward else key is not None
+    has_prev = key is not None if forward else has_more
+    next_cursor = _encode_cursor("a", key_of(items[-1])) if has_next else None
+    prev_cursor = _encode_cursor("b", key_of(items[0])) if has_prev else None
+    return items, next_cursor, prev_cursor
+
+
+# ---- дешёвые total'ы ----
+# Точный count(*) на каждый перелистывание не нужен: держим значение в кэше
+# процесса, а для больших таблиц берём оценку планировщика из pg_class.
+
+COUNT_CACHE_TTL = 30.0
+EXACT_COUNT_THRESHOLD = 10_000
+
+_count_cache: dict[str, Tuple[float, int]] = {}
+
+
+def invalidate_count(model) -> None:
+    _count_cache.pop(model.__tablename__, None)
+
+
+@budget(2)
+async def estimated_count(db: AsyncSession, model) -> int:
+    """Кол-во строк таблицы: кэш на COUNT_CACHE_TTL, для больших таблиц — reltuples."""
+    table = model.__tablename__
+    cached = _count_cache.get(table)
+    now = time.monotonic()
+    if cached and now - cached[0] < COUNT_CACHE_TTL:
+        return cached[1]
+
+    estimate = await db.scalar(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": table},
+    )
+    if estimate is None or estimate < EXACT_COUNT_THRESHOLD:
+        total = int(await db.scalar(select(func.count()).select_from(model)))
+    else:
+        total = int(estimate)
+    _count_cache[table] = (now, total)
+    return total
+
+
 # =========================
 #          USERS
 # =========================
 
-async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[User]:
-    """Возвращает пользователя по telegram_id (int)."""
-    result = await db.execute(select(User).where(User.telegram_id == int(telegram_id)))
-    return result.scalar_one_or_none()
+@budget(1)
+async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[UserRow]:
+    """Пользователь по telegram_id (UserRow) — из кэша процесса, промах — один SELECT."""
+    return await user_cache.get(db, telegram_id)
 
 
+@budget(2)
 async def create_user(
     db: AsyncSession,
     telegram_id: int,
     phone: Optional[str] = None,
     name: Optional[str] = None
-) -> User:
-    """Создаёт пользователя."""
-    user = User(
-        telegram_id=int(telegram_id),
-        phone=phone,
-        name=name,
-        created_at=datetime.utcnow(),
+) -> UserRow:
+    """Создаёт пользователя; INSERT ... RETURNING + NOTIFY для кэшей других процессов."""
+    result = await db.execute(
+        insert(User)
+        .values(telegram_id=int(telegram_id), phone=phone, name=name, created_at=datetime.utcnow())
+        .returning(*USER_COLUMNS)
+    )
+    user = UserRow(*result.one())
+    await notify(db, USER_CHANNEL, str(user.telegram_id))
+    user_cache.changed(db, user.telegram_id, user)
+    await commit(db)
+    invalidate_count(User)
+    return user
+
+
+@budget(2)
+async def upsert_user(
+    db: AsyncSession,
+    telegram_id: int,
+    name: Optional[str] = None,
+    phone: Optional[str] = None,
+) -> UserRow:
+    """
+    Регистрация одним INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING:
+    два одновременных /start не падают на unique-ограничении. У существующего
+    пользователя обновляются переданные name/phone. NOTIFY (второй запрос) — только
+    для нового: у других процессов он мог быть закэширован как «нет»; новое имя
+    старого пользователя они увидят по истечении ttl кэша.
+    """
+    now = datetime.utcnow()
+    stmt = pg_insert(User).values(
+        telegram_id=int(telegram_id), name=name, phone=phone, created_at=now, last_seen_at=now,
     )
-    db.add(user)
-    await db.commit()
-    await db.refresh(user)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "name": func.coalesce(stmt.excluded.name, User.name),
+            "phone": func.coalesce(stmt.excluded.phone, User.phone),
+            "blocked_at": None,     # написал боту — значит, не заблокировал
+        },
+    ).returning(*USER_COLUMNS, literal_column("xmax = 0").label("inserted"))
+    *row, inserted = (await db.execute(stmt)).one()
+    user = UserRow(*row)
+    user_cache.changed(db, user.telegram_id, user)
+    order_cache.changed(db, user.telegram_id)
+    if inserted:
+        await notify(db, USER_CHANNEL, str(user.telegram_id))
+        invalidate_count(User)
+    await commit(db)
     return user
 
 
-async def update_user_phone(db: AsyncSession, telegram_id: int, phone: str) -> Optional[User]:
-    """Обновляет телефон пользователя."""
-    user = await get_user_by_telegram_id(db, telegram_id)
-    if not user:
+@budget(2)
+async def ensure_user(db: AsyncSession, telegram_id: int, name: Optional[str] = None) -> UserRow:
+    """Пользователь из кэша без запроса; нет в кэше — upsert_user (без предварительного SELECT)."""
+    user = user_cache.peek(telegram_id)
+    if user is not None:
+        return user
+    return await upsert_user(db, telegram_id, name=name)
+
+
+@budget(1)
+async def touch_last_seen(db: AsyncSession, seen: Mapping[int, datetime]) -> int:
+    """
+    last_seen_at для пачки пользователей одним UPDATE ... FROM (VALUES ...).
+    Более поздняя отметка не затирается более ранней. Активность после отметки
+    «заблокировал бота» (рассылка) эту отметку снимает. Без commit; возвращает число строк.
+    """
+    if not seen:
+        return 0
+    rows = values(
+        column("telegram_id", BigInteger), column("seen_at", DateTime), name="seen",
+    ).data(sorted(seen.items()))
+    result = await db.execute(
+        update(User)
+        .where(
+            User.telegram_id == rows.c.telegram_id,
+            or_(User.last_seen_at.is_(None), User.last_seen_at < rows.c.seen_at),
+        )
+        .values(
+            last_seen_at=rows.c.seen_at,
+            blocked_at=case((User.blocked_at < rows.c.seen_at, None), else_=User.blocked_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+@budget(2)
+async def update_user_phone(db: AsyncSession, telegram_id: int, phone: str) -> Optional[UserRow]:
+    """Обновляет телефон пользователя; возвращает обновлённую строку (None — нет такого)."""
+    result = await db.execute(
+        update(User).where(User.telegram_id == int(telegram_id)).values(phone=phone).returning(*USER_COLUMNS)
+    )
+    row = result.first()
+    if row is None:
         return None
-    user.phone = phone
-    await db.commit()
-    await db.refresh(user)
+    user = UserRow(*row)
+    await notify(db, USER_CHANNEL, str(telegram_id))
+    user_cache.changed(db, telegram_id, user)
+    order_cache.changed(db, telegram_id)
+    await commit(db)
     return user
 
 
+@budget(1)
 async def get_all_users(db: AsyncSession) -> List[User]:
     """Список всех пользователей."""
     result = await db.execute(select(User).order_by(User.id.desc()))
     return result.scalars().all()
 
 
+@budget(3)
 async def get_all_users_page(db: AsyncSession, limit: int = 10, offset: int = 0):
     query = select(User).offset(offset).limit(limit).order_by(User.created_at.desc())
     result = await db.execute(query)
     items = result.scalars().all()
 
-    total = await db.scalar(select(func.count()).select_from(User))
+    total = await estimated_count(db, User)
     return items, total
 
 
+@budget(3)
+async def get_users_keyset(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None) -> KeysetPage:
+    """Пользователи, новые сначала, по ключу (created_at, id)."""
+    items, next_cursor, prev_cursor = await _keyset_fetch(
+        db, select(User), (User.created_at, User.id), limit=limit, cursor=cursor,
+    )
+    return KeysetPage(items, await estimated_count(db, User), next_cursor, prev_cursor)
+
+
 # =========================
 #          ORDERS
 # =========================
 
+@budget(1)
 async def create_order_with_items(
     db: AsyncSession,
     *,
@@ -92,49 +331,177 @@ async def create_order_with_items(
     unit_price_cents: int,
     is_paid: bool = False,
     status: str = "processing",
-) -> Order:
+) -> OrderRow:
     """
     Создаёт заказ + позиции.
     total_price_cents считается как unit_price_cents * sum(qty).
+    Один INSERT-statement + COMMIT; возвращает заполненную строку (OrderRow).
+    Пустой items — ValueError.
+    """
+    order = await insert_order_returning(
+        db,
+        user_id=user_id,
+        telegram_id=telegram_id,
+        address=address,
+        phone=phone,
+        items=items,
+        unit_price_cents=unit_price_cents,
+        is_paid=is_paid,
+        status=status,
+    )
+    await commit(db)
+    return order
+
+
+@budget(1)
+async def insert_order_returning(
+    db: AsyncSession,
+    *,
+    user_id: int,
+    telegram_id: int,
+    address: str,
+    phone: str,
+    items: Iterable[Tuple[int, int]],  # (product_id, quantity)
+    unit_price_cents: int,
+    is_paid: bool = False,
+    status: str = "processing",
+) -> OrderRow:
+    """
+    Заказ, его позиции, сводка продаж и (для оплаченного) счётчик бутылок — одним
+    statement'ом: цепочка CTE  INSERT orders RETURNING → INSERT order_items SELECT ...
+    RETURNING → upsert sales_daily → upsert user_bottle_totals, без refresh и повторного select.
+    NOTIFY для кэша истории заказов (ordercache.py) — в том же statement'е.
+    Товары должны быть проверены заранее (снимок каталога). Пустой items — ValueError. Без commit.
     """
+    items = list(items)
+    if not items:
+        raise ValueError("Order must have at least one item")
     now = datetime.utcnow()
     total_qty = sum(q for _, q in items)
 
-    order = Order(
-        user_id=user_id,
+    new_order = (
+        insert(Order)
+        .values(
+            user_id=user_id,
+            telegram_id=int(telegram_id),
+            date=now,
+            address=address,
+            phone=phone,
+            is_paid=is_paid,
+            status=OrderStatus(status),
+            total_price_cents=unit_price_cents * total_qty,
+        )
+        .returning(Order.id, Order.date)
+        .cte("new_order")
+    )
+    lines = values(
+        column("n", Integer), column("product_id", Integer), column("quantity", Integer),
+        name="lines",
+    ).data([(n, pid, qty) for n, (pid, qty) in enumerate(items)])
+    new_items = (
+        insert(OrderItem)
+        .from_select(
+            ["order_id", "product_id", "quantity", "unit_price_cents", "line_total_cents"],
+            select(
+                new_order.c.id,
+                lines.c.product_id,
+                lines.c.quantity,
+                literal(unit_price_cents, Integer),
+                lines.c.quantity * literal(unit_price_cents, Integer),
+            )
+            .select_from(new_order)
+            .join(lines, true())
+            .order_by(lines.c.n)
+        )
+        .returning(*OrderItem.__table__.c["id", "order_id", "product_id", "quantity",
+                                          "unit_price_cents", "line_total_cents"])
+        .cte("new_items")
+    )
+    notified = select(orders_signal(literal(int(telegram_id), BigInteger))).cte("notified")
+    stmt = (
+        select(new_order.c.id, new_order.c.date, new_items)
+        .select_from(new_order)
+        .join(new_items, true())
+        .join(notified, true())
+        .order_by(new_items.c.id)
+    )
+    if is_paid and total_qty:
+        ledger = pg_insert(UserBottleTotal).values(user_id=user_id, paid_bottles=total_qty, updated_at=now)
+        ledger = ledger.on_conflict_do_update(
+            index_elements=[UserBottleTotal.user_id],
+            set_={
+                "paid_bottles": UserBottleTotal.paid_bottles + ledger.excluded.paid_bottles,
+                "updated_at": ledger.excluded.updated_at,
+            },
+        )
+        stmt = stmt.add_cte(ledger.cte("ledger"))
+    sales = _sales_upsert(_sales_deltas(
+        {}, 1, now.date(), status, is_paid, unit_price_cents * total_qty,
+        [(pid, qty, qty * unit_price_cents) for pid, qty in items],
+    ))
+    if sales is not None:
+        stmt = stmt.add_cte(sales.cte("sales"))
+
+    rows = (await db.execute(stmt)).all()
+    order_id, order_date = rows[0][0], rows[0][1]
+    invalidate_count(Order)
+    order_cache.changed(db, telegram_id)
+    return OrderRow(
+        id=order_id,
         telegram_id=int(telegram_id),
-        date=now,
+        user_id=user_id,
+        date=order_date,
         address=address,
         phone=phone,
         is_paid=is_paid,
-        status=status,  # требуется столбец orders.status
         total_price_cents=unit_price_cents * total_qty,
+        status=OrderStatus(status),
+        items=tuple(OrderItemRow(*r[2:]) for r in rows),
     )
 
-    order.items = [
-        OrderItem(
-            product_id=pid,
-            quantity=qty,
-            unit_price_cents=unit_price_cents,
-            line_total_cents=unit_price_cents * qty,
-        )
-        for pid, qty in items
-    ]
-
-    db.add(order)
-    await db.commit()
-    await db.refresh(order)
 
+@budget(3)
+async def bulk_insert_orders(
+    db: AsyncSession,
+    orders: Sequence[dict],
+    items: Sequence[Sequence[dict]],
+) -> List[Tuple[int, datetime]]:
+    """
+    Пакетная вставка заказов и позиций: многострочные INSERT ... RETURNING
+    вместо add/commit/refresh на каждый заказ. items[i] — позиции orders[i]
+    (без order_id). Сводку продаж двигает сама, счётчик бутылок — вызывающий
+    (apply_paid_bottles_deltas). Возвращает (id, date) в порядке orders. Без commit.
+    """
+    if not orders:
+        return []
     result = await db.execute(
-        select(Order)
-        .options(
-            selectinload(Order.items).selectinload(OrderItem.product)
-        )
-        .where(Order.id == order.id)
+        insert(Order).returning(Order.id, Order.date, orders_signal(Order.telegram_id),
+                                sort_by_parameter_order=True),
+        list(orders),
     )
-    return result.scalar_one()
+    created = [(int(oid), date) for oid, date, _ in result.all()]
+    for o in orders:
+        order_cache.changed(db, o["telegram_id"])
+    item_rows = [
+        {**it, "order_id": oid}
+        for (oid, _), order_items in zip(created, items)
+        for it in order_items
+    ]
+    if item_rows:
+        await db.execute(insert(OrderItem), item_rows)
+    deltas: Dict[SalesKey, List[int]] = {}
+    for o, (_, order_date), order_items in zip(orders, created, items):
+        _sales_deltas(
+            deltas, 1, order_date.date(), o.get("status", OrderStatus.processing), o.get("is_paid", False),
+            o["total_price_cents"],
+            [(it["product_id"], it["quantity"], it["line_total_cents"]) for it in order_items],
+        )
+    await apply_sales_deltas(db, deltas)
+    invalidate_count(Order)
+    return created
 
 
+@budget(3)
 async def get_orders_by_user(db: AsyncSession, user_id: int) -> List[Order]:
     """Список заказов пользователя по user_id (с позициями и продуктами)."""
     result = await db.execute(
@@ -146,6 +513,7 @@ async def get_orders_by_user(db: AsyncSession, user_id: int) -> List[Order]:
     return result.scalars().all()
 
 
+@budget(3)
 async def get_orders_by_telegram(db: AsyncSession, telegram_id: int) -> List[Order]:
     """Список заказов пользователя по telegram_id (с позициями и продуктами). Удобно для бота."""
     result = await db.execute(
@@ -157,6 +525,7 @@ async def get_orders_by_telegram(db: AsyncSession, telegram_id: int) -> List[Ord
     return result.scalars().all()
 
 
+@budget(3)
 async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[Order]:
     """Один заказ по id (с позициями и продуктами)."""
     result = await db.execute(
@@ -167,6 +536,162 @@ async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[Order]:
     return result.scalar_one_or_none()
 
 
+# ---- проекции и профили загрузки ----
+# Списки и экраны бота берут заказы column-only select'ами в OrderRow, а позиции
+# и пользователей — отдельными IN-запросами по профилю. Число запросов не зависит
+# от числа заказов и истории пользователя; товары — из снимка каталога.
+
+class OrderLoad(str, Enum):
+    summary = "summary"     # только столбцы заказа — 1 запрос
+    items = "items"         # + позиции — 2 запроса
+    full = "full"           # + пользователи — 3 запроса
+
+
+ORDER_COLUMNS = (
+    Order.id, Order.telegram_id, Order.user_id, Order.date, Order.address, Order.phone,
+    Order.is_paid, Order.total_price_cents, Order.status,
+)
+ORDER_ITEM_COLUMNS = (
+    OrderItem.id, OrderItem.order_id, OrderItem.product_id, OrderItem.quantity,
+    OrderItem.unit_price_cents, OrderItem.line_total_cents,
+)
+USER_COLUMNS = (User.id, User.telegram_id, User.name, User.phone, User.created_at)
+
+
+async def _hydrate_orders(
+    db: AsyncSession, rows, load: OrderLoad
+) -> Tuple[List[OrderRow], Dict[int, UserRow]]:
+    orders = [OrderRow(*r) for r in rows]
+    users: Dict[int, UserRow] = {}
+    if not orders or load is OrderLoad.summary:
+        return orders, users
+
+    items: Dict[int, list] = {}
+    result = await db.execute(
+        select(*ORDER_ITEM_COLUMNS)
+        .where(OrderItem.order_id.in_([o.id for o in orders]))
+        .order_by(OrderItem.order_id, OrderItem.id)
+    )
+    for r in result.all():
+        items.setdefault(r.order_id, []).append(OrderItemRow(*r))
+    orders = [o._replace(items=tuple(items.get(o.id, ()))) for o in orders]
+
+    if load is OrderLoad.full:
+        user_ids = {o.user_id for o in orders if o.user_id is not None}
+        if user_ids:
+            result = await db.execute(select(*USER_COLUMNS).where(User.id.in_(user_ids)))
+            users = {r.id: UserRow(*r) for r in result.all()}
+    return orders, users
+
+
+@budget(3)
+async def load_orders(
+    db: AsyncSession,
+    *criteria,
+    limit: Optional[int] = None,
+    load: OrderLoad = OrderLoad.items,
+) -> Tuple[List[OrderRow], Dict[int, UserRow]]:
+    """
+    Заказы по произвольным условиям, новые сначала, проекциями.
+    Возвращает (заказы, {user_id: UserRow}); пользователи — только для OrderLoad.full.
+    """
+    stmt = select(*ORDER_COLUMNS).where(*criteria).order_by(Order.date.desc(), Order.id.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+    result = await db.execute(stmt)
+    return await _hydrate_orders(db, result.all(), load)
+
+
+@budget(3)
+async def get_order_row(
+    db: AsyncSession, order_id: int, load: OrderLoad = OrderLoad.items
+) -> Tuple[Optional[OrderRow], Optional[UserRow]]:
+    """Один заказ проекцией: (OrderRow | None, UserRow | None)."""
+    orders, users = await load_orders(db, Order.id == order_id, load=load)
+    if not orders:
+        return None, None
+    return orders[0], users.get(orders[0].user_id)
+
+
+# ---- поиск по заказам ----
+# address/phone покрыты GIN-индексами pg_trgm (gin_trgm_ops): через них идут и
+# ILIKE '%q%', и word similarity (q <% address) — без полного прохода по таблице.
+# Из запроса короче SEARCH_MIN_LENGTH триграмм не получится — такой ищем только по номеру.
+
+SEARCH_MIN_LENGTH = 3
+_MAX_INT4 = 2**31 - 1
+
+
+def contains_pattern(q: str) -> str:
+    """Шаблон ILIKE "содержит q" с экранированием спецсимволов LIKE."""
+    q = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{q}%"
+
+
+def order_search_criteria(q: str):
+    """Условие поиска по номеру, адресу и телефону. None — искать нечего."""
+    q = q.strip()
+    conds = []
+    if q.isdigit() and int(q) <= _MAX_INT4:
+        conds.append(Order.id == int(q))
+    if len(q) >= SEARCH_MIN_LENGTH:
+        pattern = contains_pattern(q)
+        conds += [
+            Order.address.ilike(pattern),
+            Order.phone.ilike(pattern),
+            literal(q).op("<%")(Order.address),     # опечатки в адресе
+        ]
+    return or_(*conds) if conds else None
+
+
+def order_search_rank(q: str):
+    """Релевантность: точный номер заказа выше всего, дальше — похожесть адреса/телефона."""
+    q = q.strip()
+    rank = func.greatest(func.word_similarity(q, Order.address), func.word_similarity(q, Order.phone))
+    if q.isdigit() and int(q) <= _MAX_INT4:
+        rank = rank + case((Order.id == int(q), 1.0), else_=0.0)
+    return rank
+
+
+def order_search_stmt(q: str, *, limit: int = 20, telegram_id: Optional[int] = None):
+    """SELECT поиска (столбцы OrderRow + rank). None — искать нечего."""
+    criteria = order_search_criteria(q)
+    if criteria is None:
+        return None
+    rank = order_search_rank(q).label("rank")
+    stmt = (
+        select(*ORDER_COLUMNS, rank)
+        .where(criteria)
+        .order_by(rank.desc(), Order.date.desc(), Order.id.desc())
+        .limit(limit)
+    )
+    if telegram_id is not None:
+        stmt = stmt.where(Order.telegram_id == telegram_id)
+    return stmt
+
+
+@budget(3)
+async def search_orders(
+    db: AsyncSession,
+    q: str,
+    *,
+    limit: int = 20,
+    telegram_id: Optional[int] = None,
+    load: OrderLoad = OrderLoad.full,
+) -> Tuple[List[Tuple[OrderRow, float]], Dict[int, UserRow]]:
+    """
+    Поиск заказов по номеру / адресу / телефону, по убыванию релевантности.
+    Возвращает ([(OrderRow, rank)], {user_id: UserRow}).
+    """
+    stmt = order_search_stmt(q, limit=limit, telegram_id=telegram_id)
+    if stmt is None:
+        return [], {}
+    rows = (await db.execute(stmt)).all()
+    orders, users = await _hydrate_orders(db, [r[:-1] for r in rows], load)
+    return [(o, float(r.rank)) for o, r in zip(orders, rows)], users
+
+
+@budget(1)
 async def get_orders_count_by_telegram_id(db: AsyncSession, telegram_id: int) -> int:
     """Кол-во ОПЛАЧЕННЫХ заказов по telegram_id."""
     result = await db.execute(
@@ -177,47 +702,130 @@ async def get_orders_count_by_telegram_id(db: AsyncSession, telegram_id: int) ->
     return int(result.scalar_one())
 
 
-async def set_order_paid(db: AsyncSession, order_id: int) -> Optional[Order]:
-    """Пометить заказ как оплаченный."""
-    order = await get_order_by_id(db, order_id)
-    if not order:
-        return None
-    order.is_paid = True
-    await db.commit()
-    await db.refresh(order)
+# Мутаторы ниже возвращают заказ уже после изменения (UPDATE ... RETURNING +
+# позиции) — перечитывать его через get_order_row не нужно.
+
+@budget(5)
+async def update_order(
+    db: AsyncSession,
+    order_id: int,
+    *,
+    status: Optional[str] = None,
+    is_paid: Optional[bool] = None,
+    load: OrderLoad = OrderLoad.items,
+) -> Tuple[Optional[OrderRow], Optional[UserRow]]:
+    """
+    Меняет статус и/или оплату заказа одним UPDATE. Прежние значения берутся из
+    подзапроса с FOR UPDATE, поэтому при гонке двух изменений каждое видит результат
+    предыдущего: бутылки не посчитаются дважды, а сводка продаж переносит заказ
+    из фактического старого ключа в новый. Счётчик и сводка двигаются в той же
+    транзакции и только если значение действительно изменилось.
+    Возвращает (OrderRow | None, UserRow | None), load — items или full. Без commit.
+    """
+    changes: Dict[str, Any] = {}
+    if status is not None:
+        changes["status"] = OrderStatus(status)
+    if is_paid is not None:
+        changes["is_paid"] = is_paid
+    if not changes:
+        return await get_order_row(db, order_id, load)
+
+    old = (
+        select(Order.id, Order.status, Order.is_paid)
+        .where(Order.id == order_id)
+        .with_for_update()
+        .subquery("old")
+    )
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == old.c.id)
+        .values(**changes)
+        .returning(*ORDER_COLUMNS, orders_signal(Order.telegram_id), old.c.status, old.c.is_paid)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        return None, None
+    [order], users = await _hydrate_orders(db, [row[:len(ORDER_COLUMNS)]], load)
+    order_cache.changed(db, order.telegram_id)
+    was_status, was_paid = OrderStatus(row[-2]), bool(row[-1])
+
+    if order.is_paid != was_paid:
+        bottles = _order_bottles(order)
+        await apply_paid_bottles_delta(db, order.user_id, bottles if order.is_paid else -bottles)
+    if (order.status, order.is_paid) != (was_status, was_paid):
+        deltas = _order_sales_deltas({}, -1, order._replace(status=was_status, is_paid=was_paid))
+        await apply_sales_deltas(db, _order_sales_deltas(deltas, 1, order))
+    return order, users.get(order.user_id)
+
+
+@budget(4)
+async def set_order_paid(db: AsyncSession, order_id: int) -> Optional[OrderRow]:
+    """Пометить заказ как оплаченный. Возвращает заказ с позициями (None — нет такого)."""
+    order, _ = await update_order(db, order_id, is_paid=True)
+    if order is not None:
+        await commit(db)
     return order
 
 
-async def update_order_status(db: AsyncSession, order_id: int, status: str) -> Optional[Order]:
-    """Обновить статус заказа (processing|in_transit|declined|completed)."""
-    order = await get_order_by_id(db, order_id)
-    if not order:
-        return None
-    order.status = status
-    await db.commit()
-    await db.refresh(order)
+@budget(3)
+async def update_order_status(db: AsyncSession, order_id: int, status: str) -> Optional[OrderRow]:
+    """Обновить статус заказа (processing|in_transit|declined|completed). Возвращает заказ с позициями."""
+    order, _ = await update_order(db, order_id, status=status)
+    if order is not None:
+        await commit(db)
     return order
 
 
 # alias под ожидаемое имя в импортах
-async def set_order_status(db: AsyncSession, order_id: int, status: str) -> Optional[Order]:
+@budget(3)
+async def set_order_status(db: AsyncSession, order_id: int, status: str) -> Optional[OrderRow]:
     """Алиас к update_order_status для совместимости с импортами."""
     return await update_order_status(db, order_id, status)
 
 
+@budget(5)
+async def delete_order(db: AsyncSession, order_id: int) -> bool:
+    """
+    Удалить заказ (позиции удаляются каскадом в БД). Оплаченные бутылки списываются
+    со счётчика, заказ — из сводки продаж; статус и оплата — из DELETE ... RETURNING,
+    то есть те, что были на момент удаления.
+    """
+    order, _ = await get_order_row(db, order_id)
+    if order is None:
+        return False
+    result = await db.execute(
+        delete(Order)
+        .where(Order.id == order_id)
+        .returning(*ORDER_COLUMNS, orders_signal(Order.telegram_id))
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        return False
+    order = OrderRow(*row[:len(ORDER_COLUMNS)])._replace(items=order.items)
+    order_cache.changed(db, order.telegram_id)
+    if order.is_paid:
+        await apply_paid_bottles_delta(db, order.user_id, -_order_bottles(order))
+    await apply_sales_deltas(db, _order_sales_deltas({}, -1, order))
+    await commit(db)
+    invalidate_count(Order)
+    return True
+
+
+@budget(1)
 async def get_total_bottles_by_user(db: AsyncSession, telegram_id: int) -> int:
+    """Оплаченные бутылки пользователя по telegram_id — одна строка из user_bottle_totals."""
     stmt = (
-        select(func.coalesce(func.sum(OrderItem.quantity), 0))
-        .select_from(OrderItem)
-        .join(Order, OrderItem.order_id == Order.id)
-        .join(User, Order.user_id == User.id)
-        .where(User.telegram_id == telegram_id)   # ← ключевая строка
-        .where(Order.is_paid.is_(True))
+        select(UserBottleTotal.paid_bottles)
+        .join(User, UserBottleTotal.user_id == User.id)
+        .where(User.telegram_id == int(telegram_id))
     )
     result = await db.execute(stmt)
-    return int(result.scalar_one())
+    return int(result.scalar_one_or_none() or 0)
 
 
+@budget(3)
 async def get_all_orders(db: AsyncSession) -> List[Order]:
     """Список всех заказов (с позициями и продуктами)."""
     result = await db.execute(
@@ -228,45 +836,579 @@ async def get_all_orders(db: AsyncSession) -> List[Order]:
     return result.scalars().all()
 
 
+@budget(5)
 async def get_all_orders_page(db: AsyncSession, limit: int = 10, offset: int = 0):
-    query = select(Order).offset(offset).limit(limit).order_by(Order.date.desc())
+    query = (
+        select(Order)
+        .options(selectinload(Order.items).selectinload(OrderItem.product))
+        .offset(offset).limit(limit).order_by(Order.date.desc())
+    )
     result = await db.execute(query)
     items = result.scalars().all()
 
-    total = await db.scalar(select(func.count()).select_from(Order))
+    total = await estimated_count(db, Order)
     return items, total
 
+
+@budget(5)
+async def get_orders_keyset(
+    db: AsyncSession,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    load: OrderLoad = OrderLoad.items,
+    criteria: Sequence = (),
+) -> Tuple[KeysetPage, Dict[int, UserRow]]:
+    """
+    Заказы (все или по criteria), новые сначала, по ключу (date, id) — проекциями (OrderRow).
+    Возвращает (страница, {user_id: UserRow}); пользователи — только для OrderLoad.full.
+    """
+    rows, next_cursor, prev_cursor = await _keyset_fetch(
+        db, select(*ORDER_COLUMNS).where(*criteria), (Order.date, Order.id),
+        limit=limit, cursor=cursor, scalars=False,
+    )
+    orders, users = await _hydrate_orders(db, rows, load)
+    if criteria:
+        # с фильтром оценка по таблице не годится — считаем точно
+        total = int(await db.scalar(select(func.count()).select_from(Order).where(*criteria)))
+    else:
+        total = await estimated_count(db, Order)
+    return KeysetPage(orders, total, next_cursor, prev_cursor), users
+
+
+@budget(3)
+async def stream_orders(
+    db: AsyncSession,
+    *criteria,
+    batch_size: int = 500,
+    load: OrderLoad = OrderLoad.full,
+) -> AsyncIterator[Tuple[List[OrderRow], Dict[int, UserRow]]]:
+    """
+    Заказы по условиям, новые сначала, пачками через серверный курсор.
+    В памяти — одна пачка (batch_size заказов + их позиции/пользователи), сколько бы
+    ни было строк. Позиции и пользователи пачки — отдельными IN-запросами в том же
+    соединении, пока курсор открыт.
+    """
+    stmt = (
+        select(*ORDER_COLUMNS)
+        .where(*criteria)
+        .order_by(Order.date.desc(), Order.id.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    try:
+        async for rows in result.partitions():
+            yield await _hydrate_orders(db, rows, load)
+    finally:
+        await result.close()
+
+# =========================
+#      BOTTLE LEDGER
+# =========================
+
+def _order_bottles(order) -> int:
+    return sum(int(it.quantity) for it in order.items)
+
+
+@budget(1)
+async def apply_paid_bottles_delta(db: AsyncSession, user_id: Optional[int], delta: int) -> None:
+    """
+    Сдвигает счётчик оплаченных бутылок пользователя на delta.
+    Не коммитит — изменение попадает в транзакцию вызывающего вместе с заказом.
+    """
+    if not user_id or not delta:
+        return
+    await apply_paid_bottles_deltas(db, {user_id: delta})
+
+
+@budget(1)
+async def apply_paid_bottles_deltas(db: AsyncSession, deltas: Mapping[int, int]) -> None:
+    """То же для нескольких пользователей одним INSERT ... ON CONFLICT. Без commit."""
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "paid_bottles": delta, "updated_at": now}
+        for user_id, delta in sorted(deltas.items())  # порядок ключей — меньше шансов на deadlock
+        if user_id and delta
+    ]
+    if not rows:
+        return
+    stmt = pg_insert(UserBottleTotal).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserBottleTotal.user_id],
+        set_={
+            "paid_bottles": UserBottleTotal.paid_bottles + stmt.excluded.paid_bottles,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    await db.execute(stmt)
+
+
+@budget(1)
+async def get_user_for_order(db: AsyncSession, telegram_id: int) -> Optional[Tuple[UserRow, int]]:
+    """Пользователь (без связей) и его оплаченные бутылки — одним запросом."""
+    result = await db.execute(
+        select(
+            User.id, User.telegram_id, User.name, User.phone, User.created_at,
+            func.coalesce(UserBottleTotal.paid_bottles, 0),
+        )
+        .outerjoin(UserBottleTotal, UserBottleTotal.user_id == User.id)
+        .where(User.telegram_id == int(telegram_id))
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return UserRow(*row[:5]), int(row[5])
+
+
+@budget(1)
+async def get_users_with_paid_bottles(
+    db: AsyncSession, telegram_ids: Iterable[int]
+) -> Dict[int, Tuple[int, int]]:
+    """{telegram_id: (users.id, оплаченные бутылки)} одним IN-запросом — для пакетных операций."""
+    result = await db.execute(
+        select(User.telegram_id, User.id, func.coalesce(UserBottleTotal.paid_bottles, 0))
+        .outerjoin(UserBottleTotal, UserBottleTotal.user_id == User.id)
+        .where(User.telegram_id.in_({int(t) for t in telegram_ids}))
+    )
+    return {int(tg): (int(uid), int(paid)) for tg, uid, paid in result.all()}
+
+
+@budget(1)
+async def get_paid_bottles(db: AsyncSession, user_id: int) -> int:
+    """Оплаченные бутылки по users.id — чтение одной строки по PK."""
+    result = await db.execute(
+        select(UserBottleTotal.paid_bottles).where(UserBottleTotal.user_id == user_id)
+    )
+    return int(result.scalar_one_or_none() or 0)
+
+
+def _live_paid_bottles_query():
+    return (
+        select(Order.user_id, func.sum(OrderItem.quantity).label("paid_bottles"))
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.is_paid.is_(True), Order.user_id.is_not(None))
+        .group_by(Order.user_id)
+    )
+
+
+@budget(2)
+async def check_bottle_ledger(db: AsyncSession, fix: bool = False) -> List[Tuple[int, int, int]]:
+    """
+    Сверяет user_bottle_totals с живым SUM по оплаченным заказам.
+    Возвращает расхождения (user_id, в счётчике, фактически).
+    fix=True переписывает расходящиеся строки фактическими значениями.
+    """
+    live = _live_paid_bottles_query().subquery()
+    stmt = (
+        select(
+            func.coalesce(UserBottleTotal.user_id, live.c.user_id),
+            func.coalesce(UserBottleTotal.paid_bottles, 0),
+            func.coalesce(live.c.paid_bottles, 0),
+        )
+        .select_from(UserBottleTotal)
+        .join(live, live.c.user_id == UserBottleTotal.user_id, full=True)
+        .where(func.coalesce(UserBottleTotal.paid_bottles, 0) != func.coalesce(live.c.paid_bottles, 0))
+    )
+    result = await db.execute(stmt)
+    mismatches = [(int(u), int(ledger), int(actual)) for u, ledger, actual in result.all()]
+
+    if fix and mismatches:
+        # все расхождения — одним upsert'ом, а не запросом на пользователя
+        await apply_paid_bottles_deltas(db, {user_id: actual - ledger for user_id, ledger, actual in mismatches})
+        await commit(db)
+    return mismatches
+
+
+# =========================
+#       SALES ROLLUP
+# =========================
+# sales_daily — дневная сводка (день × товар × статус × оплата), см. models.SalesDaily.
+# Двигается дельтами в той же транзакции, что и заказ: создание (insert_order_returning,
+# bulk_insert_orders), оплата / статус (update_order), удаление (delete_order).
+# Отчёт за период читает сводку — дни × товары строк, сколько бы ни было заказов.
+
+SalesKey = Tuple[date, int, OrderStatus, bool]      # (день, товар | 0, статус, оплачен)
+
+
+def _sales_deltas(
+    deltas: Dict[SalesKey, List[int]],
+    sign: int,
+    day: date,
+    status,
+    is_paid: bool,
+    total_price_cents: int,
+    lines: Iterable[Tuple[int, int, int]],      # (product_id, quantity, line_total_cents)
+) -> Dict[SalesKey, List[int]]:
+    """Добавляет в deltas вклад одного заказа ({ключ: [orders, bottles, revenue_cents]}) со знаком sign."""
+    status, is_paid = OrderStatus(status), bool(is_paid)
+    per_product: Dict[int, List[int]] = {}
+    for product_id, quantity, line_total in lines:
+        p = per_product.setdefault(int(product_id), [0, 0])
+        p[0] += int(quantity)
+        p[1] += int(line_total)
+    rows = [(0, sum(q for q, _ in per_product.values()), int(total_price_cents))]
+    rows += [(product_id, q, rev) for product_id, (q, rev) in per_product.items()]
+    for product_id, bottles, revenue in rows:
+        d = deltas.setdefault((day, product_id, status, is_paid), [0, 0, 0])
+        d[0] += sign
+        d[1] += sign * bottles
+        d[2] += sign * revenue
+    return deltas
+
+
+def _order_sales_deltas(deltas: Dict[SalesKey, List[int]], sign: int, order) -> Dict[SalesKey, List[int]]:
+    """То же для OrderRow / Order с позициями."""
+    return _sales_deltas(
+        deltas, sign, order.date.date(), order.status, order.is_paid, order.total_price_cents,
+        ((it.product_id, it.quantity, it.line_total_cents) for it in order.items),
+    )
+
+
+def _sales_upsert(deltas: Mapping[SalesKey, Sequence[int]]):
+    """INSERT ... ON CONFLICT, прибавляющий дельты к sales_daily (None — нечего менять)."""
+    rows = [
+        {"day": day, "product_id": product_id, "status": status, "is_paid": is_paid,
+         "orders": n, "bottles": bottles, "revenue_cents": revenue}
+        # порядок ключей — меньше шансов на deadlock
+        for (day, product_id, status, is_paid), (n, bottles, revenue)
+        in sorted(deltas.items(), key=lambda kv: (kv[0][0], kv[0][1], kv[0][2].value, kv[0][3]))
+        if n or bottles or revenue
+    ]
+    if not rows:
+        return None
+    stmt = pg_insert(SalesDaily).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.day, SalesDaily.product_id, SalesDaily.status, SalesDaily.is_paid],
+        set_={
+            "orders": SalesDaily.orders + stmt.excluded.orders,
+            "bottles": SalesDaily.bottles + stmt.excluded.bottles,
+            "revenue_cents": SalesDaily.revenue_cents + stmt.excluded.revenue_cents,
+        },
+    )
+
+
+@budget(1)
+async def apply_sales_deltas(db: AsyncSession, deltas: Mapping[SalesKey, Sequence[int]]) -> None:
+    """Сдвигает sales_daily на deltas одним INSERT ... ON CONFLICT. Без commit."""
+    stmt = _sales_upsert(deltas)
+    if stmt is not None:
+        await db.execute(stmt)
+
+
+def _sales_sums():
+    paid = SalesDaily.is_paid.is_(True)
+    return (
+        func.sum(SalesDaily.orders),
+        func.coalesce(func.sum(SalesDaily.orders).filter(paid), 0),
+        func.sum(SalesDaily.bottles),
+        func.sum(SalesDaily.revenue_cents),
+        func.coalesce(func.sum(SalesDaily.revenue_cents).filter(paid), 0),
+    )
+
+
+async def _sales_report(db: AsyncSession, key, date_from: date, date_to: date, *criteria) -> List[SalesRow]:
+    result = await db.execute(
+        select(key, *_sales_sums())
+        .where(SalesDaily.day >= date_from, SalesDaily.day <= date_to, *criteria)
+        .group_by(key)
+        .having(func.sum(SalesDaily.orders) != 0)      # ключи, из которых все заказы ушли
+        .order_by(key)
+    )
+    return [SalesRow(k, *(int(v) for v in sums)) for k, *sums in result.all()]
+
+
+@budget(1)
+async def get_sales_by_day(db: AsyncSession, date_from: date, date_to: date) -> List[SalesRow]:
+    """Продажи по дням за [date_from, date_to] (UTC); дни без заказов пропущены."""
+    return await _sales_report(db, SalesDaily.day, date_from, date_to, SalesDaily.product_id == 0)
+
+
+@budget(1)
+async def get_sales_by_status(db: AsyncSession, date_from: date, date_to: date) -> List[SalesRow]:
+    """Продажи за период по статусам заказа."""
+    return await _sales_report(db, SalesDaily.status, date_from, date_to, SalesDaily.product_id == 0)
+
+
+@budget(1)
+async def get_sales_by_product(db: AsyncSession, date_from: date, date_to: date) -> List[SalesRow]:
+    """Продажи за период по товарам: orders — заказы с товаром, bottles / revenue — по его позициям."""
+    rows = await _sales_report(db, SalesDaily.product_id, date_from, date_to, SalesDaily.product_id != 0)
+    return sorted(rows, key=lambda r: -r.revenue_cents)
+
+
+def _live_sales_query():
+    """sales_daily, посчитанная заново по orders / order_items (для сверки)."""
+    day = func.date(Order.date)
+    per_order = (
+        select(OrderItem.order_id, func.sum(OrderItem.quantity).label("bottles"))
+        .group_by(OrderItem.order_id)
+        .subquery()
+    )
+    orders = (
+        select(
+            day.label("day"), literal(0, Integer).label("product_id"), Order.status, Order.is_paid,
+            func.count().label("orders"),
+            func.coalesce(func.sum(per_order.c.bottles), 0).label("bottles"),
+            func.sum(Order.total_price_cents).label("revenue_cents"),
+        )
+        .outerjoin(per_order, per_order.c.order_id == Order.id)
+        .group_by(day, Order.status, Order.is_paid)
+    )
+    products = (
+        select(
+            day, OrderItem.product_id, Order.status, Order.is_paid,
+            func.count(func.distinct(Order.id)),
+            func.sum(OrderItem.quantity),
+            func.sum(OrderItem.line_total_cents),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .group_by(day, OrderItem.product_id, Order.status, Order.is_paid)
+    )
+    return orders.union_all(products)
+
+
+@budget(2)
+async def check_sales_rollup(db: AsyncSession, fix: bool = False) -> List[Tuple[SalesKey, Tuple[int, ...], Tuple[int, ...]]]:
+    """
+    Сверяет sales_daily с агрегатом по orders / order_items (полный проход — для
+    проверок и обслуживания, не для отчётов).
+    Возвращает расхождения (ключ, (orders, bottles, revenue) в сводке, фактически).
+    fix=True сдвигает расходящиеся строки к фактическим значениям.
+    """
+    live = _live_sales_query().subquery("live")
+    key = ("day", "product_id", "status", "is_paid")
+    rollup = SalesDaily.__table__.c
+    counters = ("orders", "bottles", "revenue_cents")
+    stmt = (
+        select(
+            *(func.coalesce(rollup[k], live.c[k]) for k in key),
+            *(func.coalesce(rollup[c], 0) for c in counters),
+            *(func.coalesce(live.c[c], 0) for c in counters),
+        )
+        .select_from(SalesDaily)
+        .join(live, and_(*(rollup[k] == live.c[k] for k in key)), full=True)
+        .where(or_(*(func.coalesce(rollup[c], 0) != func.coalesce(live.c[c], 0) for c in counters)))
+    )
+    result = await db.execute(stmt)
+    mismatches = [
+        ((r[0], int(r[1]), OrderStatus(r[2]), bool(r[3])), tuple(int(v) for v in r[4:7]), tuple(int(v) for v in r[7:10]))
+        for r in result.all()
+    ]
+
+    if fix and mismatches:
+        await apply_sales_deltas(db, {
+            k: [a - b for a, b in zip(actual, stored)] for k, stored, actual in mismatches
+        })
+        await commit(db)
+    return mismatches
+
+
+# =========================
+#        BROADCASTS
+# =========================
+# Рассылка (broadcast.py): получатели — keyset по users.id, прогресс и аренда —
+# в строке broadcasts. Каждая функция — один statement.
+
+BROADCAST_COLUMNS = (
+    Broadcast.id, Broadcast.text, Broadcast.status, Broadcast.created_by,
+    Broadcast.progress_chat_id, Broadcast.progress_message_id, Broadcast.cursor_user_id,
+    Broadcast.total, Broadcast.sent, Broadcast.failed, Broadcast.blocked,
+    Broadcast.created_at, Broadcast.finished_at,
+)
+
+
+def _lease_free(now: datetime):
+    return or_(Broadcast.locked_until.is_(None), Broadcast.locked_until < now)
+
+
+@budget(1)
+async def create_broadcast(db: AsyncSession, *, text: str, created_by: int, chat_id: int) -> BroadcastRow:
+    """Новая рассылка; total — незаблокировавшие пользователи на момент создания."""
+    reachable = select(func.count()).select_from(User).where(User.blocked_at.is_(None)).scalar_subquery()
+    result = await db.execute(
+        insert(Broadcast)
+        .values(
+            text=text, status=BroadcastStatus.running, created_by=int(created_by),
+            progress_chat_id=int(chat_id), cursor_user_id=0, total=reachable,
+            sent=0, failed=0, blocked=0, created_at=datetime.utcnow(),
+        )
+        .returning(*BROADCAST_COLUMNS)
+    )
+    broadcast = BroadcastRow(*result.one())
+    await commit(db)
+    return broadcast
+
+
+@budget(1)
+async def set_broadcast_message(db: AsyncSession, broadcast_id: int, message_id: int) -> None:
+    """Сообщение с прогрессом рассылки в чате админа."""
+    await db.execute(
+        update(Broadcast).where(Broadcast.id == broadcast_id).values(progress_message_id=message_id)
+        .execution_options(synchronize_session=False)
+    )
+    await commit(db)
+
+
+@budget(1)
+async def claim_broadcast(db: AsyncSession, broadcast_id: int, lease_seconds: float) -> Optional[BroadcastRow]:
+    """Взять идущую рассылку в работу, если её не ведёт другой процесс (аренда свободна или истекла)."""
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(Broadcast)
+        .where(
+            Broadcast.id == broadcast_id,
+            Broadcast.status == BroadcastStatus.running,
+            _lease_free(now),
+        )
+        .values(locked_until=now + timedelta(seconds=lease_seconds))
+        .returning(*BROADCAST_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    await commit(db)
+    return BroadcastRow(*row) if row is not None else None
+
+
+@budget(1)
+async def get_resumable_broadcasts(db: AsyncSession) -> List[int]:
+    """Идущие рассылки, которые никто не ведёт: процесс упал или остановился."""
+    result = await db.execute(
+        select(Broadcast.id)
+        .where(Broadcast.status == BroadcastStatus.running, _lease_free(datetime.utcnow()))
+        .order_by(Broadcast.id)
+    )
+    return list(result.scalars().all())
+
+
+@budget(1)
+async def get_broadcast_recipients(db: AsyncSession, after_user_id: int, limit: int) -> List[Tuple[int, int]]:
+    """Следующие получатели после users.id = after_user_id: [(users.id, telegram_id)], по PK."""
+    result = await db.execute(
+        select(User.id, User.telegram_id)
+        .where(User.id > after_user_id, User.blocked_at.is_(None))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return [(int(uid), int(tg)) for uid, tg in result.all()]
+
+
+@budget(1)
+async def mark_users_blocked(db: AsyncSession, telegram_ids: Iterable[int]) -> int:
+    """Отметить пользователей, заблокировавших бота (следующие рассылки их пропустят). Без commit."""
+    telegram_ids = sorted({int(t) for t in telegram_ids})
+    if not telegram_ids:
+        return 0
+    result = await db.execute(
+        update(User)
+        .where(User.telegram_id.in_(telegram_ids), User.blocked_at.is_(None))
+        .values(blocked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+@budget(1)
+async def save_broadcast_progress(
+    db: AsyncSession,
+    broadcast_id: int,
+    *,
+    cursor_user_id: int,
+    sent: int = 0,
+    failed: int = 0,
+    blocked: int = 0,
+    lease_seconds: float = 0,
+    done: bool = False,
+) -> Optional[BroadcastRow]:
+    """
+    Сдвинуть курсор, прибавить счётчики пачки и продлить аренду (lease_seconds=0 —
+    отпустить). done=True — получатели кончились. Возвращает строку после изменения:
+    по status вызывающий видит отмену, сделанную в другом процессе.
+    """
+    now = datetime.utcnow()
+    running = Broadcast.status == BroadcastStatus.running
+    values_: Dict[str, Any] = {
+        "cursor_user_id": cursor_user_id,
+        "sent": Broadcast.sent + sent,
+        "failed": Broadcast.failed + failed,
+        "blocked": Broadcast.blocked + blocked,
+        "locked_until": now + timedelta(seconds=lease_seconds) if lease_seconds else None,
+    }
+    if done:
+        values_["status"] = case((running, BroadcastStatus.done), else_=Broadcast.status)
+        values_["finished_at"] = case((running, now), else_=Broadcast.finished_at)
+    result = await db.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id)
+        .values(**values_)
+        .returning(*BROADCAST_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    await commit(db)
+    return BroadcastRow(*row) if row is not None else None
+
+
+@budget(1)
+async def cancel_broadcast(db: AsyncSession, broadcast_id: int) -> Optional[BroadcastRow]:
+    """Остановить идущую рассылку. None — нет такой или она уже закончилась."""
+    result = await db.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == BroadcastStatus.running)
+        .values(status=BroadcastStatus.cancelled, finished_at=datetime.utcnow())
+        .returning(*BROADCAST_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    await commit(db)
+    return BroadcastRow(*row) if row is not None else None
+
+
 # =========================
 #         PRODUCTS
 # =========================
 
+@budget(1)
 async def list_products(db: AsyncSession) -> List[Product]:
     result = await db.execute(select(Product).order_by(Product.name.asc()))
     return result.scalars().all()
 
 
+@budget(3)
 async def get_products_page(db: AsyncSession, limit: int = 10, offset: int = 0):
     query = select(Product).offset(offset).limit(limit)
     result = await db.execute(query)
     items = result.scalars().all()
 
-    total = await db.scalar(select(func.count()).select_from(Product))
+    total = await estimated_count(db, Product)
     return items, total
 
 
+@budget(3)
+async def get_products_keyset(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None) -> KeysetPage:
+    """Товары по возрастанию id."""
+    items, next_cursor, prev_cursor = await _keyset_fetch(
+        db, select(Product), (Product.id,), limit=limit, cursor=cursor, descending=False,
+    )
+    return KeysetPage(items, await estimated_count(db, Product), next_cursor, prev_cursor)
+
+
+@budget(1)
 async def get_product_by_id(db: AsyncSession, product_id: int) -> Optional[Product]:
     result = await db.execute(select(Product).where(Product.id == product_id))
     return result.scalar_one_or_none()
 
 
+@budget(2)
 async def create_product(db: AsyncSession, *, name: str, price_cents: int) -> Product:
     prod = Product(name=name, price_cents=price_cents)
     db.add(prod)
-    await db.commit()
-    await db.refresh(prod)
+    await notify(db, CATALOG_CHANNEL)
+    await commit(db)
+    invalidate_count(Product)
+    catalog.invalidate()
     return prod
 
 
+@budget(3)
 async def update_product(
     db: AsyncSession,
     product_id: int,
@@ -281,20 +1423,45 @@ async def update_product(
         prod.name = name
     if price_cents is not None:
         prod.price_cents = price_cents
-    await db.commit()
-    await db.refresh(prod)
+    await notify(db, CATALOG_CHANNEL)
+    await commit(db)
+    catalog.invalidate()
     return prod
 
 
+@budget(3)
 async def update_product_price(db: AsyncSession, product_id: int, price_cents: int) -> Optional[Product]:
     """Точечный апдейт цены — для совместимости с импортами."""
     return await update_product(db, product_id, price_cents=price_cents)
 
 
+@budget(3)
 async def delete_product(db: AsyncSession, product_id: int) -> bool:
     prod = await get_product_by_id(db, product_id)
     if not prod:
         return False
     await db.delete(prod)
-    await db.commit()
+    await notify(db, CATALOG_CHANNEL)
+    await commit(db)
+    invalidate_count(Product)
+    catalog.invalidate()
     return True
+
+
+# =========================
+#       PRICE TIERS
+# =========================
+
+@budget(3)
+async def replace_price_tiers(db: AsyncSession, tiers: Iterable[Tuple[int, int]]) -> Tuple[PriceTierRecord, ...]:
+    """
+    Заменить все ценовые уровни: tiers — (min_bottles, price_cents). На мусор — ValueError.
+    Снимок сбрасывается у себя и через NOTIFY в остальных процессах.
+    """
+    records = normalize_tiers(tiers)
+    await db.execute(delete(PriceTier))
+    await db.execute(insert(PriceTier), [r._asdict() for r in records])
+    await notify(db, PRICING_CHANNEL)
+    await commit(db)
+    pricing.invalidate()
+    return records
@@ -0,0 +1,79 @@
+# database/session.py
+"""
+Одна сессия БД на апдейт бота.
+
+DbSessionMiddleware (inner-middleware aiogram) открывает AsyncSession и кладёт её
+в data["db"] — хендлер получает её параметром `db`. Сессия ленивая: соединение
+берётся из пула при первом запросе, апдейты без запросов пул не трогают. Все
+функции репозитория внутри апдейта делят одну транзакцию и identity map.
+
+Мутаторы репозитория в такой сессии не коммитят (commit() ниже делает flush),
+транзакция фиксируется один раз:
+  - перед первым запросом к Bot API (CommitBeforeRequest) — соединение не висит
+    на время ответа Telegram, а ошибка commit не даст отправить «готово ✅»;
+  - или в конце хендлера, если он ничего не отправлял.
+Исключение в хендлере — откат всего апдейта.
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .engine import AsyncSessionLocal
+
+# флаг в session.info: транзакцией владеет middleware, репозиторий не коммитит
+DEFERRED_COMMIT = "deferred_commit"
+
+_current: ContextVar[Optional[AsyncSession]] = ContextVar("update_db_session", default=None)
+
+
+async def commit(db: AsyncSession) -> None:
+    """commit для мутаторов репозитория; в сессии апдейта — только flush."""
+    if db.info.get(DEFERRED_COMMIT):
+        await db.flush()
+    else:
+        await db.commit()
+
+
+async def _commit_pending(db: AsyncSession) -> None:
+    if db.in_transaction():
+        await db.commit()
+
+
+class DbSessionMiddleware:
+    """Inner-middleware aiogram: сессия апдейта в data["db"], commit — один на апдейт."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def __call__(self, handler, event, data):
+        async with self.session_factory() as db:      # выход без commit — rollback
+            db.info[DEFERRED_COMMIT] = True
+            data["db"] = db
+            token = _current.set(db)
+            try:
+                result = await handler(event, data)
+                await _commit_pending(db)
+            finally:
+                _current.reset(token)
+        return result
+
+
+class CommitBeforeRequest:
+    """Middleware сессии Bot API: перед вызовом Telegram зафиксировать транзакцию апдейта."""
+
+    async def __call__(self, make_request, bot, method):
+        db = _current.get()
+        if db is not None:
+            await _commit_pending(db)
+        return await make_request(bot, method)
+
+
+def instrument_dispatcher(dp, session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal) -> None:
+    """Повесить DbSessionMiddleware на все типы событий диспетчера (Bot — см. CommitBeforeRequest)."""
+    for event_name, observer in dp.observers.items():
+        if event_name in ("update", "error"):
+            continue
+        observer.middleware(DbSessionMiddleware(session_factory))
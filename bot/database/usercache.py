@@ -0,0 +1,170 @@
+# bot/database/usercache.py
+"""
+Кэш пользователей (UserRow) по telegram_id в памяти процесса.
+
+Пользователя ищут почти в каждом апдейте бота (/start, профиль) и в каждом
+заказе из API, а меняется он редко (телефон). Кэш ограничен по размеру (LRU)
+и по времени (ttl); «пользователя нет» тоже кэшируется, но коротко.
+
+Одновременные промахи по одному ключу не идут в БД толпой: SELECT делает
+первый, остальные ждут его результат. create_user / upsert_user / update_user_phone
+сбрасывают ключ у себя и шлют NOTIFY остальным процессам (бот и API — см. notify.py).
+Сессия, которая сама меняла пользователя, читает его мимо кэша до конца транзакции;
+записанная строка попадает в кэш только после COMMIT.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import User
+from .projections import UserRow
+
+USER_CHANNEL = "daim_users"
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# session.info: telegram_id, изменённые в транзакции сессии (ещё не закоммичены),
+# и строки, которые положить в кэш после COMMIT
+_WRITTEN = "user_cache_written"
+_ON_COMMIT = "user_cache_on_commit"
+# результат лидера, у которого SELECT упал: ждавшие читают сами
+_FAILED = object()
+
+
+class _Entry(NamedTuple):
+    user: Optional[UserRow]
+    expires_at: float           # monotonic
+
+
+class UserCache:
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL, negative_ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # новый пользователь появляется сразу после промаха (/start) — «нет» живёт недолго
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    # ---- сброс ----
+
+    def invalidate(self, payload: Optional[str] = None) -> None:
+        """Callback для NotifyListener: payload — telegram_id; None — сбросить всё."""
+        self._generation += 1
+        self.invalidations += 1
+        if payload is None:
+            self._entries.clear()
+        elif payload:
+            self._entries.pop(int(payload), None)
+
+    def changed(self, db: AsyncSession, telegram_id: int, user: Optional[UserRow] = None) -> None:
+        """
+        Пользователь изменён в транзакции db: сбросить ключ, в этой сессии — читать мимо кэша.
+        user — новая строка: попадёт в кэш после COMMIT (при откате — нет).
+        """
+        db.info.setdefault(_WRITTEN, set()).add(int(telegram_id))
+        if user is not None:
+            db.info.setdefault(_ON_COMMIT, []).append((self, user))
+        self.invalidate(str(telegram_id))
+
+    # ---- чтение ----
+
+    def peek(self, telegram_id: int) -> Optional[UserRow]:
+        """Только из памяти, без БД: None — не закэширован (или кэширован как «нет»)."""
+        entry = self._entries.get(int(telegram_id))
+        if entry is None or entry.user is None or entry.expires_at <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(int(telegram_id))
+        return entry.user
+
+    async def get(self, db: AsyncSession, telegram_id: int) -> Optional[UserRow]:
+        key = int(telegram_id)
+        if key in db.info.get(_WRITTEN, ()):
+            return await self._select(db, key)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.user
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            user = await asyncio.shield(pending)
+            if user is not _FAILED:
+                return user
+            return await self._select(db, key)
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            user = await self._select(db, key)
+        except BaseException:
+            future.set_result(_FAILED)
+            raise
+        finally:
+            del self._inflight[key]
+        # сброс во время чтения — строка могла устареть, отдаём, но не кэшируем
+        if generation == self._generation:
+            self._remember(key, user)
+        future.set_result(user)
+        return user
+
+    async def _select(self, db: AsyncSession, telegram_id: int) -> Optional[UserRow]:
+        result = await db.execute(
+            select(User.id, User.telegram_id, User.name, User.phone, User.created_at)
+            .where(User.telegram_id == telegram_id)
+        )
+        row = result.first()
+        return UserRow(*row) if row is not None else None
+
+    def _remember(self, key: int, user: Optional[UserRow]) -> None:
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._entries[key] = _Entry(user, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    session.info.pop(_WRITTEN, None)
+    for cache, user in session.info.pop(_ON_COMMIT, ()):
+        cache._remember(user.telegram_id, user)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session: Session, _previous_transaction) -> None:
+    session.info.pop(_WRITTEN, None)
+    session.info.pop(_ON_COMMIT, None)
+
+
+user_cache = UserCache()
@@ -7,16 +7,23 @@ from aiogram.types import (
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import ADMINS
 
-from database.engine import AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.engine import pool_stats
+from database.catalog import catalog
+from database.pricing import pricing
 from database.repository import (
-    get_all_users_page, get_all_orders_page,
-    get_user_by_telegram_id, get_order_by_id,
+    get_users_keyset, get_orders_keyset, get_order_row,
     set_order_status, set_order_paid,
-    get_products_page, create_product, update_product_price, delete_product,
+    get_products_keyset, create_product, update_product_price, delete_product,
+    check_bottle_ledger, search_orders, OrderLoad, SEARCH_MIN_LENGTH,
+    get_sales_by_day, get_sales_by_status, get_sales_by_product, check_sales_rollup,
+    create_broadcast, set_broadcast_message, cancel_broadcast, replace_price_tiers,
 )
+from broadcast import broadcaster, progress_text, stop_callback
 
 router = Router()
 
@@ -39,6 +46,10 @@ def admin_menu_kb() -> InlineKeyboardMarkup:
         ],
         [
             InlineKeyboardButton(text="🧃 Товары", callback_data="admin:products:0"),
+            InlineKeyboardButton(text="📈 Продажи", callback_data="admin:sales:30"),
+        ],
+        [
+            InlineKeyboardButton(text="📣 Рассылка", callback_data="admin:bcast"),
         ],
         [InlineKeyboardButton(text="🏠 Клиентское меню", callback_data="nav:menu")],
     ])
@@ -49,6 +60,22 @@ async def send_or_edit(event: Message | CallbackQuery, text: str, kb: InlineKeyb
     else:
         return await event.message.edit_text(text, reply_markup=kb, disable_web_page_preview=True)
 
+def parse_page_cb(data: str) -> tuple[int, str | None]:
+    """admin:<section>:<page>[:<cursor>] → (page, cursor). Номер страницы — только для подписи."""
+    parts = data.split(":")
+    page = int(parts[2])
+    cursor = parts[3] if len(parts) > 3 and parts[3] else None
+    return page, cursor
+
+def page_nav_row(section: str, page: int, next_cursor: str | None, prev_cursor: str | None,
+                 prev_text: str = "⬅️ Назад", next_text: str = "Вперёд ➡️") -> list:
+    row = []
+    if prev_cursor:
+        row.append(InlineKeyboardButton(text=prev_text, callback_data=f"admin:{section}:{page-1}:{prev_cursor}"))
+    if next_cursor:
+        row.append(InlineKeyboardButton(text=next_text, callback_data=f"admin:{section}:{page+1}:{next_cursor}"))
+    return row
+
 # ---------- /admin ----------
 @router.message(Command("admin"))
 async def admin_cmd(message: Message):
@@ -56,6 +83,97 @@ async def admin_cmd(message: Message):
         return await deny_not_admin(message)
     await message.answer("<b>Админ-панель</b>", reply_markup=admin_menu_kb())
 
+# ---------- /ledger_check ----------
+@router.message(Command("ledger_check"))
+async def ledger_check_cmd(message: Message, db: AsyncSession):
+    """Сверка счётчика оплаченных бутылок с заказами. `/ledger_check fix` — исправить."""
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    fix = message.text.split()[1:] == ["fix"]
+    mismatches = await check_bottle_ledger(db, fix=fix)
+    if not mismatches:
+        return await message.answer("Счётчик бутылок сходится ✅")
+    lines = [f"<b>Расхождений: {len(mismatches)}</b>{' (исправлено)' if fix else ''}", ""]
+    for user_id, ledger, actual in mismatches[:30]:
+        lines.append(f"• user <code>{user_id}</code>: счётчик {ledger}, по заказам {actual}")
+    await message.answer("\n".join(lines))
+
+# ---------- /sales_check ----------
+@router.message(Command("sales_check"))
+async def sales_check_cmd(message: Message, db: AsyncSession):
+    """Сверка дневной сводки продаж с заказами. `/sales_check fix` — исправить."""
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    fix = message.text.split()[1:] == ["fix"]
+    mismatches = await check_sales_rollup(db, fix=fix)
+    if not mismatches:
+        return await message.answer("Сводка продаж сходится ✅")
+    lines = [f"<b>Расхождений: {len(mismatches)}</b>{' (исправлено)' if fix else ''}", ""]
+    for (day, product_id, status, is_paid), stored, actual in mismatches[:30]:
+        lines.append(
+            f"• {day:%d.%m.%Y} товар {product_id or 'все'} {status.value}{' оплачен' if is_paid else ''}: "
+            f"сводка {'/'.join(map(str, stored))}, по заказам {'/'.join(map(str, actual))}"
+        )
+    await message.answer("\n".join(lines))
+
+# ---------- /tiers ----------
+@router.message(Command("tiers"))
+async def tiers_cmd(message: Message, db: AsyncSession):
+    """Ценовые уровни. `/tiers 1=2.50 100=2.40 500=2.20` — заменить все (от N бутылок = цена за бутылку)."""
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    args = message.text.split()[1:]
+    if args:
+        try:
+            tiers = [(int(m), parse_price_to_cents(p)) for m, p in (a.split("=", 1) for a in args)]
+            records = await replace_price_tiers(db, tiers)
+        except ValueError as exc:
+            return await message.answer(f"Не понял уровни: {exc}\nПример: /tiers 1=2.50 100=2.40 500=2.20")
+        header = "Ценовые уровни обновлены ✅"
+    else:
+        records = (await pricing.get(db)).tiers
+        header = "<b>Ценовые уровни</b>"
+    lines = [header, ""] + [f"от {t.min_bottles} бут. — {fmt_price(t.price_cents)}" for t in records]
+    await message.answer("\n".join(lines))
+
+# ---------- /pool ----------
+@router.message(Command("pool"))
+async def pool_cmd(message: Message):
+    """Состояние пула соединений с БД этого процесса (бота)."""
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    st = pool_stats()
+    fmt_ms = lambda v: "—" if v is None else f"{v} мс"
+    await message.answer(
+        f"<b>Пул БД</b> (профиль <code>{st['profile']}</code>{', PgBouncer' if st['pgbouncer'] else ''})\n"
+        f"Занято: {st['checked_out']} / {st['pool_size']} (+{st['overflow']} из {st['max_overflow']} overflow)\n"
+        f"Свободно: {st['checked_in']}\n"
+        f"Выдач: {st['checkouts']}, таймаутов: {st['timeouts']}\n"
+        f"Ожидание: p50 {fmt_ms(st['wait_ms_p50'])}, p95 {fmt_ms(st['wait_ms_p95'])}, max {fmt_ms(st['wait_ms_max'])}"
+    )
+
+# ---------- /find ----------
+@router.message(Command("find"))
+async def find_orders_cmd(message: Message, db: AsyncSession):
+    """Поиск заказов: `/find 123` — по номеру, `/find ленина` — по адресу, `/find 916` — и по телефону."""
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    q = message.text.partition(" ")[2].strip()
+    if not q.isdigit() and len(q) < SEARCH_MIN_LENGTH:
+        return await message.answer(f"Использование: /find &lt;номер, адрес или телефон&gt; (от {SEARCH_MIN_LENGTH} символов)")
+    hits, _ = await search_orders(db, q, limit=10, load=OrderLoad.summary)
+    if not hits:
+        return await message.answer("Ничего не найдено.")
+    rows = []
+    for o, _rank in hits:
+        status = STATUS_LABELS.get(getattr(o, "status", None), "—") if o.is_paid else "⏳ Не оплачен"
+        label = f"#{o.id} • {o.address[:28]} • {o.phone} • {status}"
+        rows.append([InlineKeyboardButton(text=label, callback_data=f"admin:order:{o.id}")])
+    await message.answer(
+        f"<b>Найдено: {len(hits)}</b>",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
+    )
+
 @router.callback_query(F.data == "admin:menu")
 async def admin_menu(cb: CallbackQuery):
     if not is_admin(cb.from_user.id):
@@ -64,24 +182,18 @@ async def admin_menu(cb: CallbackQuery):
     await send_or_edit(cb, "<b>Админ-панель</b>", admin_menu_kb())
 
 # ---------- Users ----------
-def users_kb(page: int, has_next: bool) -> InlineKeyboardMarkup:
-    row = []
-    if page > 0:
-        row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin:users:{page-1}"))
-    if has_next:
-        row.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"admin:users:{page+1}"))
+def users_kb(page: int, next_cursor: str | None, prev_cursor: str | None) -> InlineKeyboardMarkup:
+    row = page_nav_row("users", page, next_cursor, prev_cursor)
     rows = [row] if row else []
     rows.append([InlineKeyboardButton(text="🏁 В админ-меню", callback_data="admin:menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 @router.callback_query(F.data.startswith("admin:users:"))
-async def admin_users(cb: CallbackQuery):
+async def admin_users(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
-    page = int(cb.data.split(":")[2])
-    limit = 10
-    async with AsyncSessionLocal() as db:
-        items, total = await get_all_users_page(db, limit=limit, offset=page*limit)
+    page, cursor = parse_page_cb(cb.data)
+    items, total, next_cursor, prev_cursor = await get_users_keyset(db, limit=10, cursor=cursor)
     if not items:
         text = "<b>Пользователи</b>\nНет данных."
     else:
@@ -89,9 +201,8 @@ async def admin_users(cb: CallbackQuery):
         for u in items:
             lines.append(f"• <code>{u.id}</code> — {u.name or 'без имени'} — tg:<code>{u.telegram_id}</code> — {u.phone or '—'}")
         text = "\n".join(lines)
-    has_next = (page + 1) * limit < total
     await cb.answer()
-    await send_or_edit(cb, text, users_kb(page, has_next))
+    await send_or_edit(cb, text, users_kb(page, next_cursor, prev_cursor))
 
 # ---------- Orders ----------
 def fmt_price(minor: int) -> str:
@@ -109,27 +220,22 @@ STATUS_LABELS = {
     "completed":  "✅ Завершён",
 }
 
-def admin_orders_kb(page: int, has_next: bool) -> InlineKeyboardMarkup:
-    nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin:orders:{page-1}"))
-    if has_next:
-        nav.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"admin:orders:{page+1}"))
+def admin_orders_kb(page: int, next_cursor: str | None, prev_cursor: str | None) -> InlineKeyboardMarkup:
+    nav = page_nav_row("orders", page, next_cursor, prev_cursor)
     rows = [nav] if nav else []
     rows.append([InlineKeyboardButton(text="🏁 В админ-меню", callback_data="admin:menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 @router.callback_query(F.data.startswith("admin:orders:"))
-async def admin_orders(cb: CallbackQuery):
+async def admin_orders(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
-    page = int(cb.data.split(":")[2])
-    limit = 10
-    async with AsyncSessionLocal() as db:
-        items, total = await get_all_orders_page(db, limit=limit, offset=page*limit)
+    page, cursor = parse_page_cb(cb.data)
+    (items, total, next_cursor, prev_cursor), _ = await get_orders_keyset(db, limit=10, cursor=cursor)
+    snap = await catalog.get(db)
     if not items:
         text = "<b>Заказы</b>\nНет данных."
-        kb = admin_orders_kb(page, False)
+        kb = admin_orders_kb(page, None, None)
     else:
         lines = [f"<b>Заказы</b> (стр {page+1}, всего {total})", ""]
         for o in items:
@@ -137,7 +243,7 @@ async def admin_orders(cb: CallbackQuery):
 
             # собираем список позиций заказа
             item_lines = [
-                f"{item.product.name} ×{item.quantity}"
+                f"{snap.name_of(item.product_id)} ×{item.quantity}"
                 for item in o.items
             ]
             items_str = ", ".join(item_lines) if item_lines else "—"
@@ -148,7 +254,7 @@ async def admin_orders(cb: CallbackQuery):
             )
 
         text = "\n".join(lines)
-        kb = admin_orders_kb(page, (page+1)*limit < total)
+        kb = admin_orders_kb(page, next_cursor, prev_cursor)
 
     await cb.answer()
     await send_or_edit(cb, text, kb)
@@ -172,77 +278,192 @@ def order_admin_actions_kb(order_id: int, is_paid: bool) -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 @router.callback_query(F.data.startswith("admin:order:"))
-async def admin_order_details(cb: CallbackQuery):
+async def admin_order_details(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
     order_id = int(cb.data.split(":")[2])
-    async with AsyncSessionLocal() as db:
-        o = await get_order_by_id(db, order_id)
+    o, _ = await get_order_row(db, order_id)
+    snap = await catalog.get(db)
     if not o:
         return await cb.answer("Заказ не найден", show_alert=True)
-    status = STATUS_LABELS.get(getattr(o, "status", None), "—") if o.is_paid else "⏳ Не оплачен"
-    text = (
-        f"<b>Заказ #{o.id}</b>\n"
-        f"Дата: {fmt_dt(o.date)}\n"
-        f"Клиент: <a href='tg://user?id={o.telegram_id}'>профиль</a>\n"
-        f"Товар: {o.flavor} ×{o.bottle_count}\n"
-        f"Сумма: {fmt_price(o.price)}\n"
-        f"Статус: {status}\n\n"
-        f"Адрес: {o.address}\nТелефон: {o.phone}"
-    )
     await cb.answer()
-    await send_or_edit(cb, text, order_admin_actions_kb(o.id, o.is_paid))
+    await send_or_edit(cb, _render_order_text(o, snap), order_admin_actions_kb(o.id, o.is_paid))
 
 @router.callback_query(F.data.startswith("admin:ost:"))
-async def admin_set_status(cb: CallbackQuery):
+async def admin_set_status(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
     _, _, order_id, status = cb.data.split(":")
     order_id = int(order_id)
-    async with AsyncSessionLocal() as db:
-        await set_order_status(db, order_id, status)
-        o = await get_order_by_id(db, order_id)
+    o = await set_order_status(db, order_id, status)     # уже обновлённый — не перечитываем
+    if not o:
+        return await cb.answer("Заказ не найден", show_alert=True)
+    snap = await catalog.get(db)
     await cb.answer("Статус обновлён ✅")
-    await send_or_edit(cb, await _render_order_text(o), order_admin_actions_kb(o.id, o.is_paid))
+    await send_or_edit(cb, _render_order_text(o, snap), order_admin_actions_kb(o.id, o.is_paid))
 
-async def _render_order_text(o):
+def _render_order_text(o, snap):
     status = STATUS_LABELS.get(getattr(o, "status", None), "—") if o.is_paid else "⏳ Не оплачен"
+    items_str = ", ".join(f"{snap.name_of(it.product_id)} ×{it.quantity}" for it in o.items) or "—"
     return (
         f"<b>Заказ #{o.id}</b>\n"
         f"Дата: {fmt_dt(o.date)}\n"
         f"Клиент: <a href='tg://user?id={o.telegram_id}'>профиль</a>\n"
-        f"Товар: {o.flavor} ×{o.bottle_count}\n"
-        f"Сумма: {fmt_price(o.price)}\n"
+        f"Товары: {items_str}\n"
+        f"Сумма: {fmt_price(o.total_price_cents)}\n"
         f"Статус: {status}\n\n"
         f"Адрес: {o.address}\nТелефон: {o.phone}"
     )
 
 @router.callback_query(F.data.startswith("admin:paid:"))
-async def admin_mark_paid(cb: CallbackQuery):
+async def admin_mark_paid(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
     order_id = int(cb.data.split(":")[2])
-    async with AsyncSessionLocal() as db:
-        await set_order_paid(db, order_id)
-        o = await get_order_by_id(db, order_id)
+    o = await set_order_paid(db, order_id)
+    if not o:
+        return await cb.answer("Заказ не найден", show_alert=True)
+    snap = await catalog.get(db)
     await cb.answer("Помечен как оплаченный ✅")
-    await send_or_edit(cb, await _render_order_text(o), order_admin_actions_kb(o.id, o.is_paid))
+    await send_or_edit(cb, _render_order_text(o, snap), order_admin_actions_kb(o.id, o.is_paid))
+
+# ---------- Sales ----------
+SALES_PERIODS = (7, 30, 90)
+
+def sales_kb(days: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=f"{'• ' if d == days else ''}{d} дн.", callback_data=f"admin:sales:{d}")
+            for d in SALES_PERIODS
+        ],
+        [InlineKeyboardButton(text="🏁 В админ-меню", callback_data="admin:menu")],
+    ])
+
+@router.callback_query(F.data.startswith("admin:sales:"))
+async def admin_sales(cb: CallbackQuery, db: AsyncSession):
+    """Продажи за последние N дней — из дневной сводки (sales_daily), не по заказам."""
+    if not is_admin(cb.from_user.id):
+        return await deny_not_admin(cb)
+    days = int(cb.data.split(":")[2])
+    date_to = datetime.utcnow().date()
+    date_from = date_to - timedelta(days=days - 1)
+    by_day = await get_sales_by_day(db, date_from, date_to)
+    by_status = await get_sales_by_status(db, date_from, date_to)
+    by_product = await get_sales_by_product(db, date_from, date_to)
+    snap = await catalog.get(db)
+
+    orders = sum(r.orders for r in by_status)
+    paid = sum(r.paid_orders for r in by_status)
+    lines = [
+        f"<b>Продажи за {days} дн.</b> ({date_from:%d.%m}–{date_to:%d.%m}, UTC)",
+        f"Заказов: {orders} (оплачено {paid}, не оплачено {orders - paid})",
+        f"Бутылок: {sum(r.bottles for r in by_status)}",
+        f"Сумма: {fmt_price(sum(r.revenue_cents for r in by_status))} "
+        f"(оплачено {fmt_price(sum(r.paid_revenue_cents for r in by_status))})",
+    ]
+    if by_status:
+        lines += ["", "<b>По статусам</b>"]
+        lines += [f"{STATUS_LABELS.get(r.key, r.key)}: {r.orders} • {fmt_price(r.revenue_cents)}" for r in by_status]
+    if by_product:
+        lines += ["", "<b>Товары</b>"]
+        lines += [
+            f"• {snap.name_of(r.key)} — {r.bottles} шт. — {fmt_price(r.revenue_cents)}"
+            for r in by_product[:10]
+        ]
+    if by_day:
+        lines += ["", "<b>По дням</b>"]
+        lines += [
+            f"{r.key:%d.%m} — {r.orders} зак. — {fmt_price(r.revenue_cents)}"
+            for r in by_day[-10:]
+        ]
+    await cb.answer()
+    await send_or_edit(cb, "\n".join(lines), sales_kb(days))
+
+# ---------- Broadcast ----------
+class AdminBroadcast(StatesGroup):
+    text = State()
+    confirm = State()
+
+async def broadcast_prompt(event: Message | CallbackQuery, state: FSMContext):
+    await state.set_state(AdminBroadcast.text)
+    await send_or_edit(event, "Пришлите <b>текст рассылки</b> — уйдёт всем пользователям бота (форматирование сохранится):",
+                       InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="❌ Отменить", callback_data="admin:bccancel")]]))
+
+@router.message(Command("broadcast"))
+async def broadcast_cmd(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    await broadcast_prompt(message, state)
+
+@router.callback_query(F.data == "admin:bcast")
+async def broadcast_open(cb: CallbackQuery, state: FSMContext):
+    if not is_admin(cb.from_user.id):
+        return await deny_not_admin(cb)
+    await cb.answer()
+    await broadcast_prompt(cb, state)
+
+@router.message(AdminBroadcast.text)
+async def broadcast_text(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await deny_not_admin(message)
+    if not message.text:
+        return await message.answer("Нужен текст сообщения.")
+    await state.update_data(text=message.html_text)
+    await state.set_state(AdminBroadcast.confirm)
+    await message.answer(message.html_text, disable_web_page_preview=True)
+    await message.answer("Разослать это сообщение всем пользователям?", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Разослать", callback_data="admin:bcgo"),
+        InlineKeyboardButton(text="❌ Отменить", callback_data="admin:bccancel"),
+    ]]))
+
+@router.callback_query(F.data == "admin:bccancel")
+async def broadcast_cancel_draft(cb: CallbackQuery, state: FSMContext):
+    if not is_admin(cb.from_user.id):
+        return await deny_not_admin(cb)
+    await state.clear()
+    await cb.answer("Отменено")
+    await send_or_edit(cb, "<b>Админ-панель</b>", admin_menu_kb())
+
+@router.callback_query(AdminBroadcast.confirm, F.data == "admin:bcgo")
+async def broadcast_go(cb: CallbackQuery, state: FSMContext, db: AsyncSession):
+    if not is_admin(cb.from_user.id):
+        return await deny_not_admin(cb)
+    text = (await state.get_data())["text"]
+    await state.clear()
+    b = await create_broadcast(db, text=text, created_by=cb.from_user.id, chat_id=cb.message.chat.id)
+    await cb.answer("Рассылка запущена")
+    msg = await send_or_edit(cb, progress_text(b), InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⏹ Остановить", callback_data=stop_callback(b.id)),
+    ]]))
+    await set_broadcast_message(db, b.id, msg.message_id)
+    # отправку ведёт фоновая задача; прогресс — правками этого сообщения
+    broadcaster.launch(b.id)
+
+@router.callback_query(F.data.startswith("admin:bcstop:"))
+async def broadcast_stop(cb: CallbackQuery, db: AsyncSession):
+    if not is_admin(cb.from_user.id):
+        return await deny_not_admin(cb)
+    broadcast_id = int(cb.data.split(":")[2])
+    b = await cancel_broadcast(db, broadcast_id)
+    # рассылку мог вести другой процесс: он увидит статус при сохранении пачки
+    broadcaster.cancel(broadcast_id)
+    if b is None:
+        return await cb.answer("Рассылка уже завершена")
+    await cb.answer("Рассылка остановлена ⏹")
+    await send_or_edit(cb, progress_text(b))
 
 # ---------- Products ----------
 class AdminAddProduct(StatesGroup):
     name = State()
     price = State()
 
-def products_list_kb(page: int, has_next: bool, items) -> InlineKeyboardMarkup:
+def products_list_kb(page: int, next_cursor: str | None, prev_cursor: str | None, items) -> InlineKeyboardMarkup:
     rows = []
     for p in items:
         rows.append([InlineKeyboardButton(text=f"#{p.id} • {p.name} • {fmt_price(p.price_cents)}", callback_data=f"admin:prod:{p.id}")])
     nav = []
     nav.append(InlineKeyboardButton(text="➕ Добавить", callback_data="admin:padd"))
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"admin:products:{page-1}"))
-    if has_next:
-        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"admin:products:{page+1}"))
+    nav += page_nav_row("products", page, next_cursor, prev_cursor, prev_text="⬅️", next_text="➡️")
     rows.append(nav)
     rows.append([InlineKeyboardButton(text="🏁 Админ-меню", callback_data="admin:menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -257,16 +478,14 @@ def product_actions_kb(pid: int) -> InlineKeyboardMarkup:
     ])
 
 @router.callback_query(F.data.startswith("admin:products:"))
-async def admin_products(cb: CallbackQuery):
+async def admin_products(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
-    page = int(cb.data.split(":")[2])
-    limit = 10
-    async with AsyncSessionLocal() as db:
-        items, total = await get_products_page(db, limit=limit, offset=page*limit)
+    page, cursor = parse_page_cb(cb.data)
+    items, total, next_cursor, prev_cursor = await get_products_keyset(db, limit=10, cursor=cursor)
     header = f"<b>🧃 Товары</b> (стр {page+1}, всего {total})"
     await cb.answer()
-    await send_or_edit(cb, header, products_list_kb(page, (page+1)*limit < total, items))
+    await send_or_edit(cb, header, products_list_kb(page, next_cursor, prev_cursor, items))
 
 @router.callback_query(F.data == "admin:padd")
 async def product_add_start(cb: CallbackQuery, state: FSMContext):
@@ -297,7 +516,7 @@ def parse_price_to_cents(s: str) -> int:
     return int(float(s)) * 100
 
 @router.message(AdminAddProduct.price)
-async def product_add_price(message: Message, state: FSMContext):
+async def product_add_price(message: Message, state: FSMContext, db: AsyncSession):
     if not is_admin(message.from_user.id):
         return await deny_not_admin(message)
     try:
@@ -306,12 +525,11 @@ async def product_add_price(message: Message, state: FSMContext):
         return await message.answer("Не понял цену. Пример: 350 или 350.50")
     data = await state.get_data()
     name = data["name"]
-    async with AsyncSessionLocal() as db:
-        await create_product(db, name=name, price_cents=price_cents)
-        items, total = await get_products_page(db, limit=10, offset=0)
+    await create_product(db, name=name, price_cents=price_cents)
+    page = await get_products_keyset(db, limit=10)
     await state.clear()
     await message.answer("Товар добавлен ✅")
-    await message.answer("<b>🧃 Товары</b> (стр 1)", reply_markup=products_list_kb(0, total > 10, items))
+    await message.answer("<b>🧃 Товары</b> (стр 1)", reply_markup=products_list_kb(0, page.next_cursor, None, page.items))
 
 @router.callback_query(F.data.startswith("admin:prod:"))
 async def product_open(cb: CallbackQuery):
@@ -319,21 +537,18 @@ async def product_open(cb: CallbackQuery):
         return await deny_not_admin(cb)
     pid = int(cb.data.split(":")[2])
     # Здесь показываем карточку товара по id (минимал)
-    async with AsyncSessionLocal() as db:
-        items, _ = await get_products_page(db, limit=1, offset=0)  # простой способ показать список заново
     await cb.answer()
     await send_or_edit(cb, f"<b>Товар #{pid}</b>\nВыберите действие:", product_actions_kb(pid))
 
 @router.callback_query(F.data.startswith("admin:pdel:"))
-async def product_delete(cb: CallbackQuery):
+async def product_delete(cb: CallbackQuery, db: AsyncSession):
     if not is_admin(cb.from_user.id):
         return await deny_not_admin(cb)
     pid = int(cb.data.split(":")[2])
-    async with AsyncSessionLocal() as db:
-        await delete_product(db, pid)
-        items, total = await get_products_page(db, limit=10, offset=0)
+    await delete_product(db, pid)
+    page = await get_products_keyset(db, limit=10)
     await cb.answer("Удалено ✅")
-    await send_or_edit(cb, "<b>🧃 Товары</b> (стр 1)", products_list_kb(0, total > 10, items))
+    await send_or_edit(cb, "<b>🧃 Товары</b> (стр 1)", products_list_kb(0, page.next_cursor, None, page.items))
 
 class AdminEditPrice(StatesGroup):
     pid = State()
@@ -351,7 +566,7 @@ async def product_edit_price(cb: CallbackQuery, state: FSMContext):
     await send_or_edit(cb, f"Введите новую цену для товара #{pid}:")
 
 @router.message(AdminEditPrice.price)
-async def product_edit_price_value(message: Message, state: FSMContext):
+async def product_edit_price_value(message: Message, state: FSMContext, db: AsyncSession):
     if not is_admin(message.from_user.id):
         return await deny_not_admin(message)
     data = await state.get_data()
@@ -360,9 +575,8 @@ async def product_edit_price_value(message: Message, state: FSMContext):
         price_cents = parse_price_to_cents(message.text)
     except Exception:
         return await message.answer("Не понял цену. Пример: 350 или 350.50")
-    async with AsyncSessionLocal() as db:
-        await update_product_price(db, pid, price_cents)
-        items, total = await get_products_page(db, limit=10, offset=0)
+    await update_product_price(db, pid, price_cents)
+    page = await get_products_keyset(db, limit=10)
     await state.clear()
     await message.answer("Цена обновлена ✅")
-    await message.answer("<b>🧃 Товары</b> (стр 1)", reply_markup=products_list_kb(0, total > 10, items))
+    await message.answer("<b>🧃 Товары</b> (стр 1)", reply_markup=products_list_kb(0, page.next_cursor, None, page.items))
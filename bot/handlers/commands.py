@@ -6,12 +6,13 @@ from aiogram.types import (
     LabeledPrice, PreCheckoutQuery
 )
 from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import Order
 
-from database.engine import AsyncSessionLocal
+from database.catalog import catalog
 from database.repository import (
-    get_user_by_telegram_id, create_user,
-    get_orders_by_user, get_order_by_id, set_order_paid,
+    get_user_by_telegram_id, ensure_user,
+    load_orders, get_order_row, set_order_paid, OrderLoad,
     get_orders_count_by_telegram_id, get_total_bottles_by_user,
 )
 
@@ -41,9 +42,9 @@ def fmt_status(order) -> str:
         return "⏳ Не оплачен"
     return STATUS_LABELS.get(getattr(order, "status", None), "🚧 В обработке")
 
-def order_card_text(o: Order) -> str:
+def order_card_text(o, snap) -> str:
     items_text = "\n".join(
-        f"{it.quantity} × {it.product.name} — {fmt_price(it.line_total_cents)}"
+        f"{it.quantity} × {snap.name_of(it.product_id)} — {fmt_price(it.line_total_cents)}"
         for it in o.items
     )
     return (
@@ -108,11 +109,10 @@ async def send_or_edit(event: Message | CallbackQuery, text: str, kb: InlineKeyb
         return await event.message.edit_text(text, reply_markup=kb, disable_web_page_preview=True)
 
 @router.message(CommandStart())
-async def start(message: Message):
-    async with AsyncSessionLocal() as db:
-        user = await get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            await create_user(db, telegram_id=message.from_user.id, name=message.from_user.full_name)
+async def start(message: Message, db: AsyncSession):
+    # db — сессия апдейта (database/session.py): commit один, перед ответом
+    # известный пользователь — из кэша без запроса, иначе один upsert (гонка двух /start безопасна)
+    await ensure_user(db, message.from_user.id, name=message.from_user.full_name)
     await message.answer(
         "Добро пожаловать в <b>Daim Coffee</b> ☕",
         reply_markup=menu_kb()
@@ -124,11 +124,10 @@ async def nav_menu(cb: CallbackQuery):
     await send_or_edit(cb, "Главное меню:", menu_kb())
 
 @router.callback_query(F.data == "nav:profile")
-async def profile(cb: CallbackQuery):
-    async with AsyncSessionLocal() as db:
-        user = await get_user_by_telegram_id(db, cb.from_user.id)
-        orders_count = await get_orders_count_by_telegram_id(db, cb.from_user.id)
-        total_bottles = await get_total_bottles_by_user(db, user.id) if user else 0
+async def profile(cb: CallbackQuery, db: AsyncSession):
+    user = await get_user_by_telegram_id(db, cb.from_user.id)
+    orders_count = await get_orders_count_by_telegram_id(db, cb.from_user.id)
+    total_bottles = await get_total_bottles_by_user(db, cb.from_user.id)
     phone = user.phone if user and user.phone else "—"
     text = (
         "<b>👤 Профиль</b>\n\n"
@@ -154,35 +153,35 @@ async def faq(cb: CallbackQuery):
     await send_or_edit(cb, FAQ_TEXT, faq_kb())
 
 @router.callback_query(F.data == "orders:list")
-async def orders_list(cb: CallbackQuery):
-    async with AsyncSessionLocal() as db:
-        user = await get_user_by_telegram_id(db, cb.from_user.id)
-        orders = await get_orders_by_user(db, user.id) if user else []
+async def orders_list(cb: CallbackQuery, db: AsyncSession):
+    # для кнопок хватает столбцов заказа — позиции не грузим
+    orders, _ = await load_orders(
+        db, Order.telegram_id == cb.from_user.id, limit=10, load=OrderLoad.summary,
+    )
     if not orders:
         await cb.answer()
         return await send_or_edit(cb, "У вас пока нет заказов.", InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🏠 Меню", callback_data="nav:menu")]]
         ))
-    orders = orders[:10]
     header = "<b>📦 Ваши заказы</b>\nВыберите заказ:"
     await cb.answer()
     await send_or_edit(cb, header, orders_list_kb(orders))
 
 @router.callback_query(F.data.startswith("order:"))
-async def order_details(cb: CallbackQuery):
+async def order_details(cb: CallbackQuery, db: AsyncSession):
     order_id = int(cb.data.split(":")[1])
-    async with AsyncSessionLocal() as db:
-        o = await get_order_by_id(db, order_id)
+    o, _ = await get_order_row(db, order_id)
+    snap = await catalog.get(db)
     if not o or o.telegram_id != cb.from_user.id:
         return await cb.answer("Заказ не найден", show_alert=True)
     await cb.answer()
-    await send_or_edit(cb, order_card_text(o), order_actions_kb(o))
+    await send_or_edit(cb, order_card_text(o, snap), order_actions_kb(o))
 
 @router.callback_query(F.data.startswith("pay:"))
-async def pay_order(cb: CallbackQuery):
+async def pay_order(cb: CallbackQuery, db: AsyncSession):
     order_id = int(cb.data.split(":")[1])
-    async with AsyncSessionLocal() as db:
-        o = await get_order_by_id(db, order_id)
+    o, _ = await get_order_row(db, order_id)
+    snap = await catalog.get(db)
     if not o or o.telegram_id != cb.from_user.id:
         return await cb.answer("Заказ не найден", show_alert=True)
     if o.is_paid:
@@ -190,12 +189,12 @@ async def pay_order(cb: CallbackQuery):
     prices = [
         LabeledPrice(
             label=f"Заказ №{o.id}",
-            amount=int(o.total_price * 100)  # переводим рубли → копейки
+            amount=o.total_price_cents
         )
     ]
     lines = []
     for item in o.items:
-        lines.append(f"{item.product.name} × {item.quantity}")
+        lines.append(f"{snap.name_of(item.product_id)} × {item.quantity}")
 
     description = "\n".join(lines) + f"\nИтого: {fmt_price(o.total_price_cents)}"
     await cb.message.bot.send_invoice(
@@ -214,12 +213,13 @@ async def pre_checkout(pcq: PreCheckoutQuery):
     await pcq.answer(ok=True)
 
 @router.message(F.successful_payment)
-async def successful_payment(message: Message):
+async def successful_payment(message: Message, db: AsyncSession):
     payload = message.successful_payment.invoice_payload
     if not payload.startswith("order:"):
         return await message.answer("Платёж получен, но заказ не найден. Напишите в поддержку.")
     order_id = int(payload.split(":")[1])
-    async with AsyncSessionLocal() as db:
-        await set_order_paid(db, order_id)
-        o = await get_order_by_id(db, order_id)
-    await message.answer("Спасибо за оплату! 🎉\n" + order_card_text(o), reply_markup=menu_kb())
+    o = await set_order_paid(db, order_id)     # уже в новом состоянии — не перечитываем
+    if not o:
+        return await message.answer("Платёж получен, но заказ не найден. Напишите в поддержку.")
+    snap = await catalog.get(db)
+    await message.answer("Спасибо за оплату! 🎉\n" + order_card_text(o, snap), reply_markup=menu_kb())
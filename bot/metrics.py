@@ -0,0 +1,367 @@
+# bot/metrics.py
+"""
+Метрики процесса в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+
+Один реестр на процесс: API отдаёт его на GET /metrics, бот — на своём
+METRICS_PORT (см. run.py). Инструментирование:
+  * MetricsMiddleware (ASGI) — латентность по маршруту и статусу, запросы в полёте,
+    число и время SQL-запросов на HTTP-запрос;
+  * instrument_engine(engine) — события SQLAlchemy: каждый запрос к БД;
+  * HandlerMetricsMiddleware (aiogram) — время каждого хендлера бота.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_float(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_float(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетам (не накопительные)..., +Inf], sum
+        self._values: Dict[Tuple[str, ...], Tuple[list, list]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = f'le="{_fmt_float(bound)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_float(total[0])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# кэши процесса: name -> stats() (hits/misses/coalesced/invalidations/size)
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+class CacheStatsMetric(_Metric):
+    """Значения из stats() кэшей процесса (см. instrument_cache) — читаются при рендере."""
+
+    def __init__(self, name: str, help_text: str, type_name: str, fields: Dict[str, str], label: str = ""):
+        super().__init__(name, help_text, ("cache", label) if label else ("cache",))
+        self.type_name = type_name
+        self.fields = fields        # ключ stats() -> значение метки label
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for cache, stats in sorted(_caches.items()):
+            values = stats()
+            for field, label_value in self.fields.items():
+                if values.get(field) is None:
+                    continue
+                key = (cache, label_value) if len(self.labelnames) > 1 else (cache,)
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_float(float(values[field]))}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def cache_stats(self, name: str, help_text: str, type_name: str, fields: Dict[str, str], label: str = ""):
+        return self._add(CacheStatsMetric(name, help_text, type_name, fields, label))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---- метрики ----
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "HTTP-запросы в обработке", ("method",))
+HTTP_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL-запросов на HTTP-запрос", ("method", "route"), QUERY_COUNT_BUCKETS)
+HTTP_DB_TIME = registry.histogram(
+    "http_request_db_seconds", "Время в БД на HTTP-запрос", ("method", "route"))
+
+DB_QUERIES = registry.counter("db_queries_total", "SQL-запросы", ("source",))
+DB_ERRORS = registry.counter("db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ("source",))
+DB_LATENCY = registry.histogram("db_query_duration_seconds", "Время SQL-запроса", ("source",))
+
+BOT_HANDLER_LATENCY = registry.histogram(
+    "bot_handler_duration_seconds", "Время хендлера бота", ("event", "handler", "status"))
+BOT_IN_FLIGHT = registry.gauge("bot_updates_in_flight", "Апдейты в обработке", ("event",))
+BOT_DB_QUERIES = registry.histogram(
+    "bot_handler_db_queries", "SQL-запросов на хендлер", ("event", "handler"), QUERY_COUNT_BUCKETS)
+
+CACHE_LOOKUPS = registry.cache_stats(
+    "cache_lookups_total", "Обращения к кэшу по результату", "counter",
+    {"hits": "hit", "misses": "miss", "coalesced": "coalesced"}, label="result")
+CACHE_INVALIDATIONS = registry.cache_stats(
+    "cache_invalidations_total", "Сбросы кэша", "counter", {"invalidations": ""})
+CACHE_ENTRIES = registry.cache_stats("cache_entries", "Записей в кэше", "gauge", {"size": ""})
+
+
+def instrument_cache(name: str, stats: Callable[[], dict]) -> None:
+    """Отдавать счётчики кэша в /metrics; hit rate — hit / сумма cache_lookups_total."""
+    _caches[name] = stats
+
+
+# ---- учёт SQL в рамках запроса / хендлера ----
+
+class DbUsage:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_db_usage: contextvars.ContextVar[Optional[DbUsage]] = contextvars.ContextVar("db_usage", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _make_after(source: str):
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        DB_QUERIES.inc(source=source)
+        DB_LATENCY.observe(elapsed, source=source)
+        usage = _db_usage.get()
+        if usage is not None:
+            usage.queries += 1
+            usage.seconds += elapsed
+    return _after_cursor_execute
+
+
+def _make_error(source: str):
+    def _handle_error(ctx):
+        stack = ctx.connection.info.get("metrics_started") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.inc(source=source)
+    return _handle_error
+
+
+def instrument_engine(engine, source: str = "app") -> None:
+    """Подписать метрики на события engine (AsyncEngine или Engine). Повторный вызов — no-op."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if getattr(sync_engine, "_metrics_instrumented", False):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _make_after(source))
+    event.listen(sync_engine, "handle_error", _make_error(source))
+    sync_engine._metrics_instrumented = True
+
+
+# ---- API: ASGI-middleware ----
+
+class MetricsMiddleware:
+    """
+    Чистый ASGI (без BaseHTTPMiddleware): не буферизует StreamingResponse.
+    Латентность — до последнего куска тела ответа (фоновые задачи после ответа не входят).
+    Маршрут — шаблон пути (/orders/{order_id}), неизвестные пути — "<unmatched>".
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        usage = DbUsage()
+        token = _db_usage.set(usage)
+        status = {"code": 500, "done": False}
+
+        def finish() -> None:
+            if status["done"]:
+                return
+            status["done"] = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=path, status=status["code"])
+            HTTP_DB_QUERIES.observe(usage.queries, method=method, route=path)
+            HTTP_DB_TIME.observe(usage.seconds, method=method, route=path)
+            HTTP_IN_FLIGHT.dec(method=method)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        HTTP_IN_FLIGHT.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+            _db_usage.reset(token)
+
+
+# ---- бот: middleware aiogram ----
+
+class HandlerMetricsMiddleware:
+    """Inner-middleware aiogram: в data уже есть выбранный хендлер."""
+
+    def __init__(self, event_name: str):
+        self.event_name = event_name
+
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        callback = getattr(handler_obj, "callback", None)
+        name = getattr(callback, "__name__", "unknown")
+        usage = DbUsage()
+        token = _db_usage.set(usage)
+        status = "ok"
+        started = time.perf_counter()
+        BOT_IN_FLIGHT.inc(event=self.event_name)
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            BOT_IN_FLIGHT.dec(event=self.event_name)
+            BOT_HANDLER_LATENCY.observe(time.perf_counter() - started, event=self.event_name, handler=name, status=status)
+            BOT_DB_QUERIES.observe(usage.queries, event=self.event_name, handler=name)
+            _db_usage.reset(token)
+
+
+def instrument_dispatcher(dp) -> None:
+    """Повесить HandlerMetricsMiddleware на все типы событий диспетчера (и вложенных роутеров)."""
+    for event_name, observer in dp.observers.items():
+        if event_name in ("update", "error"):
+            continue
+        observer.middleware(HandlerMetricsMiddleware(event_name))
+
+
+async def serve(host: str, port: int):
+    """Отдельный /metrics на aiohttp (для бота на long polling). Возвращает runner для cleanup()."""
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -1,12 +1,29 @@
 from aiogram import Bot, Dispatcher
 import logging
 import asyncio
-from config import BOT_TOKEN
+import multiprocessing
+import signal
+from config import (
+    BOT_TOKEN, METRICS_PORT, BOT_MODE, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST,
+    WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_CONCURRENCY,
+)
 from handlers import router
-from database.engine import engine as async_engine
+from database.engine import engine as async_engine, listen_engine
+from database.fsm import PostgresStorage, FSM_CHANNEL
+from database.notify import listener, CATALOG_CHANNEL
+from database.catalog import catalog
+from database.pricing import pricing, PRICING_CHANNEL
+from database.usercache import user_cache, USER_CHANNEL
+from database.activity import last_seen, ActivityMiddleware
 from database.models import Base
+from database import querybudget, session as db_session
+from database.session import CommitBeforeRequest
+import metrics
+from webhook import WebhookServer
+from broadcast import broadcaster
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties  # 👈 добавь
+from aiogram.client.session.base import BaseSession
 
 
 
@@ -14,27 +31,162 @@ async def create_tables():
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all) # ♻️ создаст заново
 
-async def main():
-    logging.basicConfig(level=logging.INFO)
-    await create_tables()  # ← добавь это
 
-    # ⬇️ правильная инициализация
+def build_bot(session: BaseSession | None = None) -> Bot:
     bot = Bot(
         BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
+    # транзакция апдейта фиксируется до запроса к Telegram, а не после ответа
+    bot.session.middleware(CommitBeforeRequest())
+    return bot
+
+
+async def on_startup():
+    await listener.start(listen_engine)
+    last_seen.start()
+    broadcaster.start()         # продолжить рассылки, брошенные упавшим процессом
+
+
+async def on_shutdown():
+    await broadcaster.stop()    # сохранить прогресс рассылок и отпустить аренду
+    await last_seen.stop()      # дописать накопленные last_seen_at
+    await listener.stop()
+
+
+def build_dispatcher() -> Dispatcher:
+    # состояния диалогов — в Postgres: переживают рестарт и общие для всех воркеров
+    storage = PostgresStorage()
+    listener.subscribe(FSM_CHANNEL, storage.invalidate)
+    listener.subscribe(CATALOG_CHANNEL, catalog.invalidate)
+    listener.subscribe(PRICING_CHANNEL, pricing.invalidate)
+    listener.subscribe(USER_CHANNEL, user_cache.invalidate)
+    dp = Dispatcher(storage=storage)
     dp.include_router(router)
-    await dp.start_polling(bot)
+    # last_seen_at: отметка в памяти на каждый апдейт, в БД — пачками (activity.py)
+    dp.update.outer_middleware(ActivityMiddleware(last_seen))
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    metrics.instrument_engine(async_engine, source="bot")
+    metrics.instrument_cache("catalog", catalog.stats)
+    metrics.instrument_cache("pricing", pricing.stats)
+    metrics.instrument_cache("users", user_cache.stats)
+    metrics.instrument_dispatcher(dp)
+    querybudget.instrument_dispatcher(dp)   # no-op при QUERY_BUDGET=off
+    # последней (внутри метрик): хендлеры получают db — одну сессию на апдейт
+    db_session.instrument_dispatcher(dp)
+    return dp
 
 
-if __name__ == '__main__':
+async def start_metrics(port_offset: int = 0):
+    # у каждого воркера webhook свой порт метрик: METRICS_PORT + номер воркера
+    return await metrics.serve("0.0.0.0", METRICS_PORT + port_offset) if METRICS_PORT else None
+
+
+async def run_polling():
+    bot = build_bot()
+    dp = build_dispatcher()
+    metrics_runner = await start_metrics()
     try:
-        asyncio.run(main())
-    except Exception as error:
-        print(error)
+        await bot.delete_webhook()      # после webhook-режима getUpdates иначе вернёт 409
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
+async def run_webhook_worker(index: int):
+    """Один процесс webhook: приём на общем порту (SO_REUSEPORT) + очередь обработки."""
+    bot = build_bot()
+    dp = build_dispatcher()
+    server = WebhookServer(
+        dp, bot,
+        secret=WEBHOOK_SECRET,
+        path=WEBHOOK_PATH,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        concurrency=WEBHOOK_CONCURRENCY,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
 
+    metrics_runner = await start_metrics(index)
+    await dp.emit_startup(bot=bot)
+    await server.start(WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1)
+    logging.info("webhook worker %d listening on %s:%d%s", index, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+def _webhook_worker_process(index: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_webhook_worker(index))
 
 
+async def set_webhook():
+    bot = build_bot()
+    try:
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=build_dispatcher().resolve_used_update_types(),
+            max_connections=min(100, 40 * WEBHOOK_WORKERS),
+        )
+    finally:
+        await bot.session.close()
+
+
+async def prepare_webhook():
+    await create_tables()
+    await set_webhook()
+    # соединения пула не должны достаться дочерним процессам после fork
+    await async_engine.dispose()
+
+
+def run_webhook():
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL and WEBHOOK_SECRET")
+    asyncio.run(prepare_webhook())
+    if WEBHOOK_WORKERS <= 1:
+        asyncio.run(run_webhook_worker(0))
+        return
+
+    workers = [
+        multiprocessing.Process(target=_webhook_worker_process, args=(i,), name=f"webhook-{i}")
+        for i in range(WEBHOOK_WORKERS)
+    ]
+    for p in workers:
+        p.start()
+
+    def forward(signum, _frame):
+        for p in workers:
+            if p.is_alive():
+                p.terminate()     # SIGTERM: воркер дообрабатывает очередь и выходит
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for p in workers:
+        p.join()
+
+
+async def main():
+    await create_tables()  # ← добавь это
+    await run_polling()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            asyncio.run(main())
+    except Exception as error:
+        print(error)
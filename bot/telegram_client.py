@@ -0,0 +1,198 @@
+# bot/telegram_client.py
+"""
+Общий клиент Telegram Bot API для отправок вне aiogram (уведомления из API и т.п.).
+
+Один httpx.AsyncClient на всё время жизни процесса (keep-alive пул, без TLS
+на каждый заказ), рассылка по получателям параллельно, но в рамках лимитов
+Telegram: глобальный token bucket + свой bucket на каждый чат.
+На 429 ждём parameters.retry_after и повторяем; на 5xx и ошибки соединения —
+повтор с backoff. Если запрос мог дойти до Telegram (таймаут чтения), не
+повторяем: sendMessage не идемпотентен.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Iterable, Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1 сообщение/с в один чат
+GLOBAL_RATE = 30.0
+PER_CHAT_RATE = 1.0
+
+
+class TokenBucket:
+    """Классический token bucket. Ожидающие обслуживаются по очереди (FIFO через лок)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TelegramClient:
+    def __init__(
+        self,
+        token: str,
+        base_url: str = "https://api.telegram.org",
+        *,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_connections: int = 20,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        max_chat_buckets: int = 10_000,
+    ):
+        self._url = f"{base_url.rstrip('/')}/bot{token}"
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self._timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global = TokenBucket(global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._chat_buckets: OrderedDict[Any, TokenBucket] = OrderedDict()
+        self._max_chat_buckets = max_chat_buckets
+        self._max_retries = max_retries
+        self._paused_until = 0.0
+
+        # статистика
+        self.sent = 0
+        self.failed = 0
+        self.retries_429 = 0
+        self._latencies: deque[float] = deque(maxlen=2048)
+        self._first_send: Optional[float] = None
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ---------- limits ----------
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._per_chat_rate)
+            if len(self._chat_buckets) > self._max_chat_buckets:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _wait_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # ---------- calls ----------
+    async def call(self, method: str, payload: dict, *, chat_id=None) -> dict:
+        """
+        Вызов метода Bot API. Всегда возвращает ответ Telegram как dict
+        ({"ok": true, ...} или {"ok": false, "error_code": ..., "description": ...}).
+        """
+        await self.start()
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+
+        attempt = 0
+        while True:
+            await self._wait_pause()
+            await self._global.acquire()
+            started = time.monotonic()
+            if self._first_send is None:
+                self._first_send = started
+            try:
+                resp = await self._client.post(f"{self._url}/{method}", json=payload)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+                # запрос до Telegram не дошёл — повтор безопасен
+                if attempt < self._max_retries:
+                    attempt += 1
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                return self._failed(method, exc)
+            except httpx.HTTPError as exc:
+                # запрос мог дойти (ReadTimeout и т.п.): повтор sendMessage — дубль у получателя
+                return self._failed(method, exc)
+            if resp.status_code >= 500 and attempt < self._max_retries:
+                attempt += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            try:
+                data = resp.json()
+            except ValueError as exc:
+                return self._failed(method, exc)
+            self._latencies.append(time.monotonic() - started)
+
+            if data.get("ok"):
+                self.sent += 1
+                return data
+
+            if data.get("error_code") == 429 and attempt < self._max_retries:
+                attempt += 1
+                self.retries_429 += 1
+                retry_after = float((data.get("parameters") or {}).get("retry_after", 1))
+                # флуд-лимит общий для бота — притормаживаем все отправки
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                continue
+
+            self.failed += 1
+            log.warning("telegram %s error: %s", method, data.get("description"))
+            return data
+
+    def _failed(self, method: str, exc: Exception) -> dict:
+        self.failed += 1
+        log.warning("telegram %s failed: %s", method, exc)
+        return {"ok": False, "error_code": None, "description": str(exc)}
+
+    async def send_message(self, chat_id, text: str, **kwargs) -> dict:
+        return await self.call("sendMessage", {"chat_id": chat_id, "text": text, **kwargs}, chat_id=chat_id)
+
+    async def send_to_many(self, chat_ids: Iterable, text: str, **kwargs) -> list[dict]:
+        """Одно сообщение нескольким получателям параллельно (в рамках лимитов)."""
+        return await asyncio.gather(*(self.send_message(cid, text, **kwargs) for cid in chat_ids))
+
+    def stats(self) -> dict:
+        lat = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not lat:
+                return None
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2)
+
+        elapsed = time.monotonic() - self._first_send if self._first_send else 0.0
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries_429": self.retries_429,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_p99": pct(0.99),
+            "throughput_per_s": round(self.sent / elapsed, 2) if elapsed > 0 else None,
+        }
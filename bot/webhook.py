@@ -0,0 +1,146 @@
+# bot/webhook.py
+"""
+Webhook-режим бота на aiohttp.
+
+Приём и обработка разделены: POST от Telegram проверяется (секретный токен
+X-Telegram-Bot-Api-Secret-Token), отсеивается по update_id (повторы после
+потерянного ответа) и кладётся в ограниченную очередь — ответ 200 сразу.
+Апдейты из очереди разбирают WEBHOOK_CONCURRENCY задач. Очередь полна —
+503, Telegram повторит доставку позже: память не растёт под всплеском.
+
+Несколько процессов-воркеров слушают один порт (SO_REUSEPORT), ядро раздаёт
+им соединения. setWebhook делает только родительский процесс.
+Дедупликация — в пределах процесса: повтор, попавший на другой воркер,
+обработается второй раз (Telegram повторяет только неподтверждённые апдейты).
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import orjson
+from aiohttp import web
+
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WEBHOOK_UPDATES = registry.counter(
+    "bot_webhook_updates_total", "Апдейты webhook по результату приёма", ("result",))
+WEBHOOK_QUEUE = registry.gauge("bot_webhook_queue_depth", "Апдейты в очереди на обработку")
+
+
+class UpdateDeduplicator:
+    """Последние maxsize update_id (LRU): повторная доставка того же апдейта отбрасывается."""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._seen: OrderedDict[int, None] = OrderedDict()
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._seen
+
+    def add(self, update_id: int) -> None:
+        self._seen[update_id] = None
+        self._seen.move_to_end(update_id)
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        dp,
+        bot,
+        *,
+        secret: str,
+        path: str = "/webhook",
+        queue_size: int = 1000,
+        concurrency: int = 50,
+        dedup_size: int = 10_000,
+    ):
+        if not secret:
+            raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret.encode()
+        self.path = path
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=queue_size)
+        self.seen = UpdateDeduplicator(dedup_size)
+        self._workers: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    # ---- приём ----
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "").encode()
+        if not hmac.compare_digest(token, self.secret):
+            WEBHOOK_UPDATES.inc(result="unauthorized")
+            return web.Response(status=401)
+        try:
+            update = orjson.loads(await request.read())
+            update_id = int(update["update_id"])
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            WEBHOOK_UPDATES.inc(result="invalid")
+            return web.Response(status=400)
+
+        if update_id in self.seen:
+            WEBHOOK_UPDATES.inc(result="duplicate")
+            return web.Response()
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # не помечаем как увиденный: Telegram пришлёт его снова
+            WEBHOOK_UPDATES.inc(result="overflow")
+            return web.Response(status=503)
+        self.seen.add(update_id)
+        WEBHOOK_UPDATES.inc(result="accepted")
+        WEBHOOK_QUEUE.set(self.queue.qsize())
+        return web.Response()
+
+    # ---- обработка ----
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception:
+                log.exception("update %s failed", update.get("update_id"))
+            finally:
+                self.queue.task_done()
+                WEBHOOK_QUEUE.set(self.queue.qsize())
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host: str, port: int, *, reuse_port: bool = False) -> int:
+        """Запустить сервер и обработчики в текущем loop; возвращает фактический порт."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, reuse_port=reuse_port or None)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Перестать принимать, дообработать очередь (не дольше drain_timeout), остановить обработчики."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("webhook stop: %d updates left unprocessed", self.queue.qsize())
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
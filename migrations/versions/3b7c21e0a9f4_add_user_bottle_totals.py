@@ -0,0 +1,45 @@
+"""add user_bottle_totals
+
+Revision ID: 3b7c21e0a9f4
+Revises: ecf1076c56aa
+Create Date: 2026-10-17 12:05:41.218339
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7c21e0a9f4'
+down_revision: Union[str, Sequence[str], None] = 'ecf1076c56aa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_bottle_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('paid_bottles', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # backfill из уже оплаченных заказов
+    op.execute(
+        """
+        INSERT INTO user_bottle_totals (user_id, paid_bottles, updated_at)
+        SELECT o.user_id, COALESCE(SUM(oi.quantity), 0), now()
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.is_paid AND o.user_id IS NOT NULL
+        GROUP BY o.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_bottle_totals')
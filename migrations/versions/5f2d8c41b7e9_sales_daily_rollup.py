@@ -0,0 +1,65 @@
+"""sales daily rollup
+
+Revision ID: 5f2d8c41b7e9
+Revises: 77514e289dcf
+Create Date: 2026-10-18 01:27:44.208615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2d8c41b7e9'
+down_revision: Union[str, Sequence[str], None] = '77514e289dcf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ORDER_STATUS = postgresql.ENUM('processing', 'in_transit', 'declined', 'completed', name='order_status', create_type=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # orders.status есть в модели, но ни одна ревизия его не создавала — добавить, если нет
+    bind = op.get_bind()
+    ORDER_STATUS.create(bind, checkfirst=True)
+    if 'status' not in {c['name'] for c in sa.inspect(bind).get_columns('orders')}:
+        op.add_column('orders', sa.Column('status', ORDER_STATUS, server_default='processing', nullable=False))
+
+    op.create_table('sales_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('status', ORDER_STATUS, nullable=False),
+    sa.Column('is_paid', sa.Boolean(), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('bottles', sa.Integer(), nullable=False),
+    sa.Column('revenue_cents', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'product_id', 'status', 'is_paid')
+    )
+    # backfill: заказы целиком (product_id = 0) и по товарам
+    op.execute("""
+        INSERT INTO sales_daily (day, product_id, status, is_paid, orders, bottles, revenue_cents)
+        SELECT o.date::date, 0, o.status, o.is_paid, count(*),
+               coalesce(sum(b.bottles), 0), sum(o.total_price_cents)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, sum(quantity) AS bottles FROM order_items GROUP BY order_id
+        ) b ON b.order_id = o.id
+        GROUP BY 1, 3, 4
+    """)
+    op.execute("""
+        INSERT INTO sales_daily (day, product_id, status, is_paid, orders, bottles, revenue_cents)
+        SELECT o.date::date, i.product_id, o.status, o.is_paid, count(DISTINCT o.id),
+               sum(i.quantity), sum(i.line_total_cents)
+        FROM orders o
+        JOIN order_items i ON i.order_id = o.id
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sales_daily')
@@ -0,0 +1,28 @@
+"""users last_seen_at
+
+Revision ID: 77514e289dcf
+Revises: a41f0c6e2b87
+Create Date: 2026-10-18 00:41:09.552310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '77514e289dcf'
+down_revision: Union[str, Sequence[str], None] = 'a41f0c6e2b87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'last_seen_at')
@@ -0,0 +1,32 @@
+"""orders trigram search indexes
+
+Revision ID: 7c4e9a12d5b3
+Revises: 3b7c21e0a9f4
+Create Date: 2026-10-17 21:58:12.604117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e9a12d5b3'
+down_revision: Union[str, Sequence[str], None] = '3b7c21e0a9f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_orders_address_trgm', 'orders', ['address'], unique=False, postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'})
+    op.create_index('ix_orders_phone_trgm', 'orders', ['phone'], unique=False, postgresql_using='gin', postgresql_ops={'phone': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_phone_trgm', table_name='orders', postgresql_using='gin', postgresql_ops={'phone': 'gin_trgm_ops'})
+    op.drop_index('ix_orders_address_trgm', table_name='orders', postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'})
+    # расширение pg_trgm не удаляем: им могут пользоваться и другие объекты
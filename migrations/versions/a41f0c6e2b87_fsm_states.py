@@ -0,0 +1,36 @@
+"""fsm states
+
+Revision ID: a41f0c6e2b87
+Revises: 7c4e9a12d5b3
+Create Date: 2026-10-17 23:14:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41f0c6e2b87'
+down_revision: Union[str, Sequence[str], None] = '7c4e9a12d5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fsm_states',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=True),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_fsm_states_updated_at'), 'fsm_states', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_fsm_states_updated_at'), table_name='fsm_states')
+    op.drop_table('fsm_states')
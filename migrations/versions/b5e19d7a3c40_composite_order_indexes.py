@@ -0,0 +1,47 @@
+"""composite order indexes
+
+Revision ID: b5e19d7a3c40
+Revises: e4a7b90c2d61
+Create Date: 2026-10-18 13:26:05.118902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e19d7a3c40'
+down_revision: Union[str, Sequence[str], None] = 'e4a7b90c2d61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY — без блокировки записи в orders/users на время построения;
+    # внутри транзакции так нельзя, поэтому при падении часть индексов уже есть —
+    # IF [NOT] EXISTS позволяет просто запустить миграцию снова. Индекс, построение
+    # которого упало, остаётся INVALID: его сначала удалить (DROP INDEX CONCURRENTLY).
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_telegram_id_date', 'orders', ['telegram_id', 'date', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_orders_status_date', 'orders', ['status', 'date', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_orders_date_id', 'orders', ['date', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_orders_user_id'), 'orders', ['user_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # покрыты составными индексами выше (первые колонки)
+        op.drop_index('ix_orders_telegram_id', table_name='orders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_orders_date', table_name='orders', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_date', 'orders', ['date'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_orders_telegram_id', 'orders', ['telegram_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_users_created_at_id', table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_orders_user_id'), table_name='orders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_orders_date_id', table_name='orders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_orders_status_date', table_name='orders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_orders_telegram_id_date', table_name='orders', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,47 @@
+"""broadcasts
+
+Revision ID: c83e5a9d0f17
+Revises: 5f2d8c41b7e9
+Create Date: 2026-10-18 02:41:09.573120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c83e5a9d0f17'
+down_revision: Union[str, Sequence[str], None] = '5f2d8c41b7e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('broadcasts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.Column('status', sa.Enum('running', 'done', 'cancelled', name='broadcast_status'), nullable=False),
+    sa.Column('created_by', sa.BigInteger(), nullable=False),
+    sa.Column('progress_chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('progress_message_id', sa.Integer(), nullable=True),
+    sa.Column('cursor_user_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('sent', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('blocked', sa.Integer(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('users', sa.Column('blocked_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'blocked_at')
+    op.drop_table('broadcasts')
+    sa.Enum(name='broadcast_status').drop(op.get_bind())
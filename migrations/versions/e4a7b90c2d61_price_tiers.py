@@ -0,0 +1,41 @@
+"""price tiers
+
+Revision ID: e4a7b90c2d61
+Revises: c83e5a9d0f17
+Create Date: 2026-10-18 09:12:47.305518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7b90c2d61'
+down_revision: Union[str, Sequence[str], None] = 'c83e5a9d0f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    price_tiers = op.create_table('price_tiers',
+    sa.Column('min_bottles', sa.Integer(), nullable=False),
+    sa.Column('price_cents', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('min_bottles')
+    )
+    # уровни, которые до этого были зашиты в api/orders/routes.py (PRICING_TIERS)
+    op.bulk_insert(price_tiers, [
+        {'min_bottles': 1, 'price_cents': 250},
+        {'min_bottles': 20, 'price_cents': 250},
+        {'min_bottles': 100, 'price_cents': 240},
+        {'min_bottles': 500, 'price_cents': 220},
+        {'min_bottles': 1000, 'price_cents': 200},
+        {'min_bottles': 2000, 'price_cents': 180},
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('price_tiers')